@@ -19,6 +19,10 @@ class AlignSettings:
     log_level: Optional[str] = "INFO"
     trace_plot_width: Optional[float] = 1.0
     default_region_around_peak: List[int] = field(default_factory=lambda: [-500, 500])
+    # processes running the filters and triggers of the batch processing
+    batch_workers: Optional[int] = 1
+    # draw the plots with OpenGL (needs PyOpenGL), applied on start up
+    use_opengl: Optional[bool] = False
 
     def save(self) -> None:
         """Stores settings to settings file in the data directory"""
@@ -10,6 +10,9 @@ from typing_extensions import Self
 
 from align.tracelib.traces import TraceData
 
+# reduce_data_from_mask copies the kept traces in blocks of about this size
+REDUCE_BLOCK_BYTES = 64 * 1024 * 1024
+
 
 class TraceDataFileType(Enum):
     """Enum class for the supported data type"""
@@ -153,6 +156,19 @@ class AlignTraceData(ABC):
             number of traces in the data file of the AlignTraceData
         """
 
+    @abstractmethod
+    def get_source(self) -> str | dict | None:
+        """Returns what this AlignTraceData was opened from, which can be passed to
+        AlignTraceDataFactory.open_trace_data to open the same traces again
+        (e.g. in another process)
+
+        Returns
+        -------
+        str, dict, None
+            the .meta file of a D15TraceData, the dict with the npy files of a
+            NumpyArrays or None if it wasn't opened from files
+        """
+
     @abstractmethod
     def set_number_of_traces(self, number_of_traces: int) -> None:
         """Set a new number of traces of the AlignTraceData.
@@ -258,6 +274,19 @@ class AlignTraceData(ABC):
             the trace to be added to the trace_type trace data file
         """
 
+    @abstractmethod
+    def add_traces(self, trace_type: str, traces_data: np.ndarray) -> None:
+        """Adds several traces at once to a registered trace data file,
+        like calling add_trace for each row of traces_data
+
+        Parameters
+        ----------
+        trace_type : str
+            type of trace to which the data shall be added
+        traces_data : np.ndarray
+            two dimensional array with one trace per row
+        """
+
     @abstractmethod
     def finish(self) -> None:
         """finishs the editing on this AlignTraceData
@@ -385,6 +414,9 @@ class D15TraceData(AlignTraceData):
 
         return self.trace_data.getNrTraces()
 
+    def get_source(self) -> str | None:
+        return self.meta_file
+
     def set_number_of_traces(self, number_of_traces: int) -> None:
         self.trace_data.setNrTraces(number_of_traces)
 
@@ -486,9 +518,13 @@ class D15TraceData(AlignTraceData):
         else:
             trace_data_object = self.trace_data.aux[trace_type]
 
-        for iTrace in range(trace_mask.shape[0]):
-            if trace_mask[iTrace]:
-                trace_data_object._addTraceRaw(input_data[iTrace].tobytes())
+        # gather the kept traces block-wise and write each block at once
+        indexes = np.flatnonzero(trace_mask)
+        block_size = max(1, REDUCE_BLOCK_BYTES // max(1, input_data[0].nbytes))
+        for start in range(0, len(indexes), block_size):
+            trace_data_object.addTracesBatch(
+                input_data[indexes[start : start + block_size]]
+            )
 
     def register_data_file(
         self,
@@ -526,6 +562,21 @@ class D15TraceData(AlignTraceData):
         else:
             self.trace_data.aux[trace_type].addTrace(trace_data)
 
+    def add_traces(self, trace_type: str, traces_data: np.ndarray) -> None:
+        if self.trace_data is None:
+            return None
+
+        if trace_type == "em":
+            self.trace_data.em.addTracesBatch(traces_data)
+        elif trace_type == "power":
+            self.trace_data.power.addTracesBatch(traces_data)
+        elif trace_type == "plain":
+            self.trace_data.plain.addTracesBatch(traces_data)
+        elif trace_type == "cipher":
+            self.trace_data.cipher.addTracesBatch(traces_data)
+        else:
+            self.trace_data.aux[trace_type].addTracesBatch(traces_data)
+
     def finish(self) -> None:
         self.trace_data.finishRecord()
 
@@ -545,7 +596,8 @@ class NumpyArrays(AlignTraceData):
         self.logger.setLevel(logging.INFO)
 
         self._npy_mm = dict()
-        self._records_written = 0
+        # number of traces added by add_trace(s), per trace type
+        self._records_written = dict()
         last_file_name = None
         self.path = None
         self.number_of_traces = 0
@@ -615,6 +667,9 @@ class NumpyArrays(AlignTraceData):
     def get_number_of_traces(self) -> int:
         return self.number_of_traces
 
+    def get_source(self) -> dict | None:
+        return dict(self.trace_data_files_dict) or None
+
     def set_number_of_traces(self, number_of_traces: int) -> None:
         self.number_of_traces = number_of_traces
 
@@ -659,15 +714,31 @@ class NumpyArrays(AlignTraceData):
         # self.npy_mm[trace_data_name] = np.memmap(data_file_name, dtype=dtype, mode='w+', shape=(self.number_of_traces, length))
 
     def add_trace(self, trace_type: str, trace_data: np.ndarray) -> None:
-        if self._records_written >= self.number_of_traces:
+        records_written = self._records_written.get(trace_type, 0)
+        if records_written >= self.number_of_traces:
             self.logger.warning(
                 "Already wrote %s records to array with size %s. Can't write more traces into array! Ignoring trace.",
-                self._records_written,
+                records_written,
                 self.number_of_traces,
             )
             return
-        self._npy_mm[trace_type][self._records_written] = trace_data
-        self._records_written += 1
+        self._npy_mm[trace_type][records_written] = trace_data
+        self._records_written[trace_type] = records_written + 1
+
+    def add_traces(self, trace_type: str, traces_data: np.ndarray) -> None:
+        records_written = self._records_written.get(trace_type, 0)
+        free = self.number_of_traces - records_written
+        if len(traces_data) > free:
+            self.logger.warning(
+                "Already wrote %s records to array with size %s. Can't write more traces into array! Ignoring %s traces.",
+                records_written,
+                self.number_of_traces,
+                len(traces_data) - max(free, 0),
+            )
+            traces_data = traces_data[: max(free, 0)]
+        end = records_written + len(traces_data)
+        self._npy_mm[trace_type][records_written:end] = traces_data
+        self._records_written[trace_type] = end
 
     def finish(self) -> None:
         if self.has_em():
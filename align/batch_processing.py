@@ -1,6 +1,8 @@
 import datetime
 import logging
+import multiprocessing
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from os import devnull, path
 from typing import Optional
 
@@ -8,10 +10,22 @@ import numpy as np
 from PySide6.QtCore import QThread, QObject, Signal as pyqtSignal
 from tqdm import tqdm
 
-from align.align_trace_data import AlignTraceData, TraceDataFileType
+from align.align_trace_data import (
+    AlignTraceData,
+    AlignTraceDataFactory,
+    TraceDataFileType,
+)
 from align.filter.filter import FilterLoader
 from align.trigger.trigger import TriggerLoader
 
+# size of the blocks of traces passed to Trigger.process_batch
+TRIGGER_BLOCK_BYTES = 64 * 1024 * 1024
+# size of the blocks of cut traces added to the new trace data at once
+CUT_BLOCK_BYTES = 64 * 1024 * 1024
+# number of chunks of traces per worker process, so that the progress is updated
+# and stopping takes effect while the workers search the peaks
+CHUNKS_PER_WORKER = 8
+
 
 class BatchProcessingThread(QThread):
     """Class that processes all selected filter and trigger on the original TraceData
@@ -32,6 +46,7 @@ class BatchProcessingThread(QThread):
         region_around_peak: list,
         trace_type: str,
         trace_count: int = None,
+        workers: int = 1,
     ):
         """Init a new BatchProcessingThread
 
@@ -56,6 +71,10 @@ class BatchProcessingThread(QThread):
         trace_count : int, optional
             If not defined all traces will be processed. Otherwise the first 'trace_count'
             traces will be processed
+        workers : int, optional
+            Number of processes which run the filters and triggers on the traces, if
+            there are filters (triggers alone search blocks of traces at once).
+            With 1 (default) the traces are processed in this thread
         """
         super(BatchProcessingThread, self).__init__(parent)
 
@@ -73,7 +92,12 @@ class BatchProcessingThread(QThread):
         self.trace_data = align_trace_data
         self.filter_dict = filter_dict
         self.trigger_dict = trigger_dict
+        # filters and triggers are created once, the loops over the traces call the
+        # stored (bound) process_data methods
+        self._prepared_filters = self._prepare_filters()
+        self._prepared_triggers = self._prepare_triggers()
         self.region_around_peak = region_around_peak
+        self.workers = workers
         if trace_count is None:
             self.trace_count = align_trace_data.get_number_of_traces()
         else:
@@ -93,10 +117,24 @@ class BatchProcessingThread(QThread):
             self._is_running = True
 
         # filter loop for finding cutout region
-        for tracenr in t:
-            if self._is_running:
-                self.run_filters_and_triggers(tracenr)
-                self.progress_signal.emit(t.format_dict)
+        if self.trigger_dict and not self.filter_dict:
+            # only triggers: search the traces block-wise with Trigger.process_batch
+            traces = self.trace_data.get_traces(self.tracetype)
+            trace_bytes = max(1, traces.shape[1] * traces.dtype.itemsize)
+            block_size = max(1, TRIGGER_BLOCK_BYTES // trace_bytes)
+            for start in range(0, self.trace_count, block_size):
+                if self._is_running:
+                    end = min(start + block_size, self.trace_count)
+                    self.run_triggers_on_block(traces[start:end], start)
+                    t.update(end - start)
+                    self.progress_signal.emit(t.format_dict)
+        elif self.workers > 1 and self.trace_data.get_source() is not None:
+            self._run_filters_and_triggers_parallel(t)
+        else:
+            for tracenr in t:
+                if self._is_running:
+                    self.run_filters_and_triggers(tracenr)
+                    self.progress_signal.emit(t.format_dict)
 
         self.logger.info("Valid traces: {}".format(np.sum(self.valid_traces_array)))
 
@@ -146,13 +184,23 @@ class BatchProcessingThread(QThread):
             # reset tqdm for cutting loop
             t = tqdm(range(self.trace_count), file=open(devnull, "w"))
 
-            # cut loop
+            # cut loop, the cut traces are added block-wise
             new_trace_count = 0
-            for tracenr in t:
+            itemsize = max(
+                (
+                    self.trace_data.get_traces(trace_type).dtype.itemsize
+                    for trace_type in self._cut_trace_types()
+                ),
+                default=1,
+            )
+            block_size = max(1, CUT_BLOCK_BYTES // max(1, new_trace_length * itemsize))
+            for start in range(0, self.trace_count, block_size):
                 if self._is_running is True:
-                    new_trace_count += self.cut_and_modify_traces(
-                        tracenr, new_trace_length
+                    end = min(start + block_size, self.trace_count)
+                    new_trace_count += self.cut_and_modify_block(
+                        start, end, new_trace_length
                     )
+                    t.update(end - start)
                     self.progress_signal.emit(t.format_dict)
 
             if new_trace_count != number_of_valid_traces:
@@ -184,29 +232,7 @@ class BatchProcessingThread(QThread):
             xmarks = self._run_triggers(temp_trace_data, current_offset)
 
         if xmarks is not None:
-            if len(xmarks) == 1 and xmarks[0] is not None:
-                peak_at = xmarks[0]
-                # check whether the region exceeds the length of the trace
-                if ((peak_at + self.region_around_peak[1]) > temp_trace_data.size) or (
-                    (peak_at + self.region_around_peak[0]) < 0
-                ):
-                    self.valid_traces_array[tracenr] = False
-                else:
-                    self.valid_traces_array[tracenr] = True
-                    self.peak_array[tracenr] = peak_at
-            elif len(xmarks) == 2 and xmarks[0] is not None and xmarks[1] is not None:
-                # check whether the region exceeds the length of the trace
-                if (
-                    (xmarks[1] + self.region_around_peak[1]) > temp_trace_data.size
-                ) or ((xmarks[0] + self.region_around_peak[0]) < 0):
-                    self.valid_traces_array[tracenr] = False
-                else:
-                    self.valid_traces_array[tracenr] = True
-                    self.peak_array[tracenr] = xmarks
-            else:
-                # no peaks were found
-                self.valid_traces_array[tracenr] = False
-
+            self._store_xmarks(tracenr, xmarks, temp_trace_data.size)
         elif modify_data:
             # There are no xmarks, so set marks to whole trace length.
             self.valid_traces_array[tracenr] = True
@@ -218,15 +244,120 @@ class BatchProcessingThread(QThread):
             # neither xmark nor modifying filter
             self.valid_traces_array[tracenr] = False
 
-    def _run_triggers(self, temp_trace_data, current_offset):
-        xmarks = None
+    def _run_filters_and_triggers_parallel(self, t: tqdm):
+        """Like calling run_filters_and_triggers for all traces, but the chunks of
+        traces are processed by self.workers processes, which open the trace data
+        themselves. Their peaks are stored here as soon as a chunk is finished.
+        """
+        chunk_size = max(1, -(-self.trace_count // (self.workers * CHUNKS_PER_WORKER)))
+        detector_args = (
+            self.trace_data.get_source(),
+            self.filter_dict,
+            self.trigger_dict,
+            self.region_around_peak,
+            self.tracetype,
+            self.trace_count,
+        )
+        # spawn: forking this (multi-threaded) process is not safe
+        with ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_detector,
+            initargs=detector_args,
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _detect_chunk, start, min(start + chunk_size, self.trace_count)
+                )
+                for start in range(0, self.trace_count, chunk_size)
+            ]
+            for future in as_completed(futures):
+                if not self._is_running:
+                    executor.shutdown(cancel_futures=True)
+                    break
+                start, valid_traces, peaks, region_around_peak = future.result()
+                end = start + len(valid_traces)
+                self.valid_traces_array[start:end] = valid_traces
+                self.peak_array[start:end] = peaks
+                # a modifying filter without triggers sets the region to the whole trace
+                self.region_around_peak[:] = region_around_peak
+                t.update(end - start)
+                self.progress_signal.emit(t.format_dict)
+
+    def run_triggers_on_block(self, traces: np.ndarray, first_tracenr: int):
+        """Run the triggers on a block of consecutive traces and fill the
+        self.valid_traces_array. Used instead of run_filters_and_triggers if
+        there are no filters, which have to be run trace by trace.
+        """
+        self.logger.debug(
+            f"Run triggers on trace nr.: {first_tracenr} - {first_tracenr + len(traces) - 1}"
+        )
+        traces = np.asarray(traces)
+        for row, xmarks in enumerate(self._run_triggers_batch(traces)):
+            if xmarks is None:
+                self.valid_traces_array[first_tracenr + row] = False
+            else:
+                self._store_xmarks(first_tracenr + row, xmarks, traces.shape[1])
+
+    def _store_xmarks(self, tracenr: int, xmarks: list, trace_length: int):
+        """Marks the trace as valid and stores its peaks if the triggers found one peak
+        or two peaks and the region around them lies within the trace
+        """
+        if len(xmarks) == 1 and xmarks[0] is not None:
+            peak_at = xmarks[0]
+            # check whether the region exceeds the length of the trace
+            if ((peak_at + self.region_around_peak[1]) > trace_length) or (
+                (peak_at + self.region_around_peak[0]) < 0
+            ):
+                self.valid_traces_array[tracenr] = False
+            else:
+                self.valid_traces_array[tracenr] = True
+                self.peak_array[tracenr] = peak_at
+        elif len(xmarks) == 2 and xmarks[0] is not None and xmarks[1] is not None:
+            # check whether the region exceeds the length of the trace
+            if ((xmarks[1] + self.region_around_peak[1]) > trace_length) or (
+                (xmarks[0] + self.region_around_peak[0]) < 0
+            ):
+                self.valid_traces_array[tracenr] = False
+            else:
+                self.valid_traces_array[tracenr] = True
+                self.peak_array[tracenr] = xmarks
+        else:
+            # no peaks were found
+            self.valid_traces_array[tracenr] = False
+
+    def _prepare_triggers(self) -> list:
+        """Creates the triggers and parses their parameters once for all traces
+
+        Returns
+        -------
+        list
+            list of (bound process_data method, bound process_batch method, parameters)
+            tuples in the order of the trigger_dict
+        """
+        prepared_triggers = []
         for trigger_name, trigger_parameter in self.trigger_dict.items():
-            # get data trigger
             trigger = self._triggers.get_trigger_by_name(trigger_name)
+            parameter = dict(trigger_parameter[1])
+            if trigger is None:
+                prepared_triggers.append((None, None, parameter))
+                continue
+            try:
+                parameter = trigger.parse_params(parameter)
+            except KeyError:
+                # keep the dictionary, process_data reports the error for each trace
+                pass
+            prepared_triggers.append(
+                (trigger.process_data, trigger.process_batch, parameter)
+            )
+        return prepared_triggers
 
+    def _run_triggers(self, temp_trace_data, current_offset):
+        xmarks = None
+        for process_data, _, trigger_parameter in self._prepared_triggers:
             try:
-                trigger_result = trigger.process_data(
-                    temp_trace_data, current_offset, dict(trigger_parameter[1])
+                trigger_result = process_data(
+                    temp_trace_data, current_offset, trigger_parameter
                 )
                 # be sure the trigger_result contains 'xmarks' key
                 xmarks = trigger_result["xmarks"]
@@ -243,33 +374,84 @@ class BatchProcessingThread(QThread):
             current_offset = trigger_result["xmarks"][0]
         return xmarks
 
-    def _run_filters(self, temp_trace_data):
-        modify_data = None
+    def _run_triggers_batch(self, traces: np.ndarray) -> list:
+        # same cascade as _run_triggers, each trigger searches all rows which are
+        # still active behind the offset the previous trigger returned for that row
+        xmarks = [None] * len(traces)
+        offsets = np.zeros(len(traces), dtype=int)
+        active = np.arange(len(traces))
+        for _, process_batch, trigger_parameter in self._prepared_triggers:
+            try:
+                trigger_results = process_batch(
+                    traces[active], offsets[active], trigger_parameter
+                )
+            except KeyError as err:
+                self.logger.error("Skipping trigger result: %s", err)
+                break
+
+            still_active = []
+            for row, trigger_result in zip(active, trigger_results):
+                try:
+                    xmarks[row] = trigger_result["xmarks"]
+                except KeyError as err:
+                    self.logger.error("Skipping trigger result: %s", err)
+                    continue
+                # a trigger without result (or ThresholdTrigger's [None, None])
+                # gives no offset for the next trigger
+                if xmarks[row] == [] or xmarks[row][0] is None:
+                    continue
+                offsets[row] = xmarks[row][0]
+                still_active.append(row)
+            active = np.array(still_active, dtype=int)
+            if active.size == 0:
+                break
+        return xmarks
+
+    def _prepare_filters(self) -> list:
+        """Creates the filters and copies their parameters once for all traces
+
+        Returns
+        -------
+        list
+            list of (filter name, bound process_data method, parameters, modify_data)
+            tuples in the order of the filter_dict. modify_data is None if the filter
+            has no "modify_data" parameter
+        """
+        prepared_filters = []
+        if not self.filter_dict:
+            return prepared_filters
         for filter_name, filter_parameter in self.filter_dict.items():
-            # get data filter
             data_filter = self._filters.get_filter_by_name(filter_name)
+            process_data = data_filter.process_data if data_filter else None
+            filter_settings = dict(filter_parameter[1])
+            modify_data = None
+            if "modify_data" in filter_settings:
+                modify_data = bool(filter_settings["modify_data"][0])
+            prepared_filters.append(
+                (filter_name, process_data, filter_settings, modify_data)
+            )
+        return prepared_filters
 
+    def _run_filters(self, temp_trace_data):
+        modify_data = None
+        for filter_name, process_data, filter_settings, filter_modify_data in (
+            self._prepared_filters
+        ):
             # Check for "modify_data" key in filter parameter.
             # If modifying filter sets 'modify_data' to true, the preprocessing for xmarks search will be skipped.
-            filter_settings = filter_parameter[1]
-
-            if "modify_data" in filter_settings:
+            if filter_modify_data is not None:
                 self.logger.debug("filter '%s' has set modify_data flag.", filter_name)
-                modify_data = bool(filter_parameter[1]["modify_data"][0])
+                modify_data = filter_modify_data
                 if modify_data:
                     # skip filter
                     filter_result = dict(data=temp_trace_data, xmarks=None)
 
                 else:
-                    filter_result = data_filter.process_data(
-                        temp_trace_data, dict(filter_parameter[1])
-                    )
+                    filter_result = process_data(temp_trace_data, filter_settings)
 
             else:
                 # process data filter
-                filter_result = data_filter.process_data(
-                    temp_trace_data, dict(filter_parameter[1])
-                )
+                filter_result = process_data(temp_trace_data, filter_settings)
 
             # be sure the filter_result contains 'data' key
             try:
@@ -299,31 +481,73 @@ class BatchProcessingThread(QThread):
         """
         if not self.valid_traces_array[tracenr]:
             return 0
-        start = int(self.peak_array[tracenr, 0] + self.region_around_peak[0])
-        end = int(start + trace_length)
+        for trace_type in self._cut_trace_types():
+            self.new_trace_data.add_trace(
+                trace_type, self._cut_and_modify_trace(trace_type, tracenr, trace_length)
+            )
+        return 1
 
+    def cut_and_modify_block(
+        self, first_tracenr: int, end_tracenr: int, trace_length: int
+    ) -> int:
+        """cut out region around peak at the traces first_tracenr to end_tracenr - 1
+        like cut_and_modify_traces, but add the cutted traces of each type at once
+
+        Parameters
+        ----------
+        first_tracenr : int
+            first trace number to process
+        end_tracenr : int
+            trace number behind the last trace to process
+        trace_length : int
+            The new length which the cutted traces shall have.
+
+        Returns
+        -------
+        int
+            Returns the number of processed (valid) traces
+        """
+        tracenrs = (
+            np.flatnonzero(self.valid_traces_array[first_tracenr:end_tracenr])
+            + first_tracenr
+        )
+        if len(tracenrs) == 0:
+            return 0
+        for trace_type in self._cut_trace_types():
+            block = np.empty(
+                (len(tracenrs), trace_length),
+                dtype=self.trace_data.get_traces(trace_type).dtype,
+            )
+            for row, tracenr in enumerate(tracenrs):
+                block[row] = self._cut_and_modify_trace(
+                    trace_type, int(tracenr), trace_length
+                )
+            self.new_trace_data.add_traces(trace_type, block)
+        return len(tracenrs)
+
+    def _cut_trace_types(self) -> list:
         # Only cut/modify em and power traces
         trace_types = []
         if self.trace_data.has_power():
             trace_types.append("power")
         if self.trace_data.has_em():
             trace_types.append("em")
+        return trace_types
 
-        for trace_type in trace_types:
-            cutted_trace = self.trace_data.get_trace(trace_type, tracenr)[start:end]
-            if len(cutted_trace) < trace_length:
-                # get a copy, before we can resize (sometimes "end" is beyond the end of the trace)
-                cutted_trace = self.trace_data.get_trace(trace_type, tracenr)[
-                    start:end
-                ].copy()
-                np.ndarray.resize(cutted_trace, trace_length)
-            dtype = self.trace_data.get_traces(trace_type).dtype
-            filtered_data = np.array(
-                self._run_modifying_filter(cutted_trace), dtype=dtype
-            )
-            self.new_trace_data.add_trace(trace_type, filtered_data)
-
-        return 1
+    def _cut_and_modify_trace(
+        self, trace_type: str, tracenr: int, trace_length: int
+    ) -> np.ndarray:
+        start = int(self.peak_array[tracenr, 0] + self.region_around_peak[0])
+        end = int(start + trace_length)
+        cutted_trace = self.trace_data.get_trace(trace_type, tracenr)[start:end]
+        if len(cutted_trace) < trace_length:
+            # get a copy, before we can resize (sometimes "end" is beyond the end of the trace)
+            cutted_trace = self.trace_data.get_trace(trace_type, tracenr)[
+                start:end
+            ].copy()
+            np.ndarray.resize(cutted_trace, trace_length)
+        dtype = self.trace_data.get_traces(trace_type).dtype
+        return np.array(self._run_modifying_filter(cutted_trace), dtype=dtype)
 
     def _run_modifying_filter(self, trace_data: np.ndarray) -> np.ndarray:
         """Run all filters which have the key "modify_data" enabled and process them on the trace_data.
@@ -344,21 +568,12 @@ class BatchProcessingThread(QThread):
         if self.filter_dict is None:
             return trace_data
 
-        for filter_name, filter_parameter in self.filter_dict.items():
-            # get data filter
-            filter_to_use = self._filters.get_filter_by_name(filter_name)
-
-            # check for "modify_data" key in filter parameter
+        for _, process_data, filter_settings, modify_data in self._prepared_filters:
             # If Modifying filter parameter 'modify_data' is true, it will be run now.
-            filter_settings = filter_parameter[1]
-            if "modify_data" in filter_settings:
-                modify_data = bool(filter_parameter[1]["modify_data"][0])
-                if modify_data:
-                    # run filter
-                    filter_result = filter_to_use.process_data(
-                        trace_data, dict(filter_parameter[1])
-                    )
-                    trace_data = filter_result["data"]
+            if modify_data:
+                # run filter
+                filter_result = process_data(trace_data, filter_settings)
+                trace_data = filter_result["data"]
 
         return trace_data
 
@@ -400,3 +615,58 @@ class BatchProcessingThread(QThread):
             )
 
         self.new_trace_data.finish()
+
+
+class _TraceDetector:
+    """Runs the filters and triggers of a BatchProcessingThread on the traces in a
+    worker process with the same methods (a QThread can't be passed to a process)
+    """
+
+    run_filters_and_triggers = BatchProcessingThread.run_filters_and_triggers
+    _store_xmarks = BatchProcessingThread._store_xmarks
+    _prepare_triggers = BatchProcessingThread._prepare_triggers
+    _run_triggers = BatchProcessingThread._run_triggers
+    _prepare_filters = BatchProcessingThread._prepare_filters
+    _run_filters = BatchProcessingThread._run_filters
+
+    def __init__(
+        self,
+        source: str | dict,
+        filter_dict: OrderedDict,
+        trigger_dict: OrderedDict,
+        region_around_peak: list,
+        trace_type: str,
+        trace_count: int,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self._filters = FilterLoader()
+        self._triggers = TriggerLoader()
+        self.tracetype = trace_type
+        self.trace_data = AlignTraceDataFactory.open_trace_data(source)
+        self.filter_dict = filter_dict
+        self.trigger_dict = trigger_dict
+        self._prepared_filters = self._prepare_filters()
+        self._prepared_triggers = self._prepare_triggers()
+        self.region_around_peak = list(region_around_peak)
+        self.peak_array = np.zeros((trace_count, 2), dtype=int)
+        self.valid_traces_array = np.zeros(trace_count, dtype=bool)
+
+
+# the _TraceDetector of a worker process, created once by _init_detector
+_detector = None
+
+
+def _init_detector(*detector_args):
+    global _detector
+    _detector = _TraceDetector(*detector_args)
+
+
+def _detect_chunk(start: int, end: int) -> tuple:
+    for tracenr in range(start, end):
+        _detector.run_filters_and_triggers(tracenr)
+    return (
+        start,
+        _detector.valid_traces_array[start:end],
+        _detector.peak_array[start:end],
+        _detector.region_around_peak,
+    )
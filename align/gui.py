@@ -5,7 +5,7 @@ from PySide6.QtGui import QPalette, QColor
 from PySide6.QtCore import Qt
 from align.model import Model
 from align.presenter import Presenter
-from align.ui.main_window import AliGnMainWindow
+from align.ui.main_window import AliGnMainWindow, configure_opengl
 
 
 def start_gui():
@@ -29,6 +29,9 @@ def start_gui():
 
     # Build up the Model View Presenter (MVP) architecural pattern from our classes
     model = Model()
+    # the OpenGL option has to be set before the plot widgets are created
+    model.restore_app_settings()
+    configure_opengl(model.app_settings.use_opengl)
     view = AliGnMainWindow()
     presenter = Presenter(model, view)
 
@@ -1,4 +1,6 @@
 from array import array
+import contextlib
+import functools
 import math
 import numpy as np
 
@@ -38,12 +40,34 @@ class Helpers:
             )
 
     @staticmethod
+    @contextlib.contextmanager
+    def blocked_signals(*objects):
+        """Blocks the signals of the given Qt objects (widgets, parameters) while
+        the with block runs and unblocks them afterwards, also on exceptions
+
+           Parameters
+           ----------
+           objects : QObject
+               objects providing blockSignals()
+        """
+        for obj in objects:
+            obj.blockSignals(True)
+        try:
+            yield
+        finally:
+            for obj in objects:
+                obj.blockSignals(False)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
     def eng_string(x: float | int, format: str = "%s", si: bool = False) -> str:
         """Returns float/int value <x> formatted in a simplified engineering format -
         using an exponent that is a multiple of 3.
         format: printf-style string used to format the value before the exponent.
         si: if true, use SI suffix for exponent, e.g. k instead of e3, n instead of
         e-9 etc.
+        Results are memoized, since the same (fixed) sample rates are formatted
+        over and over again.
 
           Parameters
           ----------
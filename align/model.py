@@ -200,6 +200,7 @@ class Model:
             self.actual_region_around_peak,
             trace_type,
             number_of_traces,
+            workers=self.app_settings.batch_workers or 1,
         )
         self._batch_processing_thread.progress_signal.connect(on_progress)
         self._batch_processing_thread.finished.connect(on_finished)
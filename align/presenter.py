@@ -13,7 +13,7 @@ import os
 import random
 import numpy as np
 from PySide6.QtWidgets import QMessageBox, QFileDialog
-from PySide6.QtCore import QPointF
+from PySide6.QtCore import QPointF, QObject, QRunnable, QThreadPool, Signal
 from PySide6.QtGui import QColor
 from pyqtgraph.parametertree.parameterTypes.file import FileParameter
 from pyqtgraph import CurveArrow, PlotDataItem
@@ -25,10 +25,48 @@ from align.custom_group_parameters import TriggerGroupParameter
 from align.data_importer import NpyImporter
 from align.helpers import Helpers
 from align.tools.frequency_analyzer import FrequencyAnalyzer
+from align.tracelib.dsp import nanMinMax
 from align.ui.main_window import AliGnMainWindow
 from align.model import Model
 
 
+class _ProjectSettingsSignals(QObject):
+    """Signals of a _ProjectSettingsWorker, delivered to the GUI thread"""
+
+    finished = Signal(object)
+    error = Signal(str)
+
+
+class _ProjectSettingsWorker(QRunnable):
+    """Runs a project settings load/save function of the model in a QThreadPool
+    so that the (json) file I/O doesn't block the GUI thread
+
+    Parameters
+    ----------
+    function : Callable
+        model function to run, e.g. Model.load_project_settings
+    project_filename : str
+        project file to read from or write to
+    *args : Any
+        additional positional arguments passed to function before project_filename
+    """
+
+    def __init__(self, function, project_filename: str, *args):
+        super().__init__()
+        self.signals = _ProjectSettingsSignals()
+        self._function = function
+        self._project_filename = project_filename
+        self._args = args
+
+    def run(self) -> None:
+        try:
+            result = self._function(*self._args, self._project_filename)
+        except OSError:
+            self.signals.error.emit(self._project_filename)
+        else:
+            self.signals.finished.emit(result)
+
+
 class Presenter:
     """
     Presenter class acts upon the model and the view. It handles the actions the user selects in the gui
@@ -45,6 +83,17 @@ class Presenter:
     def __init__(self, model: Model, view: AliGnMainWindow):
         self._model = model
         self._view = view
+        # length of the current reference trace, updated in handle_ref_trace_changed
+        self._ref_trace_len = 0
+        # trace pens by (rgba, width), reused when the traces are plotted again
+        self._trace_pens = {}
+        # text of the mouse position label, only set again if it changes
+        self._mouse_position_text = None
+        # xmarks of the peak region, the region handler is connected only once
+        self._peak_region_xmarks = None
+        self._view.peak_linear_region_item.sigRegionChanged.connect(
+            self._handle_peak_region_changed
+        )
         logging.getLogger(__name__)
 
     def show(self, *args: str) -> None:
@@ -91,12 +140,16 @@ class Presenter:
         )
         if project_filename == "":
             return
-        try:
-            state = self._model.load_project_settings(project_filename)
-            self._view.tree_parameter.child("metafile").setToDefault()
-            self._view.tree_parameter.restoreState(state)
-        except OSError:
-            logging.error("Couldn't read Project from file: %s", project_filename)
+        worker = _ProjectSettingsWorker(
+            self._model.load_project_settings, project_filename
+        )
+        worker.signals.finished.connect(self._restore_project_state)
+        worker.signals.error.connect(
+            lambda filename: logging.error(
+                "Couldn't read Project from file: %s", filename
+            )
+        )
+        QThreadPool.globalInstance().start(worker)
 
     def handle_action_save_project(self) -> None:
         """Save all settings from parameter tree in a project file
@@ -116,10 +169,15 @@ class Presenter:
         if project_filename == "":
             return
         state = self._view.tree_parameter.saveState()
-        try:
-            self._model.save_project_settings(state, project_filename)
-        except OSError:
-            logging.error("Couldn't save settings to file: %s", project_filename)
+        worker = _ProjectSettingsWorker(
+            self._model.save_project_settings, project_filename, state
+        )
+        worker.signals.error.connect(
+            lambda filename: logging.error(
+                "Couldn't save settings to file: %s", filename
+            )
+        )
+        QThreadPool.globalInstance().start(worker)
 
     def handle_action_show_about_dialog(self) -> None:
         """Open a QMessageBox with the app description"""
@@ -158,13 +216,16 @@ class Presenter:
             return
         logging.info("Parameter: %s", parameter)
         logging.info("Changes: %s", changes)
-        npy_files = dict()
-        for changed_parameter, change, data in changes:
-            if change == "value":
-                npy_files[changed_parameter.name().split("_")[0]] = data
+        npy_files = {
+            changed_parameter.name().partition("_")[0]: data
+            for changed_parameter, change, data in changes
+            if change == "value"
+        }
         parameter.blockSignals(True)
-        self._open_trace_data_and_fill_views(npy_files)
-        parameter.blockSignals(False)
+        try:
+            self._open_trace_data_and_fill_views(npy_files)
+        finally:
+            parameter.blockSignals(False)
 
     def handle_action_open_metafile(self) -> None:
         """Handler to call if user click menu "Open meta file"
@@ -194,11 +255,14 @@ class Presenter:
 
     def handle_action_show_frequency_analyzer(self) -> None:
         """Opens a new window with a frequency analyzer tool"""
+        if self._model.trace_data is None:
+            return
+        trace_data = self._get_ref_trace_data()
+        if trace_data is None:
+            return
         freqan = FrequencyAnalyzer()
         sample_freq = self._model.trace_data.get_sample_freq()
-        if self._model.trace_data is not None:
-            trace_data = self._get_ref_trace_data()
-            freqan.plot_data(trace_data, sample_freq)
+        freqan.plot_data(trace_data, sample_freq)
 
     def handle_overview_region_changed(self) -> None:
         """Handler to call if the region in the overview plot has changed
@@ -227,6 +291,12 @@ class Presenter:
               the new view range
         """
         rgn = view_range[0]
+        # the overview shows the whole trace, changes smaller than one of its pixels
+        # (e.g. while dragging) would not move the region visibly
+        min_x, max_x = self._view.overview_linear_region_item.getRegion()
+        pixel_width = self._view.overview_plot_item.vb.viewPixelSize()[0]
+        if abs(rgn[0] - min_x) < pixel_width and abs(rgn[1] - max_x) < pixel_width:
+            return
         self._view.overview_linear_region_item.setRegion(rgn)
 
     def handle_em_traces_plotitem_mouse_moved(self, point: QPointF) -> None:
@@ -239,20 +309,23 @@ class Presenter:
            point : QPointF
                x/y coordinates from mouse pointer
         """
-        if self._view.em_traces_plot_item.sceneBoundingRect().contains(point):
-            mouse_point = self._view.em_traces_plot_item.vb.mapSceneToView(point)
-            index = int(mouse_point.x())
-            reference_trace_data = self._get_ref_trace_data()
-            if reference_trace_data is None:
-                return
-            if 0 < index < len(reference_trace_data):
-                x_value = str(round(mouse_point.x()))
-                y_value = str(round(mouse_point.y()))
-                self._view.mouse_position_label.setText(
-                    f"<span style='font-size: 12pt'>x={x_value}, y={y_value}</span>"
-                )
-            self._view.vertical_line.setPos(mouse_point.x())
-            self._view.horizontal_line.setPos(mouse_point.y())
+        if not self._view.em_traces_plot_item.sceneBoundingRect().contains(point):
+            return
+        # use the cached reference trace length instead of fetching the trace on every move
+        ref_trace_len = self._ref_trace_len
+        if not ref_trace_len:
+            return
+        view = self._view
+        mouse_point = view.em_traces_plot_item.vb.mapSceneToView(point)
+        x, y = mouse_point.x(), mouse_point.y()
+        if 0 < int(x) < ref_trace_len:
+            text = f"<span style='font-size: 12pt'>x={round(x)}, y={round(y)}</span>"
+            # the label is laid out again on every setText, most moves keep the text
+            if text != self._mouse_position_text:
+                self._mouse_position_text = text
+                view.mouse_position_label.setText(text)
+        view.vertical_line.setPos(x)
+        view.horizontal_line.setPos(y)
 
     def handle_start_stop_batch_button_clicked(self):
         """Handler to call batch processing button was clicked
@@ -332,17 +405,31 @@ class Presenter:
         reference_trace_data = self._model.trace_data.get_trace(
             ref_trace_type, ref_trace_nr
         )
-        self._view.overview_plot_item.setYRange(
-            int(np.nanmin(reference_trace_data)), int(np.nanmax(reference_trace_data))
-        )
+        if reference_trace_data is None:
+            self._ref_trace_len = 0
+            return
+        self._ref_trace_len = len(reference_trace_data)
+        y_min, y_max = nanMinMax(reference_trace_data)
+        self._view.overview_plot_item.setYRange(int(y_min), int(y_max))
         self._view.overview_plot_item.setXRange(0, len(reference_trace_data), padding=0)
 
+        # integer traces (raw scope samples) contain no NaN/Inf, so pyqtgraph's finite
+        # check is skipped for them, float traces (e.g. npy inputs) are checked.
+        # pyqtgraph downsamples to the visible pixels instead of drawing every sample
+        skip_finite_check = np.issubdtype(reference_trace_data.dtype, np.integer)
         if self._view.overview_plot_data_item is None:
             self._view.overview_plot_data_item = self._view.overview_plot_item.plot(
-                reference_trace_data, pen="r"
+                reference_trace_data,
+                pen="r",
+                skipFiniteCheck=skip_finite_check,
+                autoDownsample=True,
+                clipToView=True,
+                downsampleMethod="peak",
             )
         else:
-            self._view.overview_plot_data_item.setData(reference_trace_data)
+            self._view.overview_plot_data_item.setData(
+                reference_trace_data, skipFiniteCheck=skip_finite_check
+            )
 
         self._view.overview_linear_region_item.setBounds([0, len(reference_trace_data)])
 
@@ -457,6 +544,12 @@ class Presenter:
         """
         pass
 
+    def _restore_project_state(self, state: dict) -> None:
+        if state is None:
+            return
+        self._view.tree_parameter.child("metafile").setToDefault()
+        self._view.tree_parameter.restoreState(state)
+
     def _save_app_settings(self):
         self._model.app_settings.log_level = logging.getLevelName(
             logging.getLogger().level
@@ -673,17 +766,13 @@ class Presenter:
 
         if len(xmarks) == 1:
             # add region around arrow
-            self._view.peak_linear_region_item.sigRegionChanged.connect(
-                lambda: self._update_peak_region(xmarks)
-            )
+            self._peak_region_xmarks = xmarks
             peak_region_start = peak_at + self._model.actual_region_around_peak[0]
             peak_region_end = peak_at + self._model.actual_region_around_peak[1]
 
         elif len(xmarks) == 2 and xmarks[1] is not None:
             # add region between arrows
-            self._view.peak_linear_region_item.sigRegionChanged.connect(
-                lambda: self._update_peak_region(xmarks)
-            )
+            self._peak_region_xmarks = xmarks
             peak_region_start = xmarks[0] + self._model.actual_region_around_peak[0]
             peak_region_end = xmarks[1] + self._model.actual_region_around_peak[1]
 
@@ -701,7 +790,7 @@ class Presenter:
             CurveArrow(
                 self._model.plot_data_items[trace_options.name()][1],
                 index=x_position,
-                brush=pyqtgraph.mkBrush(255, 20, 20),
+                brush=self._view.arrow_brush,
             ).setStyle(angle=90)
 
     def _clear_peak_region(self):
@@ -728,35 +817,55 @@ class Presenter:
         else:
             plot_item = self._view.em_traces_plot_item
 
-        plot_item.setYRange(int(np.nanmin(trace_data)), int(np.nanmax(trace_data)))
+        y_min, y_max = nanMinMax(trace_data)
+        plot_item.setYRange(int(y_min), int(y_max))
 
         plot_data_item = PlotDataItem(
             trace_data,
-            pen=pyqtgraph.mkPen(
-                trace_color, width=self._model.app_settings.trace_plot_width
+            pen=self._trace_pen(
+                trace_color, self._model.app_settings.trace_plot_width
             ),
         )
         plot_item.addItem(plot_data_item)
         self._model.plot_data_items[trace_options.name()] = (plot_item, plot_data_item)
 
+    def _trace_pen(self, color, width):
+        key = (pyqtgraph.mkColor(color).rgba(), width)
+        pen = self._trace_pens.get(key)
+        if pen is None:
+            pen = self._trace_pens[key] = pyqtgraph.mkPen(color, width=width)
+        return pen
+
+    def _handle_peak_region_changed(self) -> None:
+        if self._peak_region_xmarks is not None:
+            self._update_peak_region(self._peak_region_xmarks)
+
     def _update_peak_region(self, peaks: list[int]) -> None:
         if 1 < len(peaks) < 2:
             return
         min_x, max_x = self._view.peak_linear_region_item.getRegion()
-        self._model.actual_region_around_peak = [
+        region_start, region_end = int(min_x), int(max_x)
+        region_around_peak = [
             int(min_x - peaks[0]),
             int(max_x - (peaks[1] if len(peaks) == 2 else peaks[0])),
         ]
-        self._view.processing_frame_ui.dsb_cut_area_start.blockSignals(True)
-        self._view.processing_frame_ui.dsb_cut_area_end.blockSignals(True)
-
-        self._view.processing_frame_ui.dsb_cut_area_start.setValue(int(min_x))
-        self._view.processing_frame_ui.dsb_cut_area_end.setValue(int(max_x))
-
-        self._view.processing_frame_ui.dsb_cut_area_start.blockSignals(False)
-        self._view.processing_frame_ui.dsb_cut_area_end.blockSignals(False)
+        dsb_cut_area_start = self._view.processing_frame_ui.dsb_cut_area_start
+        dsb_cut_area_end = self._view.processing_frame_ui.dsb_cut_area_end
+        # dragging emits several region changes for the same (integer) region
+        if (
+            region_around_peak == self._model.actual_region_around_peak
+            and dsb_cut_area_start.value() == region_start
+            and dsb_cut_area_end.value() == region_end
+        ):
+            return
+        self._model.actual_region_around_peak = region_around_peak
+        with Helpers.blocked_signals(dsb_cut_area_start, dsb_cut_area_end):
+            dsb_cut_area_start.setValue(region_start)
+            dsb_cut_area_end.setValue(region_end)
 
     def _get_ref_trace_data(self) -> np.ndarray:
+        # zero-copy guarantee: a trace row of the (memmapped) trace array is already
+        # C-contiguous, so np.ascontiguousarray returns a view on the same buffer
         if self._model.trace_data is None:
             return
         ref_trace_nr = self._view.tree_parameter.child("ref_trace").value()
@@ -764,4 +873,9 @@ class Presenter:
         reference_trace_data = self._model.trace_data.get_trace(
             ref_trace_type, ref_trace_nr
         )
+        if reference_trace_data is None:
+            return
+        reference_trace_data = np.ascontiguousarray(
+            reference_trace_data, dtype=reference_trace_data.dtype
+        )
         return reference_trace_data
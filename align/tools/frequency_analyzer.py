@@ -1,5 +1,6 @@
 import logging
 import numpy as np
+import scipy.fft
 import pyqtgraph as pg
 from PySide6.QtGui import QIcon
 
@@ -26,19 +27,23 @@ class FrequencyAnalyzer:
         tuple[np.ndarray, np.ndarray]
             frequency scale and output_data
         """
+        # the traces are real valued, so the real FFT (only the non redundant
+        # half of the spectrum) is sufficient. scipy's rfft keeps float32 input
+        # in single precision
+        input_data = np.asarray(input_data, dtype=np.float32)
         number_sample_points = len(input_data)
         self.logger.debug(
             "FrequencyAnalyzer sampleFrequency: {}".format(sample_frequency)
         )
-        y_values = np.fft.fft(input_data)
+        y_values = scipy.fft.rfft(input_data)
         self.logger.debug("y_values: {}".format(y_values))
         # Calculate the data for the plots
-        y_values = np.abs(y_values[: int(number_sample_points / 2)])
+        y_values = np.abs(y_values[: number_sample_points // 2])
         output_data = (100.0 * y_values) / number_sample_points
         output_data[0] = 0
-        freq_scale = np.linspace(
-            0, sample_frequency // 2, number_sample_points // 2
-        )  # linspace needs integer values therefore the use of the "floor" operator (//)
+        freq_scale = scipy.fft.rfftfreq(number_sample_points, d=1.0 / sample_frequency)[
+            : number_sample_points // 2
+        ]
         return freq_scale, output_data
 
     def plot_data(self, input_data: np.ndarray, sample_frequency: float):
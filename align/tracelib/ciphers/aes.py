@@ -1,18 +1,27 @@
 import numba as nb
 import numpy as np
-from align.tracelib.ciphers.aesConstants import SBox32, Te0, Te1, Te2, Te3, Rcon32
+from align.tracelib.ciphers.aesConstants import SBox32, Te0, Rcon32
+
+# Optional hardware backend: OpenSSL (via the cryptography package) uses AES-NI / ARMv8
+# crypto extensions when the CPU supports them and has no secret dependent table lookups.
+# If it is not installed, the Numba T-table implementation below is used.
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    HAS_AESNI_BACKEND = True
+except ImportError:
+    HAS_AESNI_BACKEND = False
 
 
 # KEY EXPANSION
 
-@nb.njit("u4(u4[:],u1)")
+@nb.njit("u4(u4[:],u1)", cache=True)
 def scheduleCore32(word, i):
     word[0] = word[0]<<8 | word[0]>>24
     word[0] = (SBox32[word[0]>>24])<<24 | (SBox32[word[0]>>16 & 0xff])<<16 |    (SBox32[word[0]>>8&0xff])<<8 |(SBox32[word[0]&0xff])
     word[0] = word[0] ^ (Rcon32[i] << 24)
     return word[0]
 
-@nb.njit("u4[:](u4[:])")
+@nb.njit("u4[:](u4[:])", cache=True)
 def expandKey32(key):
     tmp = np.zeros(1, dtype = np.uint32)
     fullKey = np.zeros(44, dtype = np.uint32)
@@ -28,9 +37,14 @@ def expandKey32(key):
         iWord += 1
     return fullKey
 
+# Round keys of an AES-128 key (16 bytes) as (11, 16) uint8 array, round key i in row i
+def keySchedule(key):
+    key32 = np.frombuffer(bytes(key), dtype = '>u4').astype(np.uint32)
+    return expandKey32(key32).astype('>u4').view(np.uint8).reshape(11, 16)
+
 # AES OPERATION
 
-@nb.njit("u4[:](u4[:])")
+@nb.njit("u4[:](u4[:])", cache=True)
 def subShift32(block):
     tmp = np.zeros(4, dtype = np.uint32)
     tmp[0] = (SBox32[block[0]>>24])<<24 | (SBox32[block[1]>>16 & 0xff])<<16 |    (SBox32[block[2]>>8&0xff])<<8 |(SBox32[block[3]&0xff])
@@ -39,16 +53,21 @@ def subShift32(block):
     tmp[3] = (SBox32[block[3]>>24])<<24 | (SBox32[block[0]>>16 & 0xff])<<16 |    (SBox32[block[1]>>8&0xff])<<8 |(SBox32[block[2]&0xff])
     return tmp
 
-@nb.njit("u4[:](u4[:])")
+@nb.njit("u4(u4,u4)", cache=True)
+def rotl32(word, shift):
+    return ((word << shift) | (word >> (32 - shift))) & 0xffffffff
+
+# Te1..Te3 are byte rotations of Te0, so only Te0 (1 KiB instead of 4 KiB) is looked up
+@nb.njit("u4[:](u4[:])", cache=True)
 def roundLookup32(block):
     tmp = np.zeros(4, dtype = np.uint32)
-    tmp[0] = Te0[block[0]>>24] ^ Te1[block[1] >> 16 & 0xff] ^ Te2[block[2] >> 8 & 0xff] ^ Te3[block[3] & 0xff]
-    tmp[1] = Te0[block[1]>>24] ^ Te1[block[2] >> 16 & 0xff] ^ Te2[block[3] >> 8 & 0xff] ^ Te3[block[0] & 0xff]
-    tmp[2] = Te0[block[2]>>24] ^ Te1[block[3] >> 16 & 0xff] ^ Te2[block[0] >> 8 & 0xff] ^ Te3[block[1] & 0xff]
-    tmp[3] = Te0[block[3]>>24] ^ Te1[block[0] >> 16 & 0xff] ^ Te2[block[1] >> 8 & 0xff] ^ Te3[block[2] & 0xff]
+    tmp[0] = Te0[block[0]>>24] ^ rotl32(Te0[block[1] >> 16 & 0xff], 24) ^ rotl32(Te0[block[2] >> 8 & 0xff], 16) ^ rotl32(Te0[block[3] & 0xff], 8)
+    tmp[1] = Te0[block[1]>>24] ^ rotl32(Te0[block[2] >> 16 & 0xff], 24) ^ rotl32(Te0[block[3] >> 8 & 0xff], 16) ^ rotl32(Te0[block[0] & 0xff], 8)
+    tmp[2] = Te0[block[2]>>24] ^ rotl32(Te0[block[3] >> 16 & 0xff], 24) ^ rotl32(Te0[block[0] >> 8 & 0xff], 16) ^ rotl32(Te0[block[1] & 0xff], 8)
+    tmp[3] = Te0[block[3]>>24] ^ rotl32(Te0[block[0] >> 16 & 0xff], 24) ^ rotl32(Te0[block[1] >> 8 & 0xff], 16) ^ rotl32(Te0[block[2] & 0xff], 8)
     return tmp
 
-@nb.njit("u4[:](u4[:],u4[:])")
+@nb.njit("u4[:](u4[:],u4[:])", cache=True)
 def aesTL32(plain, expandedKey):
     state = np.zeros(4, dtype = np.uint32)
     #AddRoundKey
@@ -60,19 +79,64 @@ def aesTL32(plain, expandedKey):
     state[:] = state ^ expandedKey[40:]
     return state
 
-np.set_printoptions(formatter={'int':hex})
+# Encrypts the blocks of a uint8[N,16] array, the bytes are packed into big endian
+# words (and back) inside the loop instead of with view/astype copies of the whole array.
+# No explicit signature: the input may be a read-only view of a bytes object
+@nb.njit(cache=True)
+def aesTL32Many(plains, expandedKey):
+    ciphers = np.empty((plains.shape[0], 16), dtype = np.uint8)
+    block = np.empty(4, dtype = np.uint32)
+    for iBlock in range(plains.shape[0]):
+        for i in range(4):
+            block[i] = np.uint32(plains[iBlock, 4*i])<<24 | np.uint32(plains[iBlock, 4*i+1])<<16 | np.uint32(plains[iBlock, 4*i+2])<<8 | np.uint32(plains[iBlock, 4*i+3])
+        state = aesTL32(block, expandedKey)
+        for i in range(4):
+            ciphers[iBlock, 4*i] = state[i]>>24
+            ciphers[iBlock, 4*i+1] = state[i]>>16 & 0xff
+            ciphers[iBlock, 4*i+2] = state[i]>>8 & 0xff
+            ciphers[iBlock, 4*i+3] = state[i] & 0xff
+    return ciphers
+
+# KEY SPECIALIZATION
+
+# Generates the source of an encryption function with the 44 round key words embedded
+# as literals and compiles it with numba (exec + njit). The round keys become immediate
+# operands instead of array loads in every round. Compiling takes a few hundred ms, so
+# this only pays off if many blocks are encrypted with the same key.
+def specializeKey32(expandedKey):
+    lines = ["def aesTL32FixedKey(plain):",
+             "    state = np.empty(4, dtype = np.uint32)"]
+    for i in range(4):
+        lines.append("    state[%d] = plain[%d] ^ np.uint32(0x%08x)" % (i, i, expandedKey[i]))
+    for iRound in range(1, 11):
+        if iRound < 10:
+            lines.append("    state[:] = roundLookup32(state)")
+        else:
+            lines.append("    state[:] = subShift32(state)")
+        for i in range(4):
+            lines.append("    state[%d] ^= np.uint32(0x%08x)" % (i, expandedKey[iRound*4 + i]))
+    lines.append("    return state")
+    namespace = {"np": np, "roundLookup32": roundLookup32, "subShift32": subShift32}
+    exec("\n".join(lines), namespace)
+    return nb.njit("u4[:](u4[:])")(namespace["aesTL32FixedKey"])
 
 ### API
 
 class AESEngine(object):
-    def __init__(self):
+    # specializeKey: compile an encryption function for each key set with setKey
+    # (see specializeKey32), only used without the hardware backend
+    def __init__(self, useHardware = True, specializeKey = False):
         self.dt = np.dtype(np.uint32)
         self.dt = self.dt.newbyteorder('B')
         self.plaintext = np.zeros(4, dtype = np.uint32)
         self.ciphertext = np.zeros(4, dtype = np.uint32)
         self.key = np.zeros(4, dtype = np.uint32)
         self.expandedKey = np.zeros(44, dtype = np.uint32)
-        
+        self.useHardware = useHardware and HAS_AESNI_BACKEND
+        self.specializeKey = specializeKey
+        self._encryptor = None
+        self._encryptFn = None
+
     def _transformInput(self, _input):
         input32 = np.frombuffer(_input, dtype = self.dt)
         return input32
@@ -80,15 +144,37 @@ class AESEngine(object):
     def setKey(self, key):
         self.key[:] = self._transformInput(key)
         self.expandedKey[:] = expandKey32(self.key)
+        if self.useHardware:
+            self._encryptor = Cipher(algorithms.AES(bytes(key)), modes.ECB()).encryptor()
+        elif self.specializeKey:
+            self._encryptFn = specializeKey32(self.expandedKey)
 
     def encrypt(self, plaintext, returnType = np.uint32):
-        self.plaintext[:] = self._transformInput(plaintext)
-        self.ciphertext[:] = aesTL32(self.plaintext, self.expandedKey)
+        # all paths produce the 16 ciphertext bytes, only the uint32 return type is
+        # copied into self.ciphertext
+        if self._encryptor is not None:
+            cipher8 = np.frombuffer(self._encryptor.update(bytes(plaintext)), dtype = np.uint8)
+        elif self._encryptFn is not None:
+            self.plaintext[:] = self._transformInput(plaintext)
+            cipher8 = self._encryptFn(self.plaintext).astype('>u4').view(np.uint8)
+        else:
+            plain8 = np.frombuffer(plaintext, dtype = np.uint8).reshape(1, 16)
+            cipher8 = aesTL32Many(plain8, self.expandedKey)[0]
         if returnType is np.uint32:
+            self.ciphertext[:] = cipher8.view(self.dt)
             return self.ciphertext
         else:
-            ciphertext = self.ciphertext.astype('>u4') # Change Byteorder if necessary
-            return ciphertext.view(returnType)
+            return cipher8.view(returnType)
+
+    def encryptMany(self, plaintexts):
+        # Encrypts N blocks (uint8[N,16]) with the current key in a single call.
+        # The hardware backend hands the whole buffer to OpenSSL (ECB), which interleaves
+        # several independent blocks in the AES-NI pipeline.
+        plaintexts = np.ascontiguousarray(plaintexts, dtype = np.uint8).reshape(-1, 16)
+        if self._encryptor is not None:
+            ciphertexts = self._encryptor.update(plaintexts.tobytes())
+            return np.frombuffer(ciphertexts, dtype = np.uint8).reshape(-1, 16)
+        return aesTL32Many(plaintexts, self.expandedKey)
 
 ### TESTS
 if __name__ == "__main__":
@@ -1,12 +1,16 @@
 import numpy as np
-from numba import njit
-from scipy.signal import lfilter
+from numba import njit, prange
+from scipy.signal import fftconvolve, oaconvolve
+
+## sample type of the DSP passes. Traces are 8 to 12 bit scope samples,
+## float32 halves the memory traffic compared to float64
+_DSP_DTYPE = np.float32
 
 ## split the trace into intervals of size intervalSize
 ## and
 
 
-def calculateVariance(trace, intervalSize):
+def calculateVariance(trace, intervalSize, dtype=_DSP_DTYPE):
     """
     split the trace into intervals of size intervalSize
     and calculate the signal variance for each interval
@@ -14,21 +18,18 @@ def calculateVariance(trace, intervalSize):
     interval (smaller than intervalSize) is ignored
     :param trace: the input trace
     :param intervalSize: must be smaller than trace length
+    :param dtype: type of the returned variance, default float32. It is always
+                  computed in float64, use None to get the float64 result
     :return: an np.array containing the signal variance
     """
     if intervalSize >= len(trace):
         raise ValueError("calculateVariance: intervalSize larger than trace length.")
-    trace = np.array(trace)
+    trace = np.asarray(trace)
     remove_end = len(trace) % intervalSize
     if remove_end != 0:
         trace = trace[:-remove_end]
-    res = []
-    chunks = trace.reshape(-1, intervalSize)
-    x = chunks.shape[0]
-    for i in range(0, x):
-        v = np.var(chunks[i, :])
-        res.append(v)
-    return np.array(res)
+    variance = np.var(trace.reshape(-1, intervalSize), axis=1, dtype=np.float64)
+    return variance if dtype is None else variance.astype(dtype)
 
 
 def findMinimum(trace, range_start, range_stop, threshold, verbose=False):
@@ -53,18 +54,174 @@ def findMaximum(trace, range_start, range_stop, threshold):
         return None
 
 
+## minimum and maximum of a trace in a single pass, NaN values are ignored.
+## same as (np.nanmin(trace), np.nanmax(trace)), but reads the trace once
+@njit(cache=True)
+def nanMinMax(trace):
+    lo = np.inf
+    hi = -np.inf
+    for v in trace:
+        if v == v:
+            if v < lo:
+                lo = v
+            if v > hi:
+                hi = v
+    return (lo, hi)
+
+
+## index of the first sample from offset on over (rising) / under (falling) the threshold,
+## -1 if there is none.
+## The loops stop at the first match instead of comparing the whole trace, a boolean
+## mask with argmax would compare and allocate all samples behind offset first
+@njit(cache=True, boundscheck=False)
 def matchRisingEdge(trace, offset, threshold):
-    x = np.argmax(trace[offset:] > threshold)
-    if x != 0:
-        x += offset
-    return x
+    for i in range(offset, trace.shape[0]):
+        if trace[i] > threshold:
+            return i
+    return -1
 
 
+@njit(cache=True, boundscheck=False)
 def matchFallingEdge(trace, offset, threshold):
-    x = np.argmax(trace[offset:] < threshold)
-    if x != 0:
-        x += offset
-    return x
+    for i in range(offset, trace.shape[0]):
+        if trace[i] < threshold:
+            return i
+    return -1
+
+
+## ThresholdTrigger scan: returns (start, end) of the first range behind offset which
+## starts with a sample >= upper and ends with the next sample <= lower and is at least
+## minRange samples long, (-1, -1) if there is none. matchBelowRange searches ranges
+## starting <= lower and ending >= upper. Two functions instead of an inverse flag,
+## so the loops contain no branch on it
+@njit(cache=True, boundscheck=False)
+def matchAboveRange(trace, offset, upper, lower, minRange):
+    start = -1
+    for i in range(offset, trace.shape[0]):
+        if start < 0:
+            if trace[i] >= upper:
+                start = i
+        elif trace[i] <= lower:
+            if i - start >= minRange:
+                return start, i
+            start = -1
+    return -1, -1
+
+
+@njit(cache=True, boundscheck=False)
+def matchBelowRange(trace, offset, upper, lower, minRange):
+    start = -1
+    for i in range(offset, trace.shape[0]):
+        if start < 0:
+            if trace[i] <= lower:
+                start = i
+        elif trace[i] >= upper:
+            if i - start >= minRange:
+                return start, i
+            start = -1
+    return -1, -1
+
+
+## SWAR scan of uint8 traces, 8 samples per uint64 word: a byte b of x is >= u if the
+## high bit of (x | ((x | 0x80..) - u * 0x01..)) is set for u <= 128, and of
+## (x & ((x | 0x80..) - (u - 128) * 0x01..)) for u > 128 (the high bit set in every
+## byte keeps the subtraction from borrowing across bytes). Samples <= m are searched as
+## bytes of ~x >= 255 - m. words is the uint64 view of trace[head:], flip is 0 or 255
+## (search ~x). Returns the index of the first such sample from i on, len(trace) if none
+@njit(cache=True, boundscheck=False)
+def _firstByteAtLeast(trace, words, head, i, u, flip):
+    n = trace.shape[0]
+    if u > 255:
+        return n
+    # single samples up to the first whole word
+    stop = min(head + (max(i - head, 0) + 7) // 8 * 8, n)
+    while i < stop:
+        if trace[i] ^ flip >= u:
+            return i
+        i += 1
+    high = np.uint64(0x8080808080808080)
+    wordFlip = np.uint64(0x0101010101010101) * np.uint64(flip)
+    w = (i - head) // 8
+    if u <= 128:
+        sub = np.uint64(0x0101010101010101) * np.uint64(u)
+        while w < words.shape[0]:
+            x = words[w] ^ wordFlip
+            if (x | ((x | high) - sub)) & high:
+                break
+            w += 1
+    else:
+        sub = np.uint64(0x0101010101010101) * np.uint64(u - 128)
+        while w < words.shape[0]:
+            x = words[w] ^ wordFlip
+            if (x & ((x | high) - sub)) & high:
+                break
+            w += 1
+    # the sample in the found word (or in the samples behind the last word)
+    for i in range(max(i, head + w * 8), n):
+        if trace[i] ^ flip >= u:
+            return i
+    return n
+
+
+@njit(cache=True, boundscheck=False)
+def _matchRangeU8(
+    trace, words, head, offset, startAt, startFlip, endAt, endFlip, minRange
+):
+    n = trace.shape[0]
+    start = _firstByteAtLeast(trace, words, head, offset, startAt, startFlip)
+    while start < n:
+        end = _firstByteAtLeast(trace, words, head, start + 1, endAt, endFlip)
+        if end == n:
+            break
+        if end - start >= minRange:
+            return start, end
+        start = _firstByteAtLeast(trace, words, head, end + 1, startAt, startFlip)
+    return -1, -1
+
+
+## matchAboveRange (matchBelowRange if inverse) for uint8 traces, scanning 8 samples
+## at once. Falls back to the sample-wise scan for short or non-contiguous traces
+def matchRangeU8(trace, offset, upper, lower, minRange, inverse=False):
+    if trace.shape[0] < 64 or not trace.flags.c_contiguous:
+        matchRange = matchBelowRange if inverse else matchAboveRange
+        return matchRange(trace, offset, upper, lower, minRange)
+    if np.isnan(upper) or np.isnan(lower):
+        return -1, -1
+    # integer thresholds: sample >= upper <=> sample >= atLeast,
+    # sample <= lower <=> 255 - sample >= atMost (256 never matches)
+    atLeast = int(np.clip(np.ceil(upper), 0, 256))
+    atMost = 255 - int(np.clip(np.floor(lower), -1, 255))
+    # start the words at an 8 byte aligned address
+    head = -trace.ctypes.data % 8
+    words = trace[head : head + (trace.shape[0] - head) // 8 * 8].view(np.uint64)
+    if inverse:
+        return _matchRangeU8(
+            trace, words, head, offset, atMost, 255, atLeast, 0, minRange
+        )
+    return _matchRangeU8(
+        trace, words, head, offset, atLeast, 0, atMost, 255, minRange
+    )
+
+
+# returns the first start index in [begin, end) of a window of size width
+# (truncated at the end of the trace) which contains no True value in bad.
+# Each sample is inspected only once: after a bad sample is found, all windows
+# that contain it are skipped. Returns -1 if there is no such window
+@njit
+def _firstCleanWindow(bad, begin, end, width):
+    n = len(bad)
+    j = begin
+    k = begin  # all samples in [j, k) are known to be good
+    while j < end:
+        limit = min(j + width, n)
+        if k < j:
+            k = j
+        while k < limit and not bad[k]:
+            k += 1
+        if k >= limit:
+            return j
+        j = k + 1
+    return -1
 
 
 # match a structure akin to
@@ -72,10 +229,10 @@ def matchFallingEdge(trace, offset, threshold):
 # _|       \___
 @njit
 def matchUpperWidth(trace, offset, width, threshold):
-    for i in range(offset, len(trace) - width - 1):
-        if not (np.any(trace[i + offset : i + offset + width] <= threshold)):
-            return i + offset
-    return 0
+    x = _firstCleanWindow(
+        trace <= threshold, 2 * offset, len(trace) - width - 1 + offset, width
+    )
+    return x if x >= 0 else 0
 
 
 # match a structure akin to
@@ -83,31 +240,60 @@ def matchUpperWidth(trace, offset, width, threshold):
 #   \______/
 @njit
 def matchLowerWidth(trace, offset, width, threshold):
-    for i in range(offset, len(trace) - width - 1):
-        if not (np.any(trace[i + offset : i + offset + width] >= threshold)):
-            return i + offset
-    return 0
+    x = _firstCleanWindow(
+        trace >= threshold, 2 * offset, len(trace) - width - 1 + offset, width
+    )
+    return x if x >= 0 else 0
 
 
-@njit
+## pearson correlation coefficient of two vectors of the same length,
+## computed in a single pass over both vectors.
+## same as np.corrcoef(vec_a, vec_b)[0][1], but returns 0.0 instead of
+## NaN if one of the vectors is constant (e.g. all zero)
+@njit(fastmath=True)
 def computeCorrcoef(vec_a, vec_b):
-    return np.corrcoef(vec_a, vec_b)[0][1]
+    s_a = 0.0
+    s_b = 0.0
+    s_aa = 0.0
+    s_bb = 0.0
+    s_ab = 0.0
+    for i in range(vec_a.size):
+        a = vec_a[i]
+        b = vec_b[i]
+        s_a += a
+        s_b += b
+        s_aa += a * a
+        s_bb += b * b
+        s_ab += a * b
+    n = vec_a.size
+    den = (n * s_aa - s_a * s_a) * (n * s_bb - s_b * s_b)
+    if den <= 0.0:
+        return 0.0
+    return (n * s_ab - s_a * s_b) / np.sqrt(den)
 
 
 ## compresses a trace by averaging chunks of a trace
 ## of size interval. If the trace does not divide
-## by interval, the last chunk is disregarded
-## This is very slow due to the non-accelerated
-## loop; using numba (cf below) is much faster,
+## by interval, the last chunk is disregarded.
+## the means are accumulated in float64 and returned as float32
 def compress_trace(trace, interval):
-    l = len(trace)
-    new_len = np.int(l / interval)
-    comb_x = np.zeros(new_len, dtype=np.float)
-    j = 0
-    for i in range(0, new_len * interval, interval):
-        summe = np.mean(trace[i : i + interval])
-        comb_x[j] = summe
-        j += 1
+    new_len = len(trace) // interval
+    return (
+        np.asarray(trace[: new_len * interval])
+        .reshape(new_len, interval)
+        .mean(axis=1, dtype=np.float64)
+        .astype(_DSP_DTYPE)
+    )
+
+
+## same as compress_trace, but the chunks are averaged
+## in parallel. Use this for very large traces
+@njit(parallel=True, fastmath=True)
+def compress_trace_nb(trace, interval):
+    new_len = len(trace) // interval
+    comb_x = np.zeros(new_len, dtype=_DSP_DTYPE)
+    for j in prange(new_len):
+        comb_x[j] = np.mean(trace[j * interval : (j + 1) * interval])
     return comb_x
 
 
@@ -123,11 +309,15 @@ def _gauss(x):
 
 _gauss_vals = np.array(list(frange(-4.0, 4.2, 0.2)))
 
-_gaussfilt = _gauss(_gauss_vals) * 0.2
+_gaussfilt = _gauss(_gauss_vals).astype(_DSP_DTYPE) * _DSP_DTYPE(0.2)
 
 
 def gaussFilter(trace):
-    return lfilter(_gaussfilt, 1, trace)
+    # causal FIR filter, same result as lfilter(_gaussfilt, 1, trace),
+    # but long traces are convolved with the overlap-add FFT method
+    if len(trace) < 4 * len(_gaussfilt):
+        return np.convolve(trace, _gaussfilt, mode="full")[: len(trace)]
+    return oaconvolve(trace, _gaussfilt, mode="full")[: len(trace)]
 
 
 @njit
@@ -139,32 +329,109 @@ def count_nonzero_jit(vec):
     return s
 
 
-@njit
-def matchByCorrelation(trace, pattern, start, stop, stepSize=1):
-    coeffs = []
+@njit(parallel=True, fastmath=True, boundscheck=False)
+def _matchByCorrelationJit(trace, pattern, start, stop, stepSize=1):
     lp = len(pattern)
-    for i in range(start, stop - len(pattern), stepSize):
-        if count_nonzero_jit(trace[i : i + lp]) > 0:
-            coeffs.append(computeCorrcoef(trace[i : i + lp], pattern))
-        else:
-            coeffs.append(0.0)
-    offset = np.argmax(np.array(coeffs)) + (start)
-    corrValue = np.amax(np.array(coeffs))
+    coeffs = np.empty(len(range(start, stop - lp, stepSize)), dtype=np.float64)
+    for k in prange(coeffs.shape[0]):
+        i = start + k * stepSize
+        coeffs[k] = computeCorrcoef(trace[i : i + lp], pattern)
+    offset = np.argmax(coeffs) * stepSize + (start)
+    corrValue = np.amax(coeffs)
     return (offset, corrValue)
 
 
-@njit
-def matchBySosd(trace, pattern, start, stop, stepSize=1):
-    diffs = []
+## patterns shorter than this are matched with the jit compiled loop,
+## for longer patterns the FFT based sliding correlation is faster
+_FFT_MIN_PATTERN_LENGTH = 64
+
+
+def matchByCorrelation(trace, pattern, start, stop, stepSize=1):
+    """
+    find the offset in trace[start:stop] at which the pattern has the highest
+    Pearson correlation. Window statistics are computed from cumulative sums
+    and the covariance of all windows with a single FFT based cross-correlation.
+    Windows which contain only zeros (or are constant) get a correlation of 0
+    :param trace: the input trace
+    :param pattern: the pattern to search for
+    :param start: first offset to test
+    :param stop: the windows end before stop
+    :param stepSize: distance between the tested offsets. default 1.
+    :return: tuple (offset, correlation value)
+    """
+    lp = len(pattern)
+    if lp < _FFT_MIN_PATTERN_LENGTH:
+        return _matchByCorrelationJit(trace, pattern, start, stop, stepSize)
+
+    segment = np.asarray(trace[start : stop - 1], dtype=np.float64)
+    pattern = np.asarray(pattern, dtype=np.float64)
+    nr_windows = len(segment) - lp + 1
+
+    cs = np.concatenate(([0.0], np.cumsum(segment)))
+    cs2 = np.concatenate(([0.0], np.cumsum(segment**2)))
+    sum_t = cs[lp : lp + nr_windows] - cs[:nr_windows]
+    sum_t2 = cs2[lp : lp + nr_windows] - cs2[:nr_windows]
+    # lp * variance of each window
+    var_t = np.maximum(sum_t2 - sum_t**2 / lp, 0.0)
+
+    # sum((t - mean_t) * (p - mean_p)) == sum(t * (p - mean_p))
+    pattern_centered = pattern - pattern.mean()
+    cov = fftconvolve(segment, pattern_centered[::-1], mode="valid")
+
+    denominator = np.sqrt(var_t * np.dot(pattern_centered, pattern_centered))
+    flat = var_t <= np.finfo(np.float64).eps * np.maximum(sum_t2, 1.0)
+    coeffs = np.zeros(nr_windows)
+    np.divide(cov, denominator, out=coeffs, where=~flat)
+
+    coeffs = coeffs[::stepSize]
+    x = np.argmax(coeffs)
+    return (x * stepSize + start, coeffs[x])
+
+
+@njit(parallel=True, fastmath=True, boundscheck=False)
+def _matchBySosdJit(trace, pattern, start, stop, stepSize=1):
     lp = len(pattern)
-    for i in range(start, stop - len(pattern), stepSize):
-        d = np.sum((trace[i : i + lp] - pattern) ** 2)
-        diffs.append(d)
-    offset = np.argmin(np.array(diffs)) + (start)
-    diffVal = np.amin(np.array(diffs))
+    diffs = np.empty(len(range(start, stop - lp, stepSize)), dtype=np.float64)
+    for k in prange(diffs.shape[0]):
+        i = start + k * stepSize
+        diffs[k] = np.sum((trace[i : i + lp] - pattern) ** 2)
+    offset = np.argmin(diffs) * stepSize + (start)
+    diffVal = np.amin(diffs)
     return (offset, diffVal)
 
 
+def matchBySosd(trace, pattern, start, stop, stepSize=1):
+    """
+    find the offset in trace[start:stop] with the smallest sum of squared
+    differences to the pattern. Uses the identity
+    sum((t - p)**2) = sum(t**2) - 2 * sum(t * p) + sum(p**2)
+    with cumulative sums for the first and one FFT based
+    cross-correlation for the second term
+    :param trace: the input trace
+    :param pattern: the pattern to search for
+    :param start: first offset to test
+    :param stop: the windows end before stop
+    :param stepSize: distance between the tested offsets. default 1.
+    :return: tuple (offset, sum of squared differences)
+    """
+    lp = len(pattern)
+    if lp < _FFT_MIN_PATTERN_LENGTH:
+        return _matchBySosdJit(trace, pattern, start, stop, stepSize)
+
+    segment = np.asarray(trace[start : stop - 1], dtype=np.float64)
+    pattern = np.asarray(pattern, dtype=np.float64)
+    nr_windows = len(segment) - lp + 1
+
+    cs2 = np.concatenate(([0.0], np.cumsum(segment**2)))
+    sum_t2 = cs2[lp : lp + nr_windows] - cs2[:nr_windows]
+    cross = fftconvolve(segment, pattern[::-1], mode="valid")
+    diffs = sum_t2 - 2 * cross + np.dot(pattern, pattern)
+
+    diffs = diffs[::stepSize]
+    x = np.argmin(diffs)
+    return (x * stepSize + start, diffs[x])
+
+
 def shiftTrace(trace, shiftValue, fill_value=0):
     """
     :param trace: Input trace (to shift)
@@ -172,16 +439,30 @@ def shiftTrace(trace, shiftValue, fill_value=0):
     :param fill_value: fill missing values with this value. default 0.
     :return:
     """
-    result = np.empty_like(trace)
-    if shiftValue > 0:
-        result[:shiftValue] = fill_value
-        result[shiftValue:] = trace[:-shiftValue]
-    elif shiftValue < 0:
-        result[shiftValue:] = fill_value
-        result[:shiftValue] = trace[-shiftValue:]
+    if shiftValue == 0:
+        return trace
+    return shiftTraceInto(np.empty_like(trace), trace, shiftValue, fill_value)
+
+
+def shiftTraceInto(out, trace, shiftValue, fill_value=0):
+    """
+    same as shiftTrace, but writes the shifted trace into a preallocated buffer,
+    e.g. to reuse one buffer when trying many shift values
+    :param out: output buffer, same length as trace (must not be trace itself)
+    :param trace: Input trace (to shift)
+    :param shiftValue: positive (shift to right) or negative (shift to left) value
+    :param fill_value: fill missing values with this value. default 0.
+    :return: out
+    """
+    n = len(trace)
+    shiftValue = max(-n, min(n, shiftValue))
+    if shiftValue >= 0:
+        out[:shiftValue] = fill_value
+        out[shiftValue:] = trace[: n - shiftValue]
     else:
-        result = trace
-    return result
+        out[shiftValue:] = fill_value
+        out[:shiftValue] = trace[-shiftValue:]
+    return out
 
 
 # taken from PyAstronomy
@@ -276,78 +557,46 @@ def smooth(x, windowLen, window="flat"):
     return y[(windowLen // 2) : -(windowLen // 2)]
 
 
-@njit
+## find all gaps, i.e. runs of samples below (positive=True) or above
+## (positive=False) the threshold.
+## returns an int64 array of shape (nr_gaps, 2) with the first and the
+## last index of each gap, or None if the trace contains no gap
 def findGaps(trace, threshold, positive=True):
-    _len = len(trace)
-    _begin = 0
-    _end = 0
-    hasGap = False
-    i = 0
-    gaps = []
-    while i < _len:
-        if positive and trace[i] < threshold:
-            _begin = i
-            _end = i
-            j = i + 1
-            while j < _len:
-                if trace[j] < threshold:
-                    _end = j
-                    j += 1
-                else:
-                    gaps.append([_begin, _end])
-                    break
-            if j == _len:
-                if _end == (j - 1):
-                    gaps.append([_begin, _end])
-                break
-            i = j + 1
-        elif not positive and trace[i] > threshold:
-            _begin = i
-            _end = i
-            j = i + 1
-            while j < _len:
-                if trace[j] > threshold:
-                    _end = j
-                    j += 1
-                else:
-                    gaps.append([_begin, _end])
-                    break
-            if j == _len:
-                if _end == (j - 1):
-                    gaps.append([_begin, _end])
-                break
-            i = j + 1
-        else:
-            i += 1
-    if len(gaps) > 0:
-        return gaps
+    trace = np.asarray(trace)
+    if positive:
+        inGap = trace < threshold
     else:
+        inGap = trace > threshold
+    # +1 where a gap begins, -1 behind the last sample of a gap
+    edges = np.diff(inGap.astype(np.int8), prepend=0, append=0)
+    begins = np.flatnonzero(edges == 1)
+    if len(begins) == 0:
         return None
+    gaps = np.empty((len(begins), 2), dtype=np.int64)
+    gaps[:, 0] = begins
+    gaps[:, 1] = np.flatnonzero(edges == -1) - 1
+    return gaps
 
 
-@njit
 def findLargestGap(trace, threshold, positive=True):
     gaps = findGaps(trace, threshold=threshold, positive=positive)
     if gaps is None:
         return None
-    largest = 0
-    length = 0
-    for iGap, gap in enumerate(gaps):
-        if (gap[1] - gap[0]) > length:
-            length = gap[1] - gap[0]
-            largest = iGap
-    return gaps[largest]
+    return gaps[np.argmax(gaps[:, 1] - gaps[:, 0])]
 
 
 # dkl: was macht diese Funktion? Wird hier nicht einfach nur die Trace von
 # links nach rechts durchgegangen, und geschaut wann das letzte mal ein
 # wert über threshold existiert?
-@njit
-def findFirstPeak(trace, minDist=10, threshold=None, findMax=True):
+## walks from index begin in steps of step (+1/-1) up to (excluding) end and returns
+## [index, value] of the first peak over/under the threshold, which is followed by
+## more than minDist samples that are not higher/lower, or None
+@njit(cache=True)
+def _findPeak(trace, begin, end, step, minDist, threshold, findMax):
     hasPeak = False
-    peakPos = 0
-    i = 0
-    while i < len(trace):
+    peakPos = begin
+    i = begin
+    while (i - end) * step < 0:
         if findMax and trace[i] > trace[peakPos]:
             if threshold is None or trace[i] >= threshold:
                 hasPeak = True
@@ -357,9 +606,9 @@ def findFirstPeak(trace, minDist=10, threshold=None, findMax=True):
                 hasPeak = True
                 peakPos = i
         else:
-            if hasPeak and (i - peakPos) > minDist:
+            if hasPeak and (i - peakPos) * step > minDist:
                 break
-        i += 1
+        i += step
 
     if not hasPeak:
         return None
@@ -367,14 +616,19 @@ def findFirstPeak(trace, minDist=10, threshold=None, findMax=True):
         return [peakPos, trace[peakPos]]
 
 
-@njit
-def findLastPeak(trace, minDist=10, threshold=None, findMax=True):
-    peak = findFirstPeak(
-        trace[::-1], minDist=minDist, threshold=threshold, findMax=findMax
-    )
-    if not peak is None:
-        peak[0] = len(trace) - 1 - peak[0]
-    return peak
+## start: index to start the search at, the returned index is an index of trace
+## (no slice of the trace is needed to search behind an offset)
+@njit(cache=True)
+def findFirstPeak(trace, minDist=10, threshold=None, findMax=True, start=0):
+    return _findPeak(trace, start, len(trace), 1, minDist, threshold, findMax)
+
+
+## same as findFirstPeak, searching backwards from the end of the trace down to start.
+## The search stops minDist samples in front of the last peak, it does not scan the
+## whole trace
+@njit(cache=True)
+def findLastPeak(trace, minDist=10, threshold=None, findMax=True, start=0):
+    return _findPeak(trace, len(trace) - 1, start - 1, -1, minDist, threshold, findMax)
 
 
 def findPeaks(
@@ -476,6 +730,30 @@ def _plot(x, mph, mpd, threshold, edge, valley, ax, ind):
         plt.show()
 
 
+## non-maximum suppression for detectPeaks: visits the peaks in the given
+## order (highest first) and marks all peaks within mpd samples of a kept
+## peak as deleted (only the smaller ones if kpsh is True).
+## ind must be sorted by position, so only the neighbours inside the
+## mpd window are visited instead of all peaks
+@njit(cache=True)
+def _suppressClosePeaks(ind, heights, order, mpd, kpsh):
+    idel = np.zeros(ind.size, dtype=np.bool_)
+    for i in order:
+        if idel[i]:
+            continue
+        j = i - 1
+        while j >= 0 and ind[i] - ind[j] <= mpd:
+            if not kpsh or heights[i] > heights[j]:
+                idel[j] = True
+            j -= 1
+        j = i + 1
+        while j < ind.size and ind[j] - ind[i] <= mpd:
+            if not kpsh or heights[i] > heights[j]:
+                idel[j] = True
+            j += 1
+    return idel
+
+
 def detectPeaks(
     x,
     mph=None,
@@ -561,7 +839,7 @@ def detectPeaks(
     >>> detectPeaks(x, threshold = 2, show=True)
     """
 
-    x = np.atleast_1d(x).astype("float64")
+    x = np.atleast_1d(x).astype(_DSP_DTYPE)
     if x.size < 3:
         return np.array([], dtype=int)
     if valley:
@@ -571,8 +849,8 @@ def detectPeaks(
     # handle NaN's
     indnan = np.where(np.isnan(x))[0]
     if indnan.size:
-        x[indnan] = np.inf
-        dx[np.where(np.isnan(dx))[0]] = np.inf
+        x[indnan] = _DSP_DTYPE(np.inf)
+        dx[np.where(np.isnan(dx))[0]] = _DSP_DTYPE(np.inf)
     ine, ire, ife = np.array([[], [], []], dtype=int)
     if not edge:
         ine = np.where((np.hstack((dx, 0)) < 0) & (np.hstack((0, dx)) > 0))[0]
@@ -604,17 +882,8 @@ def detectPeaks(
         ind = np.delete(ind, np.where(dx < threshold)[0])
     # detect small peaks closer than minimum peak distance
     if ind.size and mpd > 1:
-        ind = ind[np.argsort(x[ind])][::-1]  # sort ind by peak height
-        idel = np.zeros(ind.size, dtype=bool)
-        for i in range(ind.size):
-            if not idel[i]:
-                # keep peaks with the same height if kpsh is True
-                idel = idel | (ind >= ind[i] - mpd) & (ind <= ind[i] + mpd) & (
-                    x[ind[i]] > x[ind] if kpsh else True
-                )
-                idel[i] = 0  # Keep current peak
-        # remove the small peaks and sort back the indices by their occurrence
-        ind = np.sort(ind[~idel])
+        order = np.argsort(x[ind])[::-1]  # visit the peaks by height
+        ind = ind[~_suppressClosePeaks(ind, x[ind], order, mpd, kpsh)]
 
     if show:
         if indnan.size:
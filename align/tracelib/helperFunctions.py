@@ -1,65 +1,342 @@
 import os
+import concurrent.futures
+import functools
 import hashlib
+import logging
+import mmap
+import pathlib
+import queue
+import re
+import shutil
+import threading
 import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# fastHash is only a fingerprint of the trace files, so it is created with
+# usedforsecurity=False (not restricted on FIPS systems, where OpenSSL may pick a
+# different implementation). sha256Hash checks the integrity of the files and keeps
+# the default.
+def _getFingerprintSha256Ctor():
+    try:
+        hashlib.sha256(usedforsecurity = False)
+    except TypeError:
+        return hashlib.sha256
+    return functools.partial(hashlib.sha256, usedforsecurity = False)
+
+_fingerprintSha256 = _getFingerprintSha256Ctor()
+
+# The fast hashes written to meta files are sha256 fingerprints, readable by every
+# installation. Comparisons within one process (fastCompare) use the faster BLAKE3
+# if it is installed (useBlake3). BLAKE3 fast hashes are marked as "b3:<hex>", meta
+# files with such hashes can be checked if blake3 is installed, see checkFastHash.
+try:
+    import blake3
+    HAS_BLAKE3 = True
+except ImportError:
+    HAS_BLAKE3 = False
+
+BLAKE3_PREFIX = 'b3:'
+
+def _fastHasher(useBlake3 = False):
+    if HAS_BLAKE3 and useBlake3:
+        return blake3.blake3(max_threads = blake3.blake3.AUTO)
+    return _fingerprintSha256()
+
+def _fastHashPrefix(useBlake3 = False):
+    return BLAKE3_PREFIX if HAS_BLAKE3 and useBlake3 else ''
+
+# read size of sha256Hash. The files are opened unbuffered (buffering = 0), so this is
+# the only buffer between the kernel and the hasher
+_HASH_BUFSIZE = 1 << 20
+
+# page cache hints for the hash functions, a no-op where posix_fadvise is not available
+def _fadvise(inFile, offset, length, advice):
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(inFile.fileno(), offset, length, getattr(os, advice))
  
 def checkDir(directory, unique = False):
-    if directory[-1] == '/':
-        directory = directory[:-1]
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-        return directory
+    # pathlib drops trailing (back)slashes on all platforms
+    path = pathlib.Path(directory)
+    if not path.exists():
+        path.mkdir(parents = True)
+        return str(path)
         
     if unique:
-        suffix = 1
-        while os.path.exists("{}_{}".format(directory,suffix)):
-            suffix += 1
-        os.mkdir("{}_{}".format(directory,suffix))
-        return "{}_{}".format(directory,suffix)
+        # next free suffix from one listing of the parent directory instead of
+        # probing directory_1, directory_2, ... one by one
+        pattern = re.compile(rf'^{re.escape(path.name)}_(\d+)$')
+        suffixes = [int(m.group(1)) for m in map(pattern.match, os.listdir(path.parent)) if m]
+        suffix = max(suffixes, default = 0) + 1
+        while True:
+            candidate = path.parent / f"{path.name}_{suffix}"
+            try:
+                candidate.mkdir()
+                break
+            except FileExistsError:
+                # created by a concurrent process in the meantime
+                suffix += 1
+        return str(candidate)
 
-    return directory
+    return str(path)
 
-def fastHash(fileName):
+# Copies a file like shutil.copy2 (dst may be a directory), but lets the kernel copy
+# the data with copy_file_range: no user space buffers, and a reflink instead of a
+# copy on copy-on-write filesystems. Falls back to shutil.copyfile (sendfile on
+# Linux) where copy_file_range is not available or fails (e.g. across filesystems on
+# older kernels).
+def fastCopy(src, dst):
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    copied = False
+    if hasattr(os, 'copy_file_range'):
+        try:
+            with open(src, 'rb', buffering = 0) as fsrc, open(dst, 'wb', buffering = 0) as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    n = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if n == 0:
+                        break
+                    remaining -= n
+            copied = remaining == 0
+        except OSError:
+            copied = False
+    if not copied:
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+    return dst
+
+# Hash cache: the digests of a file are stored in the sidecar file <fileName>.align-hashcache,
+# one line "algorithm,size,mtime_ns,digest" per algorithm. A digest is reused as long as
+# size and modification time of the file are unchanged. Failing to write the sidecar
+# (e.g. read-only trace directory) only disables the cache. The cache is opt-in
+# (useCache = True): reading trace sets must not write into their directories.
+HASHCACHE_SUFFIX = '.align-hashcache'
+
+def _readHashCache(cacheFile):
+    entries = {}
+    try:
+        with open(cacheFile, 'r') as f:
+            for line in f:
+                algorithm, size, mtime, digest = line.strip().split(',')
+                entries[algorithm] = (int(size), int(mtime), digest)
+    except (OSError, ValueError):
+        return {}
+    return entries
+
+def _cachedHash(fileName, algorithm, computeHash, useCache = False):
+    if not useCache:
+        return computeHash()
+    stat = os.stat(fileName)
+    cacheFile = fileName + HASHCACHE_SUFFIX
+    entries = _readHashCache(cacheFile)
+    if algorithm in entries and entries[algorithm][:2] == (stat.st_size, stat.st_mtime_ns):
+        return entries[algorithm][2]
+    digest = computeHash()
+    entries[algorithm] = (stat.st_size, stat.st_mtime_ns, digest)
+    _writeHashCache(cacheFile, entries)
+    return digest
+
+def _writeHashCache(cacheFile, entries):
+    tmpFile = "{}.{}.tmp".format(cacheFile, os.getpid())
+    try:
+        with open(tmpFile, 'w') as f:
+            for iAlgorithm, (size, mtime, iDigest) in entries.items():
+                f.write("{},{},{},{}\n".format(iAlgorithm, size, mtime, iDigest))
+        os.replace(tmpFile, cacheFile)
+    except OSError:
+        pass
+
+# useBlake3: BLAKE3 instead of sha256 if blake3 is installed, not for meta files
+# useCache: reuse/store the digest in the hash cache
+def fastHash(fileName, useBlake3 = False, useCache = False):
     if not os.path.isfile(fileName):
-        print("Helpers - FastHash: File {} not found!".format(fileName))
+        logger.warning("Helpers - FastHash: File %s not found!", fileName)
         return ''
-    
-    BLOCKSIZE = 16 * 1024
+    algorithm = 'fasthash-b3' if HAS_BLAKE3 and useBlake3 else 'fasthash-sha256'
+    return _cachedHash(fileName, algorithm, lambda: _computeFastHash(fileName, useBlake3), useCache)
 
-    fileSize = fileSize = os.path.getsize(fileName)
-    hasher = hashlib.sha256()
+_FASTHASH_BLOCKSIZE = 16 * 1024
 
-    with open(fileName, 'rb') as inFile:
-        if fileSize < 1024 * 1024:
-            hasher.update(inFile.read())
-        else:
-            hasher.update(inFile.read(BLOCKSIZE))
-            for iBlock in range(1,9):
-                inFile.seek(int(fileSize/10) * iBlock, 0)
-                hasher.update(inFile.read(BLOCKSIZE))
-            inFile.seek(-BLOCKSIZE, os.SEEK_END)
-            hasher.update(inFile.read(BLOCKSIZE))
-            hasher.update(str(fileSize).encode('utf-8'))
+# start offsets of the blocks sampled by fastHash in files of at least 1 MiB
+def _fastHashOffsets(size):
+    offsets = [int(size/10) * iBlock for iBlock in range(9)]
+    offsets.append(size - _FASTHASH_BLOCKSIZE)
+    return offsets
 
-    return hasher.hexdigest()
+# sampling policy of fastHash: small files are hashed completely, of larger ones
+# the blocks at _fastHashOffsets and the size
+def _fastHashUpdate(hasher, view, size):
+    if size < 1024 * 1024:
+        hasher.update(view)
+    else:
+        for offset in _fastHashOffsets(size):
+            hasher.update(view[offset:offset + _FASTHASH_BLOCKSIZE])
+        hasher.update(str(size).encode('utf-8'))
+
+def _computeFastHash(fileName, useBlake3):
+    fileSize = os.path.getsize(fileName)
+    hasher = _fastHasher(useBlake3)
+    if fileSize < mmap.PAGESIZE:
+        # a single read is cheaper than mapping a file smaller than one page
+        # (and empty files can not be mapped at all)
+        with open(fileName, 'rb', buffering = 0) as inFile:
+            hasher.update(inFile.readall())
+        return _fastHashPrefix(useBlake3) + hasher.hexdigest()
+
+    # the sampled blocks are hashed directly from the mapped pages, without copies
+    with open(fileName, 'rb', buffering = 0) as inFile, mmap.mmap(inFile.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+        with memoryview(mm) as view:
+            if fileSize >= 1024 * 1024:
+                if hasattr(mm, 'madvise'):
+                    mm.madvise(mmap.MADV_RANDOM)
+                # let the kernel fetch all sampled blocks at once
+                for offset in _fastHashOffsets(fileSize):
+                    _fadvise(inFile, offset, _FASTHASH_BLOCKSIZE, 'POSIX_FADV_WILLNEED')
+            _fastHashUpdate(hasher, view, fileSize)
+
+    return _fastHashPrefix(useBlake3) + hasher.hexdigest()
+
+# fastHash of data that is still in memory (e.g. the memmap a file was just recorded
+# into), equal to the fastHash of a file with this content
+def fastHashBuffer(data, useBlake3 = False):
+    hasher = _fastHasher(useBlake3)
+    with memoryview(data) as view, view.cast('B') as byteView:
+        _fastHashUpdate(hasher, byteView, byteView.nbytes)
+    return _fastHashPrefix(useBlake3) + hasher.hexdigest()
+
+# first stage of a file comparison: file size and the hash of the first fastHash block
+# (and the size). Differing files are usually told apart by this already,
+# without reading the other sampled blocks
+def fastHashStage1(fileName):
+    fileSize = os.path.getsize(fileName)
+    hasher = _fastHasher(useBlake3 = True)
+    with open(fileName, 'rb', buffering = 0) as inFile:
+        hasher.update(inFile.read(_FASTHASH_BLOCKSIZE))
+    hasher.update(str(fileSize).encode('utf-8'))
+    return (fileSize, hasher.hexdigest())
+
+# probabilistic comparison of two files like fastHash, with early exits:
+# file size, then fastHashStage1 and only for files matching so far the full fastHash
+def fastCompare(fileNameA, fileNameB):
+    if os.path.getsize(fileNameA) != os.path.getsize(fileNameB):
+        return False
+    if fastHashStage1(fileNameA) != fastHashStage1(fileNameB):
+        return False
+    return fastHash(fileNameA, useBlake3 = True) == fastHash(fileNameB, useBlake3 = True)
 
-def sha256Hash(fileName):
+# compares a stored fast hash with the file, the prefix selects BLAKE3 or sha256.
+# BLAKE3 fast hashes can't be checked without the blake3 package, they fail the check
+# with a warning (the sha256 of the file can still be checked by a full check)
+def checkFastHash(fileName, expectedHash):
+    if expectedHash.startswith(BLAKE3_PREFIX):
+        if not HAS_BLAKE3:
+            logger.warning("Helpers - checkFastHash: blake3 is not installed, can't check the fast hash of %s", fileName)
+            return False
+        return fastHash(fileName, useBlake3 = True) == expectedHash
+    return fastHash(fileName) == expectedHash
+
+# reader thread of sha256Hash: fills the free buffers and passes (buffer, length)
+# to the hashing thread, followed by None at EOF (or the OSError if reading failed)
+def _readChunks(inFile, freeBuffers, filledBuffers):
+    try:
+        while True:
+            buf = freeBuffers.get()
+            n = inFile.readinto(buf)
+            if not n:
+                break
+            filledBuffers.put((buf, n))
+    except OSError as e:
+        filledBuffers.put(e)
+    filledBuffers.put(None)
+
+# useCache: reuse/store the digest in the hash cache. Off by default: sha256Hash is the
+# full integrity check and has to read the file, size and mtime in the cache don't
+# prove that the content is unchanged
+def sha256Hash(fileName, useCache = False):
     if not os.path.isfile(fileName):
-        print("Helpers - sha256Hash: File {} not found!".format(fileName))
+        logger.warning("Helpers - sha256Hash: File %s not found!", fileName)
         return ''
-    
-    BLOCKSIZE = 16 * 1024
+    return _cachedHash(fileName, 'sha256', lambda: _computeSha256Hash(fileName), useCache)
+
+def _computeSha256Hash(fileName):
+    # the mapped file is handed to hashlib in one update: no copy into python buffers
+    # and no python loop, the kernel reads ahead (MADV_SEQUENTIAL) while hashing
+    hasher = hashlib.sha256()
+    try:
+        with open(fileName, 'rb', buffering = 0) as inFile, mmap.mmap(inFile.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+            if hasattr(mm, 'madvise'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            hasher.update(mm)
+            # drop the (possibly multi GB) file from the page cache afterwards
+            # instead of evicting data that is still in use
+            _fadvise(inFile, 0, 0, 'POSIX_FADV_DONTNEED')
+        return hasher.hexdigest()
+    except (ValueError, OverflowError, OSError):
+        # empty files (or files too large for the address space) can not be mapped
+        return _computeSha256HashStream(fileName)
+
+def _computeSha256HashStream(fileName):
+    # _HASH_BUFSIZE buffers, read without python's BufferedReader in between.
+    # A reader thread fills the next buffers while this thread hashes the current one
+    # (hashlib releases the GIL while hashing), so disk and hashing time overlap.
+    # Reading and hashing run in C (readinto, OpenSSL), the python work per chunk
+    # is negligible: this is as fast as hashlib.file_digest on cached files.
+    NRBUFFERS = 4
     hasher = hashlib.sha256()
+    freeBuffers = queue.Queue()
+    filledBuffers = queue.Queue()
+    for iBuffer in range(NRBUFFERS):
+        freeBuffers.put(memoryview(bytearray(_HASH_BUFSIZE)))
 
-    with open(fileName, 'rb') as inFile:
-        for block in iter(lambda: inFile.read(BLOCKSIZE), b''):
-            hasher.update(block)
+    with open(fileName, 'rb', buffering = 0) as inFile:
+        # larger readahead, and drop the (possibly multi GB) file from the page
+        # cache afterwards instead of evicting data that is still in use
+        _fadvise(inFile, 0, 0, 'POSIX_FADV_SEQUENTIAL')
+        reader = threading.Thread(target = _readChunks, args = (inFile, freeBuffers, filledBuffers), daemon = True)
+        reader.start()
+        error = None
+        while True:
+            item = filledBuffers.get()
+            if item is None:
+                break
+            if isinstance(item, OSError):
+                error = item
+                continue
+            buf, n = item
+            hasher.update(buf[:n])
+            freeBuffers.put(buf)
+        reader.join()
+        if error is not None:
+            raise error
+        _fadvise(inFile, 0, 0, 'POSIX_FADV_DONTNEED')
 
     return hasher.hexdigest()
 
+# hashes several files in parallel threads (hashlib releases the GIL while hashing and
+# reading), returns a dict fileName -> hex digest
+def _hashMany(hashFunction, fileNames, useCache):
+    fileNames = list(fileNames)
+    if not fileNames:
+        return {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers = min(8, len(fileNames), os.cpu_count() or 1)) as executor:
+        digests = executor.map(lambda fileName: hashFunction(fileName, useCache = useCache), fileNames)
+        return dict(zip(fileNames, digests))
+
+def sha256HashMany(fileNames, useCache = False):
+    return _hashMany(sha256Hash, fileNames, useCache)
+
+def fastHashMany(fileNames, useCache = False):
+    return _hashMany(fastHash, fileNames, useCache)
+
+# item size of a dtype (or dtype name like 'int16'), without parsing it on every call
+@functools.lru_cache(maxsize = 32)
+def _itemsize(dtype):
+    return np.dtype(dtype).itemsize
+
 def checkFileSize(fileName, nrTraces, length, dtype):
-    dtype = np.dtype(dtype)
     fileSize = os.path.getsize(fileName)
-    arraySize = dtype.itemsize * nrTraces * length
+    arraySize = _itemsize(dtype) * nrTraces * length
     if not fileSize == (arraySize):
         return False
     return True
@@ -67,21 +344,26 @@ def checkFileSize(fileName, nrTraces, length, dtype):
 def getSpareBytes(fileName, nrTraces, length, dtype):
     spareBytes = 0
     fileSize = os.path.getsize(fileName)
-    arraySize = dtype.itemsize * nrTraces * length
+    itemsize = _itemsize(dtype)
+    arraySize = itemsize * nrTraces * length
     if not fileSize == (arraySize):
-        print("Warning: Size of {} ({}) and size of array ({} * {} * {} = {}) do not match!".\
-            format(fileName,fileSize,dtype.itemsize, nrTraces, length, arraySize))
+        logger.warning("Size of %s (%s) and size of array (%s * %s * %s = %s) do not match!",
+            fileName, fileSize, itemsize, nrTraces, length, arraySize)
         if fileSize < arraySize: raise ValueError("Size missmatch! File size < array size")
         else:
-            if ((fileSize - arraySize) % nrTraces) == 0:
-                spareBytes = int((fileSize - arraySize) / nrTraces)
-                print("Found exactly {} additional byte(s) per Trace (EOL char?).".format(spareBytes))
-                print("Adding them to # of sample points")
+            spareBytesPerTrace, rest = divmod(fileSize - arraySize, nrTraces)
+            if rest == 0:
+                spareBytes = spareBytesPerTrace
+                logger.warning("Found exactly %s additional byte(s) per Trace (EOL char?). "
+                    "Adding them to # of sample points", spareBytes)
     return spareBytes
 
 def getMaximumTracesInFile(fileName, length, dtype):
     fileSize = os.path.getsize(fileName)
-    traceSize = dtype.itemsize * length
-    if not (fileSize % traceSize) == 0:
-        print("Warning: File contains no integer number of traces!")
-    return int(fileSize / traceSize)
\ No newline at end of file
+    traceSize = _itemsize(dtype) * length
+    if traceSize == 0:
+        raise ValueError("Trace size is 0 (length {}, dtype {})".format(length, dtype))
+    nrTraces, rest = divmod(fileSize, traceSize)
+    if rest:
+        logger.warning("File %s contains no integer number of traces!", fileName)
+    return nrTraces
\ No newline at end of file
@@ -3,16 +3,30 @@
 """
 
 import os, io
+import stat
 import sys
-from shutil import copy2
 import datetime
 import hashlib
+import json
+import mmap
+import queue
+import threading
 import configparser as configParser
 import numpy as np
 import align.tracelib.helperFunctions as helper
 
 # TraceData library version
 VERSION = "0.2"
+META_CACHE_SUFFIX = ".cache.json"
+# DataObject.reduceFrom copies the selected traces in blocks of this size (bytes)
+REDUCE_BLOCKSIZE = 64 * 1024 * 1024
+# size of the write buffer (DIRECTWRITE) and hash blocks of recording DataObjects
+WRITE_BUFSIZE = 1024 * 1024
+# number of write buffers of ASYNCWRITE recordings (one filled by addTrace, the others
+# queued for or being written by the writer thread)
+ASYNCWRITE_BUFFERS = 4
+# number of traces DataObject.iterTraces asks the kernel to read ahead
+READAHEAD_TRACES = 4
 
 
 class MetaObject(configParser.ConfigParser, object):
@@ -23,6 +37,8 @@ class MetaObject(configParser.ConfigParser, object):
         self._okCipher = False
         self._okKey = False
         self.isLegacy = False
+        # sections whose fast hash was set while recording (see setFastHash)
+        self._hashedInSession = set()
 
         if not fileName == None:
             self.load(fileName)
@@ -78,7 +94,7 @@ class MetaObject(configParser.ConfigParser, object):
             while os.path.exists("{}_{}".format(self.path + baseName, suffix)):
                 suffix += 1
             baseName = "{}_{}".format(baseName, suffix)
-        copy2(fileName, self.path + baseName)
+        helper.fastCopy(fileName, self.path + baseName)
         return baseName
 
     def _setFileName(self, fileName):
@@ -101,23 +117,68 @@ class MetaObject(configParser.ConfigParser, object):
     def writeMetaFile(self):
         with open(self.fileName, "w") as configFile:
             self.write(configFile, space_around_delimiters=True)
+        # the parsed cache of the old content is invalid now
+        try:
+            os.remove(self.fileName + META_CACHE_SUFFIX)
+        except OSError:
+            pass
+
+    # The parsed content of a meta file can be cached as json next to it
+    # (<fileName>.cache.json) together with size and mtime of the meta file,
+    # so opening the same data set again skips parsing the ini file. The cache is
+    # opt-in (load(useCache=True)): opening a data set must not write into its directory
+    def _readCache(self, fileName):
+        try:
+            fileStat = os.stat(fileName)
+            with open(fileName + META_CACHE_SUFFIX, "r") as cacheFile:
+                cache = json.load(cacheFile)
+            if not (
+                cache["size"] == fileStat.st_size
+                and cache["mtime"] == fileStat.st_mtime_ns
+            ):
+                return False
+            self.read_dict(cache["sections"])
+            return True
+        except (OSError, ValueError, KeyError, TypeError, configParser.Error):
+            return False
+
+    def _writeCache(self, fileName):
+        try:
+            fileStat = os.stat(fileName)
+            cache = {
+                "size": fileStat.st_size,
+                "mtime": fileStat.st_mtime_ns,
+                "sections": {
+                    section: dict(self.items(section, raw=True))
+                    for section in self.sections()
+                },
+            }
+            tmpFileName = "{}{}.{}.tmp".format(fileName, META_CACHE_SUFFIX, os.getpid())
+            with open(tmpFileName, "w") as cacheFile:
+                json.dump(cache, cacheFile)
+            os.replace(tmpFileName, fileName + META_CACHE_SUFFIX)
+        except OSError:
+            pass
 
     def save(self):
         self.writeMetaFile()
 
-    def load(self, fileName, fileStream=False):
+    def load(self, fileName, fileStream=False, useCache=False):
         if not fileStream:
             if not os.path.isfile(fileName):
                 print("MetaObject: Can't read meta information. File not found.")
                 return
 
-            try:
-                self.read(fileName)
-            # For older meta files without section headers -> one meta file for each data file
-            except configParser.MissingSectionHeaderError:
-                with open(fileName, "r") as inFile:
-                    configString = "[DATA]\n" + inFile.read()
-                    self.read_string(configString)
+            if not (useCache and self._readCache(fileName)):
+                try:
+                    self.read(fileName)
+                # For older meta files without section headers -> one meta file for each data file
+                except configParser.MissingSectionHeaderError:
+                    with open(fileName, "r") as inFile:
+                        configString = "[DATA]\n" + inFile.read()
+                        self.read_string(configString)
+                if useCache:
+                    self._writeCache(fileName)
             self._setFileName(fileName)
         else:
             self.read_file(fileName)
@@ -165,15 +226,28 @@ class MetaObject(configParser.ConfigParser, object):
             self.set(name, "datafile", "")
             self.set(name, "sha256", "")
             self.set(name, "fasthash", "")
+            self._hashedInSession.discard(name)
 
     def _removeDataSection(self, name):
         if self.has_section(name):
             self.remove_section(name)
 
-    def addFixedKey(self, key, dtype=np.uint8, length=16):
+    # precomputeSchedule: store the round keys of an AES-128 key as "schedule" (hex, 11*16 bytes)
+    def addFixedKey(self, key, dtype=np.uint8, length=16, precomputeSchedule=True):
         self._addDataSection("KEY", dtype, length, "fixed")
         self.set("COMMON", "randomKey", "False")
-        self.set("KEY", "data", bytearray(key).hex())
+        self.set("KEY", "data", bytes(key).hex())
+        self.remove_option("KEY", "schedule")
+        algorithm = self.getAlgorithm()
+        if (
+            precomputeSchedule
+            and algorithm is not None
+            and algorithm.lower().startswith("aes128")
+            and len(bytes(key)) == 16
+        ):
+            from align.tracelib.ciphers.aes import keySchedule
+
+            self.set("KEY", "schedule", bytes(keySchedule(key)).hex())
         self._okKey = True
 
     def addKeyFile(self, fileName, dtype=np.uint8, length=16):
@@ -190,7 +264,7 @@ class MetaObject(configParser.ConfigParser, object):
     def addFixedPlain(self, plain, dtype=np.uint8, length=16):
         self._addDataSection("PLAINTEXT", dtype, length, "fixed")
         self.set("COMMON", "randomPlain", "False")
-        self.set("PLAINTEXT", "data", bytearray(plain).hex())
+        self.set("PLAINTEXT", "data", bytes(plain).hex())
         self._okPlain = True
 
     def addPlainFile(self, fileName, dtype=np.uint8, length=16):
@@ -207,7 +281,7 @@ class MetaObject(configParser.ConfigParser, object):
     def addFixedCipher(self, cipher, dtype=np.uint8, length=16):
         self._addDataSection("CIPHERTEXT", dtype, length, "fixed")
         self.set("COMMON", "randomCipher", "False")
-        self.set("CIPHERTEXT", "data", bytearray(cipher).hex())
+        self.set("CIPHERTEXT", "data", bytes(cipher).hex())
         self._okCipher = True
 
     def addCipherFile(self, fileName, dtype=np.uint8, length=16):
@@ -256,6 +330,11 @@ class MetaObject(configParser.ConfigParser, object):
     def setHash(self, section, hash):
         self.set(section, "sha256", hash)
 
+    # fast hash of a data file recorded in this session, complete() keeps it
+    def setFastHash(self, section, hash):
+        self.set(section, "fasthash", hash)
+        self._hashedInSession.add(section)
+
     def getAuxSections(self):
         return [x for x in self.sections() if x.startswith("AUX")]
 
@@ -283,33 +362,49 @@ class MetaObject(configParser.ConfigParser, object):
         else:
             return False
 
-    def _computeFastHash(self, section):
+    def _isFileSection(self, section):
+        return (
+            self.has_section(section)
+            and self.has_option(section, "type")
+            and self.get(section, "type") == "file"
+        )
+
+    def _computeFastHash(self, section, fastHash=None):
         if self.has_section(section):
-            if self.has_option(section, "type") and self.get(section, "type") == "file":
+            if self._isFileSection(section):
+                # self.path is the directory of the meta file, hash the data file only once
+                dataFileName = self.path + self.get(section, "datafile")
+                if fastHash is None:
+                    fastHash = helper.fastHash(dataFileName)
                 if self.has_option(section, "fasthash") and self.get(
                     section, "fasthash"
                 ):
-                    if not self.get(section, "fasthash") == helper.fastHash(
-                        self.path + self.get(section, "datafile")
+                    if not self.get(
+                        section, "fasthash"
+                    ) == fastHash and not helper.checkFastHash(
+                        dataFileName, self.get(section, "fasthash")
                     ):
                         print(
                             "Warning - MetaObject: Fast hash of {} file seems corrupted! Old file not removed or overwritten?".format(
                                 section
                             )
                         )
-                self.set(
-                    section,
-                    "fasthash",
-                    helper.fastHash(
-                        os.path.dirname(self.fileName)
-                        + "/"
-                        + self.get(section, "datafile")
-                    ),
-                )
+                self.set(section, "fasthash", fastHash)
 
     def _computeFastHashs(self):
-        for iSection in self.sections():
-            self._computeFastHash(iSection)
+        # the data files of the sections are independent, hash them in parallel
+        fileSections = [
+            x
+            for x in self.sections()
+            if self._isFileSection(x) and x not in self._hashedInSession
+        ]
+        fastHashs = helper.fastHashMany(
+            [self.path + self.get(x, "datafile") for x in fileSections]
+        )
+        for iSection in fileSections:
+            self._computeFastHash(
+                iSection, fastHashs[self.path + self.get(iSection, "datafile")]
+            )
 
     def _checkFileSize(self, section):
         return helper.checkFileSize(
@@ -319,14 +414,33 @@ class MetaObject(configParser.ConfigParser, object):
             dtype=np.dtype(self.get(section, "dtype")),
         )
 
+    def _expectedFileSize(self, section):
+        return (
+            int(self.get("COMMON", "nrTraces"))
+            * int(self.get(section, "length"))
+            * np.dtype(self.get(section, "dtype")).itemsize
+        )
+
+    # size of a regular file, None if it does not exist (one stat call)
+    @staticmethod
+    def _regularFileSize(fileName):
+        try:
+            fileStat = os.stat(fileName)
+        except OSError:
+            return None
+        return fileStat.st_size if stat.S_ISREG(fileStat.st_mode) else None
+
     def _checkSanitySection(self, section, inputDir=None):
         if self.has_section(section):
             if self.has_option(section, "type") and self.get(section, "type") == "file":
-                if not os.path.isfile(self.path + self.get(section, "datafile")):
+                fileSize = self._regularFileSize(
+                    self.path + self.get(section, "datafile")
+                )
+                if fileSize is None:
                     if not inputDir is None:
                         if os.path.isfile(inputDir + self.get(section, "datafile")):
                             try:
-                                copy2(
+                                helper.fastCopy(
                                     inputDir + self.get(section, "datafile"), self.path
                                 )
                                 if not self._checkFileSize(section):
@@ -353,7 +467,7 @@ class MetaObject(configParser.ConfigParser, object):
                                 section
                             )
                         )
-                elif not self._checkFileSize(section):
+                elif not fileSize == self._expectedFileSize(section):
                     print(
                         "Warning - MetaObject: {} file has incorrect size!".format(
                             section
@@ -395,20 +509,25 @@ class DataObject(object):
         self.data = None
         self.dtype = None  # data type for self.data, e.g. uint8, int8, int16 ...
         self.isFile = None
+        self.schedule = None  # AES round keys of a fixed key, (11, 16) uint8
         self._recording = False
-
-    def load(self):
-        self.dtype = np.dtype(self.metaObject.get(self.section, "dtype"))
-        self.length = int(self.metaObject.get(self.section, "length"))
-
-        if self.metaObject.get(self.section, "type") == "file":
-            self.fileName = self.metaObject.path + self.config.get(
-                self.section, "datafile"
-            )
+        self._traceWriters = {}  # type of the traces -> writer, see addTrace
+
+    # checkHash: verify the fast hash of complete data files. TraceData loads its data
+    # objects with the check on first access (see TraceData._channel)
+    def load(self, checkHash=True):
+        # all options of the section are read (and interpolated) once
+        options = dict(self.metaObject.items(self.section))
+        self.dtype = np.dtype(options["dtype"])
+        self.length = int(options["length"])
+
+        if options["type"] == "file":
+            self.fileName = self.metaObject.path + options["datafile"]
             self.isFile = True
             if self.metaObject.isComplete():
                 self.nrTraces = int(self.metaObject.get("COMMON", "nrTraces"))
-                self.checkHash(fullCheck=False, verbose=False)
+                if checkHash:
+                    self.checkHash(fullCheck=False, verbose=False)
                 spareBytes = helper.getSpareBytes(
                     self.fileName, self.nrTraces, self.length, self.dtype
                 )
@@ -423,11 +542,12 @@ class DataObject(object):
                 detectedTraces = helper.getMaximumTracesInFile(
                     self.fileName, self.length, self.dtype
                 )
+                expectedTraces = self.metaObject.getNrTraces()
                 print("WARNING - DataObject: Loading data with unknown status!")
-                if not detectedTraces == self.metaObject.getNrTraces():
+                if not detectedTraces == expectedTraces:
                     print(
                         "Try loading {} traces, expected {}".format(
-                            detectedTraces, self.metaObject.getNrTraces()
+                            detectedTraces, expectedTraces
                         )
                     )
                 self.data = np.memmap(
@@ -436,24 +556,33 @@ class DataObject(object):
                     mode="r",
                     shape=(detectedTraces, self.length),
                 )
-                if detectedTraces < self.metaObject.getNrTraces():
+                if detectedTraces < expectedTraces:
                     self.metaObject.setNrTraces(detectedTraces)
         else:
             self.isFile = False
-            self.data = np.array(
-                bytearray.fromhex(self.metaObject.get(self.section, "data")),
-                dtype=self.dtype,
-            )
-
-    def checkHash(self, fullCheck=True, verbose=True):
+            # one value per stored byte, as written by addFixedKey/Plain/Cipher
+            self.data = np.frombuffer(
+                bytes.fromhex(options["data"]),
+                dtype=np.uint8,
+            ).astype(self.dtype)
+            if "schedule" in options:
+                self.schedule = np.frombuffer(
+                    bytes.fromhex(options["schedule"]),
+                    dtype=np.uint8,
+                ).reshape(11, 16)
+
+    # computedHash: fast/sha256 hash of the data file if it is already known
+    def checkHash(self, fullCheck=True, verbose=True, computedHash=None):
         if not self.isFile:
             if verbose:
                 print("DataObject: No file -> No hash")
             return
         try:
             if not fullCheck:
-                if not helper.fastHash(self.fileName) == self.metaObject.get(
-                    self.section, "fasthash"
+                savedHash = self.metaObject.get(self.section, "fasthash")
+                if not (
+                    computedHash == savedHash
+                    or helper.checkFastHash(self.fileName, savedHash)
                 ):
                     print(
                         "WARNING - DataObject: Saved and computed hash (fast) are not matching!"
@@ -461,9 +590,9 @@ class DataObject(object):
                 elif verbose:
                     print("DataObject: Correct hash (fast)")
             else:
-                if not helper.sha256Hash(self.fileName) == self.metaObject.get(
-                    self.section, "sha256"
-                ):
+                if computedHash is None:
+                    computedHash = helper.sha256Hash(self.fileName)
+                if not computedHash == self.metaObject.get(self.section, "sha256"):
                     print(
                         "WARNING - DataObject: Saved and computed hash (full) are not matching!"
                     )
@@ -474,41 +603,211 @@ class DataObject(object):
                 "WARNING - DataObject: Something crashed while checking hashes. Care?"
             )
 
+    # data: any C-contiguous buffer (bytes, bytearray, memoryview, ndarray) holding
+    # the raw bytes of one trace. It is written and hashed without copying it first
     def _addTraceRaw(self, data):
-        if not len(data) == (self.length * self.dtype.itemsize):
+        data = memoryview(data).cast("B")
+        if not data.nbytes == self._traceBytes:
             print(
                 "Warning - DataObject: Length mismatch! (Expected {}, got {})".format(
-                    self.length * self.dtype.itemsize, len(data)
+                    self._traceBytes, data.nbytes
                 )
             )
             return
 
-        if self._saveMethod == "DIRECTWRITE":
-            self.data.write(data)
-        elif self._saveMethod == "MEMMAP":
-            if self._recordsWritten >= self.nrTraces:
-                print(
-                    "Warning - DataObject: Can't write more traces into memmap! Ignoring trace."
-                )
-                return
-            self.data[self._recordsWritten] = np.frombuffer(data, dtype=self.dtype)
-        self._hasher.update(data)
+        if self._isMemmap and self._recordsWritten >= self.nrTraces:
+            print(
+                "Warning - DataObject: Can't write more traces into memmap! Ignoring trace."
+            )
+            return
+        if self._indexedWrites:
+            print(
+                "Warning - DataObject: Traces were added with addTraceAt, use it for all traces! Ignoring trace."
+            )
+            return
+        self._bufferedWrite(data)
         self._recordsWritten += 1
 
+    # DIRECTWRITE: traces are collected in a buffer of WRITE_BUFSIZE bytes, which is
+    # written and hashed as one block. Blocks larger than the buffer bypass it.
+    # ASYNCWRITE: as DIRECTWRITE, but full buffers are written and hashed by a writer
+    # thread (see _writeChunks) while the next traces are collected in another buffer.
+    # MEMMAP: traces are copied straight into the memmap (no intermediate buffer),
+    # which is hashed in blocks of WRITE_BUFSIZE bytes
+    def _bufferedWrite(self, data):
+        if self._isMemmap:
+            end = self._memmapOffset + data.nbytes
+            self._memmapBytes[self._memmapOffset : end] = np.frombuffer(
+                data, dtype=np.uint8
+            )
+            self._memmapOffset = end
+            if end - self._memmapHashed >= WRITE_BUFSIZE:
+                self._flushWriteBuffer()
+            return
+        bufferSize = len(self._writeBuffer)
+        if self._writeFill + data.nbytes > bufferSize:
+            self._flushWriteBuffer()
+        if data.nbytes < bufferSize:
+            self._writeBuffer[self._writeFill : self._writeFill + data.nbytes] = data
+            self._writeFill += data.nbytes
+        elif self._writerThread is None:
+            self.data.write(data)
+            self._hasher.update(data)
+        else:
+            # the writer thread only gets the own buffers, large blocks are copied in parts
+            for start in range(0, data.nbytes, bufferSize):
+                part = data[start : start + bufferSize]
+                self._writeBuffer[: part.nbytes] = part
+                self._writeFill = part.nbytes
+                self._flushWriteBuffer()
+
+    def _flushWriteBuffer(self):
+        if self._isMemmap:
+            self._hasher.update(
+                self._memmapBytes[self._memmapHashed : self._memmapOffset]
+            )
+            self._memmapHashed = self._memmapOffset
+        elif self._writeFill:
+            if self._writerThread is None:
+                block = memoryview(self._writeBuffer)[: self._writeFill]
+                self.data.write(block)
+                self._hasher.update(block)
+            else:
+                self._filledBuffers.put((self._writeBuffer, self._writeFill))
+                # blocks while all buffers are queued for writing
+                self._writeBuffer = self._freeBuffers.get()
+            self._writeFill = 0
+            self._raiseWriteError()
+
+    # ASYNCWRITE writer thread: writes and hashes the queued (buffer, length) blocks
+    # until None is queued. After a failed write the remaining blocks are only
+    # released (so the recording thread never waits for a free buffer forever), the
+    # exception is raised in the recording thread by _raiseWriteError
+    def _writeChunks(self):
+        while True:
+            item = self._filledBuffers.get()
+            if item is None:
+                break
+            buffer, length = item
+            if self._writeError is None:
+                try:
+                    block = memoryview(buffer)[:length]
+                    self.data.write(block)
+                    self._hasher.update(block)
+                except Exception as error:
+                    self._writeError = error
+            self._freeBuffers.put(buffer)
+
+    # ASYNCWRITE: raises the exception of a failed write of the writer thread
+    def _raiseWriteError(self):
+        if self._writerThread is not None and self._writeError is not None:
+            raise self._writeError
+
+    def _addTraceList(self, data):
+        self._addTraceRaw(bytearray(data))
+
+    def _addTraceNdarray(self, data):
+        self._addTraceRaw(np.ascontiguousarray(data))
+
+    # writer for the type of the traces passed to addTrace, resolved once per type
+    def _traceWriter(self, dataType):
+        writer = self._traceWriters.get(dataType)
+        if writer is None:
+            if issubclass(dataType, (bytes, bytearray, memoryview)):
+                writer = self._addTraceRaw
+            elif issubclass(dataType, list):
+                writer = self._addTraceList
+            elif issubclass(dataType, np.ndarray):
+                writer = self._addTraceNdarray
+            else:
+                return None
+            self._traceWriters[dataType] = writer
+        return writer
+
     def addTrace(self, data):
         if not self._recording:
             print("Error - DataObject: Not prepared for record, can't add trace!")
             return
-        if isinstance(data, bytes) or isinstance(data, bytearray):
-            self._addTraceRaw(data)
-        elif isinstance(data, list):
-            self._addTraceRaw(bytearray(data))
-        elif isinstance(data, np.ndarray):
-            self._addTraceRaw(data.tobytes())
-        else:
+        writer = self._traceWriters.get(type(data)) or self._traceWriter(type(data))
+        if writer is None:
             print(
                 "Error - DataObject: Unsupported data format! Try bytearray, list or numpy.ndarray."
             )
+            return
+        writer(data)
+
+    def addTracesBatch(self, data):
+        """
+        adds several traces at once, written with one write/slice assignment and
+        hashed as one block (same file and hash as adding them one by one)
+        :param data: array of shape (nrTraces, length) with the dtype of this object
+        """
+        if not self._recording:
+            print("Error - DataObject: Not prepared for record, can't add traces!")
+            return
+        data = np.ascontiguousarray(data, dtype=self.dtype)
+        if not (data.ndim == 2 and data.shape[1] == self.length):
+            print(
+                "Warning - DataObject: Shape mismatch! (Expected (n, {}), got {})".format(
+                    self.length, data.shape
+                )
+            )
+            return
+
+        if (
+            self._isMemmap
+            and self._recordsWritten + data.shape[0] > self.nrTraces
+        ):
+            print(
+                "Warning - DataObject: Can't write more traces into memmap! Ignoring traces."
+            )
+            return
+        if self._indexedWrites:
+            print(
+                "Warning - DataObject: Traces were added with addTraceAt, use it for all traces! Ignoring traces."
+            )
+            return
+        self._bufferedWrite(memoryview(data).cast("B"))
+        self._recordsWritten += data.shape[0]
+
+    def addTraceAt(self, index, data):
+        """
+        writes one trace into row index of a MEMMAP record, e.g. if the traces of a
+        measurement are completed out of order. The sha256 of the file is then computed
+        from the memmap in finishRecord. Can't be mixed with addTrace/addTracesBatch in
+        one record, writing a row again replaces the trace
+        :param index: row of the trace, 0 <= index < nrTraces
+        :param data: trace with length values (converted to the dtype of this object)
+        """
+        if not (self._recording and self._isMemmap):
+            print("Error - DataObject: addTraceAt needs a record with saveMethod MEMMAP!")
+            return
+        if self._memmapOffset:
+            print(
+                "Warning - DataObject: Traces were added with addTrace, addTraceAt can't be mixed with it! Ignoring trace."
+            )
+            return
+        if not 0 <= index < self.nrTraces:
+            print(
+                "Warning - DataObject: Trace index {} out of range! Ignoring trace.".format(
+                    index
+                )
+            )
+            return
+        data = np.asarray(data)
+        if not data.size == self.length:
+            print(
+                "Warning - DataObject: Length mismatch! (Expected {}, got {})".format(
+                    self.length, data.size
+                )
+            )
+            return
+        self.data[index] = data.reshape(-1)
+        self._indexedWrites = True
+        # rows written again are counted once
+        if not self._writtenRows[index]:
+            self._writtenRows[index] = True
+            self._recordsWritten += 1
 
     def prepareForRecord(
         self, fileName, nrTraces, length, dtype, saveMethod="DIRECTWRITE"
@@ -518,34 +817,142 @@ class DataObject(object):
         self._recordsWritten = 0
         self._recording = True
         self._hasher = hashlib.sha256()
+        self._recordFileName = fileName
 
         self.nrTraces = int(nrTraces)
         self.length = int(length)
         self.dtype = np.dtype(dtype)
-
-        if self._saveMethod == "DIRECTWRITE":
-            self.data = open(fileName, "w+b")
+        # fixed for the whole recording, checked for every trace
+        self._traceBytes = self.length * self.dtype.itemsize
+        self._isMemmap = self._saveMethod == "MEMMAP"
+        # set by addTraceAt (MEMMAP): the rows were not written (and hashed) in order
+        self._indexedWrites = False
+
+        self._writerThread = None
+        if self._saveMethod in ("DIRECTWRITE", "ASYNCWRITE"):
+            # unbuffered, writes are collected in self._writeBuffer
+            self.data = open(fileName, "w+b", buffering=0)
+            self._writeBuffer = bytearray(WRITE_BUFSIZE)
+            self._writeFill = 0
+            if self._saveMethod == "ASYNCWRITE":
+                self._filledBuffers = queue.Queue()
+                self._freeBuffers = queue.Queue()
+                for _ in range(ASYNCWRITE_BUFFERS - 1):
+                    self._freeBuffers.put(bytearray(WRITE_BUFSIZE))
+                self._writeError = None
+                self._writerThread = threading.Thread(
+                    target=self._writeChunks, daemon=True
+                )
+                self._writerThread.start()
         elif self._saveMethod == "MEMMAP":
             self.data = np.memmap(
                 fileName, dtype=dtype, mode="w+", shape=(self.nrTraces, self.length)
             )
+            # byte view of the memmap, written up to _memmapOffset, hashed up to _memmapHashed
+            self._memmapBytes = self.data.reshape(-1).view(np.uint8)
+            self._memmapOffset = 0
+            self._memmapHashed = 0
+            # rows written by addTraceAt
+            self._writtenRows = np.zeros(self.nrTraces, dtype=bool)
+
+    # ASYNCWRITE: writes the queued buffers and ends the writer thread. If a write
+    # failed, the file is closed and the exception is raised
+    def _stopWriterThread(self):
+        if self._writerThread is None:
+            return
+        self._filledBuffers.put(None)
+        self._writerThread.join()
+        self._writerThread = None
+        self._freeBuffers = None
+        if self._writeError is not None:
+            self._writeBuffer = None
+            self.data.close()
+            self._recording = False
+            raise self._writeError
 
     def finishRecord(self):
         if not self._recording:
             print("Warning - DataObject: Can't finish what was never started!")
             return
 
-        if self._saveMethod == "DIRECTWRITE":
+        try:
+            self._flushWriteBuffer()
+        finally:
+            self._stopWriterThread()
+        # The sha256 of the data was computed while writing. The fast hash is computed
+        # from the memmap or, for DIRECTWRITE/ASYNCWRITE, while the sampled blocks are still in
+        # the page cache. complete() does not hash this section again
+        if self._saveMethod in ("DIRECTWRITE", "ASYNCWRITE"):
+            self._writeBuffer = None
             self.data.close()
+            fastHash = helper.fastHash(self._recordFileName)
         elif self._saveMethod == "MEMMAP":
             self.data.flush()
+            fastHash = helper.fastHashBuffer(self._memmapBytes)
+            if self._indexedWrites:
+                self._hasher = hashlib.sha256()
+                for start in range(0, self._memmapBytes.nbytes, WRITE_BUFSIZE):
+                    self._hasher.update(
+                        self._memmapBytes[start : start + WRITE_BUFSIZE]
+                    )
+            self._memmapBytes = None
+            # release the writable mapping, the recorded traces stay readable
+            shape = self.data.shape
+            del self.data
+            self.data = np.memmap(
+                self._recordFileName, dtype=self.dtype, mode="r", shape=shape
+            )
 
-        self.metaObject.setHash(self.section, self._hasher.hexdigest())
+        sha256 = self._hasher.hexdigest()
+        self.metaObject.setHash(self.section, sha256)
+        self.metaObject.setFastHash(self.section, fastHash)
         if not self._recordsWritten == self.metaObject.getNrTraces():
             print(
                 "Warning - DataObject: Number of written records does not match nrTraces in config!"
             )
 
+    def iterTraces(self, start=0, stop=None, readAhead=READAHEAD_TRACES):
+        """
+        iterates over the traces of a loaded data file. While a trace is processed, the
+        following traces are already read: the kernel is asked (madvise WILLNEED) to
+        read them readAhead traces at a time, so the disk reads overlap with the
+        processing. Without madvise (e.g. on Windows) the traces are just iterated
+        :param start: first trace
+        :param stop: end (excluded), all traces if None
+        :param readAhead: number of traces read ahead at least
+        """
+        if stop is None:
+            stop = self.data.shape[0]
+        if not (
+            isinstance(self.data, np.memmap)
+            and hasattr(mmap, "MADV_WILLNEED")
+            and readAhead >= 1
+            and start < stop
+        ):
+            for iTrace in range(start, stop):
+                yield self.data[iTrace]
+            return
+
+        # the traces are read through self.data, the advice is given through an own
+        # mapping of the file (both share the page cache)
+        with open(self.fileName, "rb") as inFile, mmap.mmap(
+            inFile.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            # byte position of the traces in the file, advised in whole pages
+            dataStart = self.data.offset
+            traceBytes = self.data.strides[0]
+            advised = start
+            for iTrace in range(start, stop):
+                if advised < stop and advised <= iTrace + readAhead:
+                    end = min(advised + readAhead, stop)
+                    first = dataStart + advised * traceBytes
+                    first -= first % mmap.PAGESIZE
+                    mm.madvise(
+                        mmap.MADV_WILLNEED, first, dataStart + end * traceBytes - first
+                    )
+                    advised = end
+                yield self.data[iTrace]
+
     def getSampleFrequency(self):
         if self.metaObject.has_option(self.section + "_SCOPE", "HORIZ_INTERVAL"):
             return (
@@ -577,20 +984,30 @@ class DataObject(object):
                 "Warning - DataObject.reduceFrom(): Length mismatch! Trace mask is shorter than input set."
             )
 
-        for iTrace in range(traceMask.shape[0]):
-            if traceMask[iTrace]:
-                self._addTraceRaw(inputData.data[iTrace].tobytes())
+        selected = np.flatnonzero(traceMask)
+        if not inputData.data.dtype == self.dtype:
+            # raw bytes are copied, as for addTrace
+            for iTrace in selected:
+                self._addTraceRaw(inputData.data[iTrace])
+            return
+        # copy the selected traces in blocks of about REDUCE_BLOCKSIZE bytes
+        traceSize = max(inputData.data[0].nbytes, 1)
+        blockTraces = max(REDUCE_BLOCKSIZE // traceSize, 1)
+        for iBlock in range(0, selected.shape[0], blockTraces):
+            self.addTracesBatch(inputData.data[selected[iBlock : iBlock + blockTraces]])
 
 
 class TraceData(object):
     def __init__(self, fileName=None):
         self.config = MetaObject()
-        self.hasKey = False
-        self.hasPlain = False
-        self.hasCipher = False
-        self.hasEM = False
-        self.hasPower = False
-        self.hasAux = False
+        # section name (KEY, PLAINTEXT, CIPHERTEXT, POWER, EM, AUX<name>) -> DataObject
+        self.channels = {}
+        # sections of an opened trace set whose DataObjects are not loaded yet
+        self._lazySections = []
+        # auxName -> DataObject of section AUX<auxName> (returned as self.aux)
+        self._aux = {}
+        # values assigned to hasKey, hasPlain, ... by section (AUX for hasAux)
+        self._hasValues = {}
         self._recording = False
 
         ### inputDir is used in newFrom method
@@ -667,9 +1084,9 @@ class TraceData(object):
                 shape=(self.nr_traces, 16),
             )
         if self.config.has_option("DATA", "key"):
-            self.key = np.array(
-                bytearray.fromhex(self.config.get("DATA", "key")), dtype=np.uint8
-            )
+            self.key = np.frombuffer(
+                bytes.fromhex(self.config.get("DATA", "key")), dtype=np.uint8
+            ).copy()
         if self.config.has_option("DATA", "keys"):
             self.keys = np.memmap(
                 self.config.path + self.config.get("DATA", "keys"),
@@ -678,48 +1095,120 @@ class TraceData(object):
                 shape=(self.nr_traces, 16),
             )
 
-    def _loadKey(self):
-        if not self.config.has_section("KEY"):
-            return
-        self.key = DataObject(self.config, "KEY")
-        self.key.load()
-        self.hasKey = True
-
-    def _loadPlain(self):
-        if not self.config.has_section("PLAINTEXT"):
-            return
-        self.plain = DataObject(self.config, "PLAINTEXT")
-        self.plain.load()
-        self.hasPlain = True
-
-    def _loadCipher(self):
-        if not self.config.has_section("CIPHERTEXT"):
-            return
-        self.cipher = DataObject(self.config, "CIPHERTEXT")
-        self.cipher.load()
-        self.hasCipher = True
-
-    def _loadPower(self):
-        if not self.config.has_section("POWER"):
-            return
-        self.power = DataObject(self.config, "POWER")
-        self.power.load()
-        self.hasPower = True
+    # attribute names of the DataObjects of the data sections (and the section "AUX<name>"
+    # of auxiliary data, as dict aux[<name>])
+    _CHANNEL_ATTRIBUTES = {
+        "key": "KEY",
+        "plain": "PLAINTEXT",
+        "cipher": "CIPHERTEXT",
+        "power": "POWER",
+        "em": "EM",
+    }
+
+    def _hasChannel(self, section):
+        return section in self.channels or section in self._lazySections
+
+    def _auxSections(self):
+        return [
+            x
+            for x in list(self.channels) + self._lazySections
+            if x.startswith("AUX")
+        ]
+
+    # hasKey, hasPlain, ...: derived from the registered/opened sections. A value
+    # assigned to them is returned instead until the section is (un)registered or
+    # another trace set is opened
+    def _has(self, section):
+        if section in self._hasValues:
+            return self._hasValues[section]
+        if section == "AUX":
+            return len(self._auxSections()) > 0
+        return self._hasChannel(section)
+
+    @property
+    def hasKey(self):
+        return self._has("KEY")
+
+    @hasKey.setter
+    def hasKey(self, value):
+        self._hasValues["KEY"] = value
+
+    @property
+    def hasPlain(self):
+        return self._has("PLAINTEXT")
+
+    @hasPlain.setter
+    def hasPlain(self, value):
+        self._hasValues["PLAINTEXT"] = value
+
+    @property
+    def hasCipher(self):
+        return self._has("CIPHERTEXT")
+
+    @hasCipher.setter
+    def hasCipher(self, value):
+        self._hasValues["CIPHERTEXT"] = value
+
+    @property
+    def hasPower(self):
+        return self._has("POWER")
+
+    @hasPower.setter
+    def hasPower(self, value):
+        self._hasValues["POWER"] = value
+
+    @property
+    def hasEM(self):
+        return self._has("EM")
+
+    @hasEM.setter
+    def hasEM(self, value):
+        self._hasValues["EM"] = value
+
+    @property
+    def hasAux(self):
+        return self._has("AUX")
+
+    @hasAux.setter
+    def hasAux(self, value):
+        self._hasValues["AUX"] = value
+
+    # The DataObjects of an opened trace set are created, loaded and (for complete sets)
+    # checked by their fast hash on first access (self.key, self.plain, ..., see
+    # __getattr__). open only registers the sections and checks their files (see
+    # _checkDataFiles)
+    def _channel(self, section):
+        if section in self._lazySections:
+            self._lazySections.remove(section)
+            dataObject = DataObject(self.config, section)
+            dataObject.load()
+            self.channels[section] = dataObject
+            if section.startswith("AUX"):
+                self._aux[section[3:]] = dataObject
+        return self.channels[section]
+
+    def __getattr__(self, name):
+        if name in TraceData._CHANNEL_ATTRIBUTES and "channels" in self.__dict__:
+            section = TraceData._CHANNEL_ATTRIBUTES[name]
+            if self._hasChannel(section):
+                return self._channel(section)
+        elif name == "aux" and "channels" in self.__dict__ and self.hasAux:
+            for x in [x for x in self._lazySections if x.startswith("AUX")]:
+                self._channel(x)
+            return self._aux
+        raise AttributeError(
+            "'{}' object has no attribute '{}'".format(type(self).__name__, name)
+        )
 
-    def _loadEM(self):
-        if not self.config.has_section("EM"):
-            return
-        self.em = DataObject(self.config, "EM")
-        self.em.load()
-        self.hasEM = True
-
-    def _loadAux(self):
-        for iAux in self.config.getAuxSections():
-            if not self.hasAux:
-                self.aux = {}
-            self.aux[iAux[3:]] = DataObject(self.config, iAux)
-            self.aux[iAux[3:]].load()
-            self.hasAux = True
+    def _loadSections(self):
+        self._lazySections = [
+            x
+            for x in ("KEY", "PLAINTEXT", "CIPHERTEXT", "POWER", "EM")
+            if self.config.has_section(x)
+        ] + self.config.getAuxSections()
+        self.channels = {}
+        self._aux = {}
+        self._hasValues = {}
 
     def _checkVersion(self):
         if self.config.getVersion() == VERSION:
@@ -750,12 +1239,57 @@ class TraceData(object):
         else:
             self._checkVersion()
             self.nrTraces = self.config.getNrTraces()
-            self._loadKey()
-            self._loadPlain()
-            self._loadCipher()
-            self._loadPower()
-            self._loadEM()
-            self._loadAux()
+            self._loadSections()
+            self._checkDataFiles()
+
+    # The data files are loaded on first access, open only checks that they exist and
+    # (for complete sets) are not truncated, with one stat call per file
+    def _checkDataFiles(self):
+        for iSection in self._lazySections:
+            if not self.config._isFileSection(iSection):
+                continue
+            fileName = self.config.path + self.config.get(iSection, "datafile")
+            fileSize = MetaObject._regularFileSize(fileName)
+            if fileSize is None:
+                raise FileNotFoundError(
+                    "TraceData: {} file {} not found!".format(iSection, fileName)
+                )
+            expectedSize = self.config._expectedFileSize(iSection)
+            if self.config.isComplete() and fileSize < expectedSize:
+                raise ValueError(
+                    "TraceData: {} file {} is truncated ({} < {} bytes)!".format(
+                        iSection, fileName, fileSize, expectedSize
+                    )
+                )
+
+    def getDataObjects(self):
+        return [
+            self._channel(x) for x in list(self.channels) + list(self._lazySections)
+        ]
+
+    # Checks the hashes of all data files on request, open does not call it (every
+    # data object only checks its fast hash when it is loaded)
+    def checkHashes(self, fullCheck=True, verbose=True):
+        # the data files are independent, hash them in parallel threads
+        dataObjects = self.getDataObjects()
+        fileNames = [x.fileName for x in dataObjects if x.isFile]
+        try:
+            if fullCheck:
+                computedHashes = helper.sha256HashMany(fileNames)
+            else:
+                computedHashes = helper.fastHashMany(fileNames)
+        except Exception:
+            computedHashes = {}
+        for iDataObject in dataObjects:
+            iDataObject.checkHash(
+                fullCheck=fullCheck,
+                verbose=verbose,
+                computedHash=(
+                    computedHashes.get(iDataObject.fileName)
+                    if iDataObject.isFile
+                    else None
+                ),
+            )
 
     def startRecord(
         self,
@@ -795,158 +1329,114 @@ class TraceData(object):
         self.config.set("COMMON", "version", VERSION)
         self.nrTraces = self.config.getNrTraces()
 
-    def registerKeyFile(
-        self, fileName, length=16, dtype=np.uint8, saveMethod="DIRECTWRITE"
+    # section: KEY, PLAINTEXT, CIPHERTEXT, POWER, EM or AUX (with auxName)
+    def registerFile(
+        self,
+        section,
+        fileName,
+        length,
+        dtype=np.uint8,
+        saveMethod="DIRECTWRITE",
+        auxName=None,
     ):
         if not self._recording:
             print(
                 "Warning - TraceData: Can't register file before new record was started!"
             )
             return
-        self.config.addKeyFile(fileName, dtype=dtype, length=length)
-        self.key = DataObject(self.config, "KEY")
-        self.key.prepareForRecord(
+        self._hasValues.pop(section, None)
+        if section == "AUX":
+            self.config.addAuxFile(fileName, auxName, dtype=dtype, length=length)
+            section = "AUX{}".format(auxName)
+        else:
+            addFile = {
+                "KEY": self.config.addKeyFile,
+                "PLAINTEXT": self.config.addPlainFile,
+                "CIPHERTEXT": self.config.addCipherFile,
+                "POWER": self.config.addPowerFile,
+                "EM": self.config.addEMFile,
+            }[section]
+            addFile(fileName, dtype=dtype, length=length)
+        dataObject = DataObject(self.config, section)
+        dataObject.prepareForRecord(
             fileName=self.config.path + os.path.basename(fileName),
             saveMethod=saveMethod,
             nrTraces=self.nrTraces,
             length=length,
             dtype=dtype,
         )
-        self.hasKey = True
+        self.channels[section] = dataObject
+        if auxName is not None:
+            self._aux[section[3:]] = dataObject
+
+    def registerKeyFile(
+        self, fileName, length=16, dtype=np.uint8, saveMethod="DIRECTWRITE"
+    ):
+        self.registerFile("KEY", fileName, length, dtype, saveMethod)
 
     def registerPlainFile(
         self, fileName, length=16, dtype=np.uint8, saveMethod="DIRECTWRITE"
     ):
-        if not self._recording:
-            print(
-                "Warning - TraceData: Can't register file before new record was started!"
-            )
-            return
-        self.config.addPlainFile(fileName, dtype=dtype, length=length)
-        self.plain = DataObject(self.config, "PLAINTEXT")
-        self.plain.prepareForRecord(
-            fileName=self.config.path + os.path.basename(fileName),
-            saveMethod=saveMethod,
-            nrTraces=self.nrTraces,
-            length=length,
-            dtype=dtype,
-        )
-        self.hasPlain = True
+        self.registerFile("PLAINTEXT", fileName, length, dtype, saveMethod)
 
     def registerCipherFile(
         self, fileName, length=16, dtype=np.uint8, saveMethod="DIRECTWRITE"
     ):
-        if not self._recording:
-            print(
-                "Warning - TraceData: Can't register file before new record was started!"
-            )
-            return
-        self.config.addCipherFile(fileName, dtype=dtype, length=length)
-        self.cipher = DataObject(self.config, "CIPHERTEXT")
-        self.cipher.prepareForRecord(
-            fileName=self.config.path + os.path.basename(fileName),
-            saveMethod=saveMethod,
-            nrTraces=self.nrTraces,
-            length=length,
-            dtype=dtype,
-        )
-        self.hasCipher = True
+        self.registerFile("CIPHERTEXT", fileName, length, dtype, saveMethod)
 
     def registerPowerFile(
         self, fileName, length, dtype=np.uint8, saveMethod="DIRECTWRITE"
     ):
-        if not self._recording:
-            print(
-                "Warning - TraceData: Can't register file before new record was started!"
-            )
-            return
-        self.config.addPowerFile(fileName, dtype=dtype, length=length)
-        self.power = DataObject(self.config, "POWER")
-        self.power.prepareForRecord(
-            fileName=self.config.path + os.path.basename(fileName),
-            saveMethod=saveMethod,
-            nrTraces=self.nrTraces,
-            length=length,
-            dtype=dtype,
-        )
-        self.hasPower = True
+        self.registerFile("POWER", fileName, length, dtype, saveMethod)
 
     def registerEMFile(
         self, fileName, length, dtype=np.uint8, saveMethod="DIRECTWRITE"
     ):
-        if not self._recording:
-            print(
-                "Warning - TraceData: Can't register file before new record was started!"
-            )
-            return
-        self.config.addEMFile(fileName, dtype=dtype, length=length)
-        self.em = DataObject(self.config, "EM")
-        self.em.prepareForRecord(
-            fileName=self.config.path + os.path.basename(fileName),
-            saveMethod=saveMethod,
-            nrTraces=self.nrTraces,
-            length=length,
-            dtype=dtype,
-        )
-        self.hasEM = True
+        self.registerFile("EM", fileName, length, dtype, saveMethod)
 
     def registerAuxFile(
         self, fileName, auxName, length, dtype=np.uint8, saveMethod="DIRECTWRITE"
     ):
-        if not self._recording:
-            print(
-                "Warning - TraceData: Can't register file before new record was started!"
-            )
-            return
-        self.config.addAuxFile(fileName, auxName, dtype=dtype, length=length)
-        if not self.hasAux:
-            self.aux = {}
-        self.aux[str(auxName)] = DataObject(self.config, "AUX{}".format(auxName))
-        self.aux[str(auxName)].prepareForRecord(
-            fileName=self.config.path + os.path.basename(fileName),
-            saveMethod=saveMethod,
-            nrTraces=self.nrTraces,
-            length=length,
-            dtype=dtype,
-        )
-        self.hasAux = True
+        self.registerFile("AUX", fileName, length, dtype, saveMethod, auxName=auxName)
 
     def unregisterKeyFile(self):
         self.config.removeKeyFile()
+        self.channels.pop("KEY", None)
+        self._hasValues.pop("KEY", None)
 
     def unregisterPlainFile(self):
         self.config.removePlainFile()
+        self.channels.pop("PLAINTEXT", None)
+        self._hasValues.pop("PLAINTEXT", None)
 
     def unregisterCipherFile(self):
         self.config.removeCipherFile()
+        self.channels.pop("CIPHERTEXT", None)
+        self._hasValues.pop("CIPHERTEXT", None)
 
     def unregisterPowerFile(self):
         self.config.removePowerFile()
+        self.channels.pop("POWER", None)
+        self._hasValues.pop("POWER", None)
 
     def unregisterEMFile(self):
         self.config.removeEMFile()
+        self.channels.pop("EM", None)
+        self._hasValues.pop("EM", None)
 
     def unregisterAuxFile(self, auxName):
         self.config.removeAuxFile(auxName)
+        self.channels.pop("AUX{}".format(auxName), None)
+        self._aux.pop(str(auxName), None)
+        self._hasValues.pop("AUX", None)
 
     def finishRecord(self, copyMissing=True):
         if not self._recording:
             print("Warning - TraceData: Can't finish record before record was started!")
             return
 
-        if self.hasKey:
-            self.key.finishRecord()
-        if self.hasPlain:
-            self.plain.finishRecord()
-        if self.hasCipher:
-            self.cipher.finishRecord()
-        if self.hasPower:
-            self.power.finishRecord()
-        if self.hasEM:
-            self.em.finishRecord()
-        if self.hasAux:
-            for iAux in self.config.getAuxSections():
-                self.aux[iAux[3:]].finishRecord()
+        for iDataObject in self.channels.values():
+            iDataObject.finishRecord()
 
         inputDir = self.inputDir if copyMissing else None
         self.config.complete(inputDir=inputDir)
@@ -3,6 +3,9 @@ import numpy as np
 from align.trigger.trigger import Trigger
 from align.tracelib.dsp import matchByCorrelation
 
+_LOGGER = logging.getLogger(__name__)
+# _LOGGER.setLevel(logging.DEBUG)
+
 
 # TODO !NOT yet ready to use!
 class MaxCorrelationTrigger(Trigger):
@@ -19,9 +22,7 @@ class MaxCorrelationTrigger(Trigger):
         ],
     )
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(self, input_data: any, trigger_parameter: dict) -> dict:
         try:
@@ -1,9 +1,25 @@
 import logging
 
+import numpy as np
 from numpy import ndarray
-from align.trigger.trigger import Trigger
+from align.trigger.trigger import Trigger, make_params_class
 from align.tracelib.dsp import matchRisingEdge, matchFallingEdge
 
+_LOGGER = logging.getLogger(__name__)
+# _LOGGER.setLevel(logging.DEBUG)
+
+EdgeParams = make_params_class("EdgeParams", [("threshold", float)])
+
+
+def _first_edges(mask: ndarray, offsets: ndarray) -> list[dict]:
+    """Returns the trigger results for the first True from the offset on in each row
+    of mask, like matchRisingEdge/matchFallingEdge
+    """
+    mask &= np.arange(mask.shape[1]) >= offsets[:, np.newaxis]
+    x = mask.argmax(axis=1)
+    x[~mask[np.arange(mask.shape[0]), x]] = -1
+    return [{"xmarks": [int(xi)] if xi >= 0 else []} for xi in x]
+
 
 class RisingEdgeTrigger(Trigger):
     """Trigger class to get a trigger point on a rising edge with given threshold"""
@@ -22,10 +38,9 @@ class RisingEdgeTrigger(Trigger):
             dict(name="threshold", type="float", default=1.0),
         ],
     )
+    _params_class = EdgeParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -40,26 +55,45 @@ class RisingEdgeTrigger(Trigger):
             offset to start the search from for trigger in input_data
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
         dict
             dictionary with the keyword "xmarks", which contains a list with the found x-coordinate of the rising edge.
         """
-        try:
-            threshold = trigger_parameter["threshold"][0]
-        except KeyError:
-            logging.error("unexpected trigger parameter: %s", trigger_parameter)
-            raise
+        threshold = self.parse_params(trigger_parameter).threshold
 
         self.logger.debug("offset: %s, threshold: %s", offset, threshold)
 
-        x_matches = []
         x = matchRisingEdge(input_data, offset, threshold)
-        if x != 0:
-            x_matches.append(x)
+        x_matches = [x] if x >= 0 else []
 
-        return dict(xmarks=x_matches)
+        return {"xmarks": x_matches}
+
+    def process_batch(
+        self, input_data: ndarray, offsets: ndarray, trigger_parameter: dict
+    ) -> list[dict]:
+        """Implements process_batch method from parent class Trigger with one comparison
+        over the whole batch
+
+        Parameters
+        ----------
+        input_data : ndarray
+            two dimensional array with one trace per row
+        offsets : ndarray
+            offset to start the search from for trigger in the corresponding row
+        trigger_parameter : dict
+            dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
+
+        Returns
+        -------
+        list
+            one dictionary with the keyword "xmarks" per row of input_data
+        """
+        threshold = self.parse_params(trigger_parameter).threshold
+        return _first_edges(input_data > threshold, np.asarray(offsets))
 
 
 class FallingEdgeTrigger(Trigger):
@@ -79,10 +113,9 @@ class FallingEdgeTrigger(Trigger):
             dict(name="threshold", type="float", default=1.0),
         ],
     )
+    _params_class = EdgeParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: any, offset: int, trigger_parameter: dict
@@ -97,23 +130,42 @@ class FallingEdgeTrigger(Trigger):
             offset to start the search from for trigger in input_data
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
         dict
             dictionary with the keyword "xmarks", which contains a list with the found x-coordinate of the falling edge.
         """
-        try:
-            threshold = trigger_parameter["threshold"][0]
-        except KeyError:
-            logging.error("unexpected filter parameter: %s", trigger_parameter)
-            raise
+        threshold = self.parse_params(trigger_parameter).threshold
 
         self.logger.debug("offset: %s, threshold: %s", offset, threshold)
 
-        x_matches = []
         x = matchFallingEdge(input_data, offset, threshold)
-        if x != 0:
-            x_matches.append(x)
+        x_matches = [x] if x >= 0 else []
+
+        return {"xmarks": x_matches}
+
+    def process_batch(
+        self, input_data: ndarray, offsets: ndarray, trigger_parameter: dict
+    ) -> list[dict]:
+        """Implements process_batch method from parent class Trigger with one comparison
+        over the whole batch
 
-        return dict(xmarks=x_matches)
+        Parameters
+        ----------
+        input_data : ndarray
+            two dimensional array with one trace per row
+        offsets : ndarray
+            offset to start the search from for trigger in the corresponding row
+        trigger_parameter : dict
+            dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
+
+        Returns
+        -------
+        list
+            one dictionary with the keyword "xmarks" per row of input_data
+        """
+        threshold = self.parse_params(trigger_parameter).threshold
+        return _first_edges(input_data < threshold, np.asarray(offsets))
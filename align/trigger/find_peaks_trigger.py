@@ -1,8 +1,24 @@
+import numpy as np
 from numpy import ndarray
-from align.trigger.trigger import Trigger
-from align.tracelib.dsp import findFirstPeak, findLastPeak
+from align.trigger.trigger import Trigger, make_params_class
+from align.tracelib.dsp import (
+    findFirstPeak,
+    findLastPeak,
+    matchAboveRange,
+    matchBelowRange,
+    matchRangeU8,
+)
 import logging
 
+_LOGGER = logging.getLogger(__name__)
+# _LOGGER.setLevel(logging.DEBUG)
+
+PeakParams = make_params_class("PeakParams", [("threshold", float)])
+ThresholdParams = make_params_class(
+    "ThresholdParams",
+    [("threshold", float), ("hysteresis", float), ("min_range", int), ("inverse", bool)],
+)
+
 
 # Filter that generate xmarks shall not return 'xmarks = None' if not peaks were found but return a empty list 'xmarks = []'
 # otherwise batch processing may produce wrong results
@@ -25,10 +41,9 @@ class FirstPeakFilter(Trigger):
             dict(name="threshold", type="float", default=1.0),
         ],
     )
+    _params_class = PeakParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -43,6 +58,7 @@ class FirstPeakFilter(Trigger):
             offset to start the search from for trigger in input_data_
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
@@ -50,27 +66,23 @@ class FirstPeakFilter(Trigger):
             dictionary with the keyword "xmarks", which contains a list with the found x-coordinate of the first peak.
         """
         peak = []
-        try:
-            threshold = trigger_parameter["threshold"][0]
-        except KeyError:
-            self.logger.error("unexpected trigger parameter: %s", trigger_parameter)
-            raise
+        threshold = self.parse_params(trigger_parameter).threshold
 
         self.logger.debug("threshold: %s", threshold)
 
         find_max = threshold >= 0
         min_dist = 10
 
-        found_peak = findFirstPeak(input_data[offset:], min_dist, threshold, find_max)
+        found_peak = findFirstPeak(input_data, min_dist, threshold, find_max, offset)
         if found_peak is not None:
-            peak.append(found_peak[0] + offset)
+            peak.append(int(found_peak[0]))
             self.logger.debug(
                 "found peak at: %s, value: %s", found_peak[0], found_peak[1]
             )
         else:
             self.logger.debug("didn't find a peak")
 
-        return dict(xmarks=peak)
+        return {"xmarks": peak}
 
 
 class LastPeakFilter(Trigger):
@@ -91,10 +103,9 @@ class LastPeakFilter(Trigger):
             dict(name="threshold", type="float", default=1.0),
         ],
     )
+    _params_class = PeakParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -109,6 +120,7 @@ class LastPeakFilter(Trigger):
             offset to start the search from for trigger in input_data
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
@@ -117,27 +129,23 @@ class LastPeakFilter(Trigger):
         """
 
         peak = []
-        try:
-            threshold = trigger_parameter["threshold"][0]
-        except KeyError:
-            self.logger.error("unexpected trigger parameter: %s", trigger_parameter)
-            raise
+        threshold = self.parse_params(trigger_parameter).threshold
 
         self.logger.debug("threshold: %s", threshold)
 
         find_max = threshold >= 0
         min_dist = 10
 
-        found_peak = findLastPeak(input_data[offset:], min_dist, threshold, find_max)
+        found_peak = findLastPeak(input_data, min_dist, threshold, find_max, offset)
         if found_peak is not None:
-            peak.append(found_peak[0])
+            peak.append(int(found_peak[0]))
             self.logger.debug(
                 "found peak at: %s, value: %s", found_peak[0], found_peak[1]
             )
         else:
             self.logger.debug("didn't find a peak")
 
-        return dict(xmarks=peak)
+        return {"xmarks": peak}
 
 
 class ThresholdTrigger(Trigger):
@@ -167,10 +175,9 @@ class ThresholdTrigger(Trigger):
             dict(name="inverse", type="bool", value=False, default=False),
         ],
     )
+    _params_class = ThresholdParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -185,6 +192,7 @@ class ThresholdTrigger(Trigger):
             offset to start the search from for trigger in input_data
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
@@ -193,14 +201,11 @@ class ThresholdTrigger(Trigger):
         """
 
         peaks = [None, None]
-        try:
-            threshold = trigger_parameter["threshold"][0]
-            hysteresis = trigger_parameter["hysteresis"][0]
-            min_range = trigger_parameter["min_range"][0]
-            inverse = trigger_parameter["inverse"][0]
-        except KeyError:
-            self.logger.error("unexpected filter parameter: %s", trigger_parameter)
-            raise
+        params = self.parse_params(trigger_parameter)
+        threshold = params.threshold
+        hysteresis = params.hysteresis
+        min_range = params.min_range
+        inverse = params.inverse
 
         self.logger.debug(
             "threshold: %s, hysteresis: %s, min_range: %s, inverse: %s",
@@ -210,33 +215,21 @@ class ThresholdTrigger(Trigger):
             inverse,
         )
 
-        i = offset
-        while i < len(input_data):
-            if not inverse:
-                if peaks[0] is None and input_data[i] >= (threshold + hysteresis):
-                    peaks[0] = i
-                elif peaks[0] is not None and input_data[i] <= (threshold - hysteresis):
-                    peaks[1] = i
-                    if peaks[1] - peaks[0] >= min_range:
-                        break
-                    else:
-                        peaks = [None, None]
-            else:
-                if peaks[0] is None and input_data[i] <= (threshold - hysteresis):
-                    peaks[0] = i
-                elif peaks[0] is not None and input_data[i] >= (threshold + hysteresis):
-                    peaks[1] = i
-                    if peaks[1] - peaks[0] >= min_range:
-                        break
-                    else:
-                        peaks = [None, None]
-
-            i += 1
-
+        upper = threshold + hysteresis
+        lower = threshold - hysteresis
+        if input_data.dtype == np.uint8:
+            # scans 8 samples at once
+            start, end = matchRangeU8(
+                input_data, offset, upper, lower, min_range, inverse
+            )
+        else:
+            # the scan function is picked once, it contains no branch on inverse
+            match_range = matchBelowRange if inverse else matchAboveRange
+            start, end = match_range(input_data, offset, upper, lower, min_range)
         # Ensure that always two peaks are returned
-        if peaks[0] is None or peaks[1] is None:
-            peaks = [None, None]
+        if start >= 0:
+            peaks = [start, end]
 
-        self.logger.debug("%s returns: %s", self._trigger_name, dict(xmarks=peaks))
+        self.logger.debug("%s returns: %s", self._trigger_name, peaks)
 
-        return dict(xmarks=peaks)
+        return {"xmarks": peaks}
@@ -1,6 +1,12 @@
 import logging
+import numpy as np
 from numpy import ndarray
-from align.trigger.trigger import Trigger
+from align.trigger.trigger import Trigger, make_params_class
+
+_LOGGER = logging.getLogger(__name__)
+# _LOGGER.setLevel(logging.DEBUG)
+
+HoldoffParams = make_params_class("HoldoffParams", [("holdoff", int)])
 
 
 class HoldoffTrigger(Trigger):
@@ -18,10 +24,9 @@ class HoldoffTrigger(Trigger):
             dict(name="holdoff", type="int"),
         ],
     )
+    _params_class = HoldoffParams
 
-    def __init__(self):
-        self.logger = logging.getLogger(__name__)
-        # self.logger.setLevel(logging.DEBUG)
+    logger = _LOGGER
 
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -36,22 +41,62 @@ class HoldoffTrigger(Trigger):
             offset to start the search from for trigger in input_data
         trigger_parameter : dict
             dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
 
         Returns
         -------
         dict
             dictionary which stores the found trigger point
         """
-        try:
-            holdoff = trigger_parameter["holdoff"][0]
-        except KeyError:
-            logging.error("unexpected trigger parameter: %s", trigger_parameter)
-            raise
+        holdoff = self.parse_params(trigger_parameter).holdoff
 
         self.logger.debug("offset: %s, holdoff: %s", offset, holdoff)
 
-        x_matches = []
-        if offset + holdoff < len(input_data):
-            x_matches.append(offset + holdoff)
+        return {"xmarks": self.apply(offset, holdoff, len(input_data))}
+
+    @staticmethod
+    def apply(offset: int, holdoff: int, trace_length: int) -> list:
+        """Adds the holdoff to the offset
+
+        Parameters
+        ----------
+        offset : int
+            offset (trigger point of the previous trigger)
+        holdoff : int
+            number of samples to add to the offset
+        trace_length : int
+            length of the trace
+
+        Returns
+        -------
+        list
+            list with offset + holdoff, empty if it is behind the end of the trace
+        """
+        x = offset + holdoff
+        return [x] if x < trace_length else []
 
-        return dict(xmarks=x_matches)
+    def process_batch(
+        self, input_data: ndarray, offsets: ndarray, trigger_parameter: dict
+    ) -> list[dict]:
+        """Implements process_batch method from parent class Trigger with one addition
+        over all offsets
+
+        Parameters
+        ----------
+        input_data : ndarray
+            two dimensional array with one trace per row
+        offsets : ndarray
+            offset (trigger point of the previous trigger) of each row
+        trigger_parameter : dict
+            dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
+
+        Returns
+        -------
+        list
+            one dictionary with the keyword "xmarks" per row of input_data
+        """
+        holdoff = self.parse_params(trigger_parameter).holdoff
+        x = np.asarray(offsets) + holdoff
+        found = x < input_data.shape[1]
+        return [{"xmarks": [int(xi)] if fi else []} for xi, fi in zip(x, found)]
@@ -2,6 +2,9 @@ from __future__ import annotations
 import importlib
 import inspect
 import logging
+import os
+import sys
+from dataclasses import make_dataclass
 from os import listdir
 from os.path import isfile, join
 from abc import ABC, abstractmethod
@@ -10,45 +13,89 @@ from pathlib import Path
 from numpy import ndarray
 
 
+# discovered trigger classes, keyed by trigger folder and its modification time
+# (adding or removing a trigger file invalidates the entry)
+_DISCOVERY_CACHE: dict[tuple[str, int], list[type]] = {}
+
+
+def _discover_trigger_classes(trigger_folder: Path) -> list[type]:
+    """Imports all modules in trigger_folder and returns the Trigger subclasses they contain
+
+    Parameters
+    ----------
+    trigger_folder : Path
+        folder with the trigger modules (files starting with '_' are skipped)
+
+    Returns
+    -------
+    list
+        the found Trigger subclasses
+    """
+    trigger_classes = []
+    files_in_triggers = [
+        f for f in listdir(trigger_folder) if isfile(join(trigger_folder, f))
+    ]
+    logging.debug("Files in trigger folders: %s", files_in_triggers)
+    trigger_module_names = []
+
+    for f in files_in_triggers:
+        if f.startswith("_"):
+            continue
+        trigger_module_names.append("align.trigger" + "." + f.replace(".py", ""))
+
+    logging.info("trigger_module_names: %s", trigger_module_names)
+
+    for trigger_module_name in trigger_module_names:
+        try:
+            module = importlib.import_module(trigger_module_name)
+            classes = [
+                cls_obj
+                for cls_name, cls_obj in inspect.getmembers(module)
+                if inspect.isclass(cls_obj)
+            ]
+
+            for cl in classes:
+                if cl != Trigger and issubclass(cl, Trigger):
+                    trigger_classes.append(cl)
+                    logging.debug("added class %s", cl.__name__)
+        except BaseException as error:
+            logging.error("Error while importing module: %s", error)
+            continue
+
+    return trigger_classes
+
+
+def make_params_class(cls_name: str, fields: list) -> type:
+    """Creates the frozen dataclass which holds the parsed parameters of a trigger
+
+    Parameters
+    ----------
+    cls_name : str
+        name of the new class
+    fields : list
+        list of (name, type) tuples, in the order of the trigger parameters
+
+    Returns
+    -------
+    type
+        the new dataclass (with __slots__ on Python >= 3.10)
+    """
+    if sys.version_info >= (3, 10):
+        return make_dataclass(cls_name, fields, frozen=True, slots=True)
+    return make_dataclass(cls_name, fields, frozen=True)
+
+
 class TriggerLoader:
     """This class searches in the trigger_folder ('./align/trigger') for files that
     contains subclasses from "Trigger" class and add them to a trigger list
     which contains valid AliGn triggers."""
 
     def __init__(self):
-        logging.getLogger(__name__)
-        self._trigger_classes = []
-
         trigger_folder = Path(__file__).resolve().parent
-        files_in_triggers = [
-            f for f in listdir(trigger_folder) if isfile(join(trigger_folder, f))
-        ]
-        logging.debug("Files in trigger folders: %s", files_in_triggers)
-        trigger_module_names = []
-
-        for f in files_in_triggers:
-            if f.startswith("_"):
-                continue
-            trigger_module_names.append("align.trigger" + "." + f.replace(".py", ""))
-
-        logging.info("trigger_module_names: %s", trigger_module_names)
-
-        for trigger_module_name in trigger_module_names:
-            try:
-                module = importlib.import_module(trigger_module_name)
-                classes = [
-                    cls_obj
-                    for cls_name, cls_obj in inspect.getmembers(module)
-                    if inspect.isclass(cls_obj)
-                ]
-
-                for cl in classes:
-                    if cl != Trigger and issubclass(cl, Trigger):
-                        self._trigger_classes.append(cl)
-                        logging.debug("added class %s", cl.__name__)
-            except BaseException as error:
-                logging.error("Error while importing module: %s", error)
-                continue
+        cache_key = (str(trigger_folder), os.stat(trigger_folder).st_mtime_ns)
+        if cache_key not in _DISCOVERY_CACHE:
+            _DISCOVERY_CACHE[cache_key] = _discover_trigger_classes(trigger_folder)
+        self._trigger_classes = list(_DISCOVERY_CACHE[cache_key])
 
         logging.info("Trigger classes available: %s", self._trigger_classes)
 
@@ -60,11 +107,9 @@ class TriggerLoader:
         list
             a list with all found trigger names
         """
-        trigger_names = []
-        for trigger_class in self._trigger_classes:
-            trgr = trigger_class()
-            trigger_names.append(trgr.get_trigger_name())
-        return trigger_names
+        return [
+            trigger_class.get_trigger_name() for trigger_class in self._trigger_classes
+        ]
 
     def get_trigger_by_name(self, trigger_name: str) -> Trigger | None:
         """Returns a Trigger object that matches the given name
@@ -81,15 +126,17 @@ class TriggerLoader:
             no matching trigger was found
         """
         for trigger_class in self._trigger_classes:
-            trgr = trigger_class()
-            if trigger_name == trgr.get_trigger_name():
-                return trgr
+            if trigger_name == trigger_class.get_trigger_name():
+                return trigger_class()
         return None
 
 
 class Trigger(ABC):
     """Abstract class for triggers
     _trigger_name and _trigger_options have to be defined in each subclass derived from this Trigger class
+
+    Loops over many traces should create the trigger, parse its parameters (parse_params)
+    and look up the bound process_data method once, and call that method per trace
     """
 
     _trigger_name = "example_trigger"
@@ -103,6 +150,17 @@ class Trigger(ABC):
             dict(name="parameter1", type="int"),
         ],
     )
+    ## class the parameters are stored in by parse_params, with one field per child
+    #  of _trigger_options (in the same order)
+    _params_class = make_params_class("ExampleParams", [("parameter1", int)])
+    ## names of the children of _trigger_options, set for each subclass by __init_subclass__
+    _param_names = ("parameter1",)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._param_names = tuple(
+            child["name"] for child in cls._trigger_options.get("children", [])
+        )
 
     @classmethod
     def get_trigger_name(cls) -> str:
@@ -126,6 +184,37 @@ class Trigger(ABC):
         """
         return cls._trigger_options
 
+    @classmethod
+    def parse_params(cls, trigger_parameter):
+        """Unpacks the trigger parameters into an instance of _params_class
+        Parsing them once and passing the result to process_data avoids the dictionary
+        lookups on every trace. Already parsed parameters are returned unchanged.
+
+        Parameters
+        ----------
+        trigger_parameter : dict
+            dictionary which contains the trigger(-specific) parameters
+
+        Returns
+        -------
+        _params_class
+            the parsed trigger parameters
+
+        Raises
+        ------
+        KeyError
+            if one of the parameters in _param_names is missing
+        """
+        if isinstance(trigger_parameter, cls._params_class):
+            return trigger_parameter
+        try:
+            return cls._params_class(
+                *[trigger_parameter[name][0] for name in cls._param_names]
+            )
+        except KeyError:
+            logging.error("unexpected trigger parameter: %s", trigger_parameter)
+            raise
+
     @abstractmethod
     def process_data(
         self, input_data: ndarray, offset: int, trigger_parameter: dict
@@ -141,9 +230,40 @@ class Trigger(ABC):
               start the search for trigger at this offset in input_data
           trigger_parameter : dict
               dictionary which contains the trigger(-specific) parameters
+              or the result of parse_params
 
           Returns
           -------
           dict
               dictionary with keyword 'xmarks' which contains a list with x-coordinations of one or more trigger points
+              (an empty list if no trigger point was found, index 0 is a valid trigger point)
         """
+
+    def process_batch(
+        self, input_data: ndarray, offsets: ndarray, trigger_parameter: dict
+    ) -> list[dict]:
+        """Searches the trigger points in several traces at once
+        The default implementation calls process_data for each trace, subclasses can
+        override it with a vectorized search over the whole batch
+
+        Parameters
+        ----------
+        input_data : ndarray
+            two dimensional array with one trace per row
+        offsets : ndarray
+            start the search for trigger at this offset in the corresponding row
+        trigger_parameter : dict
+            dictionary which contains the trigger(-specific) parameters
+            or the result of parse_params
+
+        Returns
+        -------
+        list
+            one result dictionary (as returned by process_data) per row of input_data
+        """
+        trigger_parameter = self.parse_params(trigger_parameter)
+        process_data = self.process_data
+        return [
+            process_data(trace, int(offset), trigger_parameter)
+            for trace, offset in zip(input_data, offsets)
+        ]
@@ -8,7 +8,7 @@ import pyqtgraph.parametertree as ptree
 # Needed for icons resoruces
 from align.resources import resources
 
-from PySide6.QtWidgets import QMainWindow, QStatusBar, QFrame, QSplitter
+from PySide6.QtWidgets import QGraphicsItem, QMainWindow, QStatusBar, QFrame, QSplitter
 
 from PySide6.QtCore import Qt, QPointF
 from PySide6.QtGui import QIcon, QAction
@@ -20,6 +20,28 @@ from align.filter.filter import FilterLoader
 from align.trigger.trigger import TriggerLoader
 from align.ui.ui_ProcessSettingsFrame import Ui_ProcessSettingsFrame
 
+# the plots can be drawn (and the curves with pyqtgraph's experimental GL painter)
+# with OpenGL if PyOpenGL is installed, long traces are slow to draw as QPainterPaths
+try:
+    import OpenGL
+
+    HAS_OPENGL = True
+except ImportError:
+    HAS_OPENGL = False
+
+
+def configure_opengl(use_opengl: bool) -> bool:
+    """Enables OpenGL drawing of the plots if requested and PyOpenGL is installed,
+    must be called before the main window is created. Returns if OpenGL is used"""
+    use_opengl = bool(use_opengl) and HAS_OPENGL
+    pg.setConfigOption("useOpenGL", use_opengl)
+    pg.setConfigOption("enableExperimental", use_opengl)
+    return use_opengl
+
+
+# maximum rates (per second) of the plot handlers of mouse moves and range changes
+MOUSE_MOVED_RATE_LIMIT = 60
+RANGE_CHANGED_RATE_LIMIT = 30
 
 ## initial ParameterTree children
 main_parameter_tree = [
@@ -102,10 +124,15 @@ class AliGnMainWindow(QMainWindow):
         self.vertical_line = None
         self.horizontal_line = None
         self.statusbar = None
+        self._range_changed_proxy = None
+        self._mouse_moved_proxy = None
 
-        self.peak_linear_region_item = pg.LinearRegionItem(
-            brush=pg.mkBrush(255, 20, 20, 80)
-        )
+        # brushes and pens are created once and shared by the items using them
+        self.peak_brush = pg.mkBrush(255, 20, 20, 80)
+        self.arrow_brush = pg.mkBrush(255, 20, 20)
+        self.crosshair_pen = pg.mkPen(200, 200, 100)
+
+        self.peak_linear_region_item = pg.LinearRegionItem(brush=self.peak_brush)
         self.peak_linear_region_item.setZValue(20)
 
     def init_gui(self, presenter: Presenter):
@@ -134,19 +161,18 @@ class AliGnMainWindow(QMainWindow):
         self.tree = ptree.ParameterTree(showHeader=False)
         self.tree.setParameters(self.tree_parameter)
 
-        self.tree_parameter.child("metafile").sigValueChanged.connect(
+        children = {child.name(): child for child in self.tree_parameter.children()}
+        children["metafile"].sigValueChanged.connect(
             presenter.handle_metafile_fileparameter_changed
         )
-        self.tree_parameter.child("data_files").sigTreeStateChanged.connect(
+        children["data_files"].sigTreeStateChanged.connect(
             presenter.handle_data_files_changed
         )
-        self.tree_parameter.child("ref_trace").sigValueChanged.connect(
+        children["ref_trace"].sigValueChanged.connect(presenter.handle_ref_trace_changed)
+        children["ref_trace_type"].sigValueChanged.connect(
             presenter.handle_ref_trace_changed
         )
-        self.tree_parameter.child("ref_trace_type").sigValueChanged.connect(
-            presenter.handle_ref_trace_changed
-        )
-        self.tree_parameter.child("trace_option_group").sigTreeStateChanged.connect(
+        children["trace_option_group"].sigTreeStateChanged.connect(
             presenter.handle_trace_option_group_changed
         )
 
@@ -166,20 +192,10 @@ class AliGnMainWindow(QMainWindow):
             presenter.handle_start_stop_batch_button_clicked
         )
         self.processing_frame_ui.dsb_cut_area_start.valueChanged.connect(
-            lambda: self.peak_linear_region_item.setRegion(
-                [
-                    self.processing_frame_ui.dsb_cut_area_start.value(),
-                    self.processing_frame_ui.dsb_cut_area_end.value(),
-                ]
-            )
+            self._set_peak_region_from_cut_area
         )
         self.processing_frame_ui.dsb_cut_area_end.valueChanged.connect(
-            lambda: self.peak_linear_region_item.setRegion(
-                [
-                    self.processing_frame_ui.dsb_cut_area_start.value(),
-                    self.processing_frame_ui.dsb_cut_area_end.value(),
-                ]
-            )
+            self._set_peak_region_from_cut_area
         )
 
         # Create Splitter
@@ -215,11 +231,17 @@ class AliGnMainWindow(QMainWindow):
         self.em_traces_plot_item.getAxis("right").linkToView(self.power_traces_view_box)
         self.em_traces_plot_item.getAxis("right").setLabel("Power")
 
-        self.em_traces_plot_item.sigRangeChanged.connect(
-            presenter.handle_em_traces_plotitem_range_changed
+        # the proxies collect the signals and call the handlers with the arguments of
+        # the latest one, they have to be kept to stay connected
+        self._range_changed_proxy = pg.SignalProxy(
+            self.em_traces_plot_item.sigRangeChanged,
+            rateLimit=RANGE_CHANGED_RATE_LIMIT,
+            slot=lambda args: presenter.handle_em_traces_plotitem_range_changed(*args),
         )
-        self.em_traces_plot_item.scene().sigMouseMoved.connect(
-            presenter.handle_em_traces_plotitem_mouse_moved
+        self._mouse_moved_proxy = pg.SignalProxy(
+            self.em_traces_plot_item.scene().sigMouseMoved,
+            rateLimit=MOUSE_MOVED_RATE_LIMIT,
+            slot=lambda args: presenter.handle_em_traces_plotitem_mouse_moved(*args),
         )
 
         # create lower Plot
@@ -249,16 +271,40 @@ class AliGnMainWindow(QMainWindow):
         )
 
         # cross hair
-        self.vertical_line = pg.InfiniteLine(angle=90, movable=False)
-        self.horizontal_line = pg.InfiniteLine(angle=0, movable=False)
+        self.vertical_line = pg.InfiniteLine(
+            angle=90, movable=False, pen=self.crosshair_pen
+        )
+        self.horizontal_line = pg.InfiniteLine(
+            angle=0, movable=False, pen=self.crosshair_pen
+        )
         self.vertical_line.setZValue(30)
         self.horizontal_line.setZValue(30)
         self.em_traces_plot_item.addItem(self.vertical_line, ignoreBounds=True)
         self.em_traces_plot_item.addItem(self.horizontal_line, ignoreBounds=True)
 
+        # the overlays only change with their position/region, so Qt blits a cached
+        # pixmap instead of repainting them for every mouse move
+        for item in (
+            self.vertical_line,
+            self.horizontal_line,
+            self.overview_linear_region_item,
+            self.peak_linear_region_item,
+        ):
+            item.setCacheMode(QGraphicsItem.CacheMode.DeviceCoordinateCache)
+
         self._createMenuBar(presenter)
         self._createStatusBar()
 
+    def _set_peak_region_from_cut_area(self) -> None:
+        # shared by both cut area spin boxes, the region signals stay connected
+        # because the presenter updates the model from them
+        region = [
+            self.processing_frame_ui.dsb_cut_area_start.value(),
+            self.processing_frame_ui.dsb_cut_area_end.value(),
+        ]
+        if list(self.peak_linear_region_item.getRegion()) != region:
+            self.peak_linear_region_item.setRegion(region)
+
     def _createMenuBar(self, presenter: Presenter) -> None:
         # get the menubar
         menubar = self.menuBar()
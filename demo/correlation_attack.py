@@ -1,28 +1,84 @@
+import mmap
 import sys
 
 import numpy as np
 import matplotlib.pyplot as plt
-from tqdm import tqdm
+
+try:
+    # run the matrix product on the GPU if CuPy is installed
+    import cupy as xp
+    HAS_CUPY = True
+except ImportError:
+    xp = np
+    HAS_CUPY = False
+
+
+# memory maps a npy file through an own mapping, so the access can be advised
+def load_advised(file_name, advice):
+    header = np.load(file_name, mmap_mode="r")
+    with open(file_name, "rb") as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    mapping.madvise(advice)
+    data = np.frombuffer(mapping, header.dtype, header.size, header.offset)
+    return data.reshape(header.shape)
+
 
 path = sys.argv[1]
 
 key = np.load("key.npy")
-traces = np.load(path + "/em_aligned.npy")
-plains = np.load(path + "/plain_aligned.npy")
+# the traces and plaintexts are read block-wise from the memory mapped files
+plains = np.load(path + "/plain_aligned.npy", mmap_mode="r")
+# the blocks are read in order, let the OS read ahead
+if hasattr(mmap, "MADV_SEQUENTIAL"):
+    traces = load_advised(path + "/em_aligned.npy", mmap.MADV_SEQUENTIAL)
+else:
+    traces = np.load(path + "/em_aligned.npy", mmap_mode="r")
 
 nr_traces = traces.shape[0]
 nr_points = traces.shape[1]
 
-corrs = np.zeros((256,nr_points))
+# number of traces per block, only the sums over all traces are kept
+BLOCK_SIZE = 4096
+
+# compute correlation for 0-th key byte for all possible
+# 256 byte values, an attacker would chose the one with
+# the highest correlation
+guesses = np.arange(256, dtype=np.uint8)
+# the hypothesis only depends on the plaintext byte, so the mean and the norm
+# of the centered hypotheses of each guess follow from its histogram
+values = np.bitwise_xor(guesses[:, None], guesses).astype(np.float64)
+counts = np.bincount(plains[:, 0], minlength=256)
+H_mean = counts @ values / nr_traces
+H_norm = np.sqrt(counts @ (values - H_mean) ** 2)
+
+# stream the traces: the covariances of the centered hypotheses with the
+# traces and the sums of the traces are accumulated block by block
+sum_HT = xp.zeros((256, nr_points))
+sum_T = xp.zeros(nr_points)
+sum_T2 = xp.zeros(nr_points)
+H_mean_block = xp.asarray(H_mean, dtype=xp.float32)
+for start in range(0, nr_traces, BLOCK_SIZE):
+    # hypotheses of all key guesses, shape (block, 256), built as uint8
+    # and cast once to float32 for the matrix product
+    H = xp.bitwise_xor(
+        xp.asarray(plains[start : start + BLOCK_SIZE, 0:1], dtype=xp.uint8),
+        xp.asarray(guesses),
+    ).astype(xp.float32)
+    H -= H_mean_block
+    T = xp.asarray(traces[start : start + BLOCK_SIZE], dtype=xp.float32)
+    sum_HT += H.T @ T
+    sum_T += T.sum(0, dtype=xp.float64)
+    sum_T2 += (T * T).sum(0, dtype=xp.float64)
+
+# the centered hypotheses sum up to 0, so sum_HT already is the covariance
+# (times nr_traces) with the centered traces
+T_norm = xp.sqrt(sum_T2 - sum_T * sum_T / nr_traces)
+corrs = sum_HT / (xp.asarray(H_norm)[:, None] * T_norm[None, :])
+if HAS_CUPY:
+    corrs = corrs.get()
 
-for j in tqdm(range(0, nr_points)):
-    # compute correlation for 0-th key byte
-    # an attacker would have to try out all possible
-    # 256 byte values and chose the one with the highest
-    # correlation
-    xors = np.array([ plains[k, 0]^key[0] for k in range(0, nr_traces) ])
-    c = np.corrcoef(traces[:, j], xors)[0][1]
-    corrs[key[0],j] = c
+guess = np.abs(corrs).max(1).argmax()
+print("best key guess: %d, key: %d" % (guess, key[0]))
 
 plt.figure()
 plt.plot(corrs[key[0], :])
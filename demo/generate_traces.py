@@ -1,5 +1,5 @@
-import random
 import numpy as np
+from numba import njit, prange
 
 from align.tracelib.traces import TraceData
 
@@ -39,25 +39,33 @@ traces = (traces * 10).astype(np.int8)
 # at a random offset (simulating jitter)
 # we have some signal with higher variance,
 # where we hide the leakage signal
-for i in range(0, 10000):
-    if i == 0:
-        offset = 100
-    else:
-        offset = np.random.randint(1, 39) * 100
-    high_var_noise = np.random.normal(scale=2.0, size=100)
-    for j in range(0, 16):
-        leakage_val = ((key[j] ^ plains[i, j]) / 256.0) - 0.5
-        high_var_noise[50 + j] = 0.5 * high_var_noise[50 + j] + 0.5 * leakage_val
-    high_var_noise = (high_var_noise * 10).astype(np.int8)
-    # artificial clock
-    high = random.randint(99, 127)
-    low = random.randint(-127, -99)
-    mid = random.randint(-10, 10)
-    traces[i, offset : offset + 3] = high
-    traces[i, offset + 3 : offset + 6] = mid
-    traces[i, offset + 6 : offset + 9] = low
-    # leakage
-    traces[i, offset + 10 : offset + 110] = high_var_noise
+offsets = np.random.randint(1, 39, size=10000) * 100
+offsets[0] = 100
+high_var_noise = np.random.normal(scale=2.0, size=(10000, 100))
+# artificial clock
+high = np.random.randint(99, 128, size=10000)
+low = np.random.randint(-127, -98, size=10000)
+mid = np.random.randint(-10, 11, size=10000)
+
+
+# writes the clock and the noise with the hidden leakage into each trace
+@njit(parallel=True, cache=True)
+def _inject(traces, plains, key, offsets, high, mid, low, noise):
+    for i in prange(traces.shape[0]):
+        offset = offsets[i]
+        traces[i, offset : offset + 3] = high[i]
+        traces[i, offset + 3 : offset + 6] = mid[i]
+        traces[i, offset + 6 : offset + 9] = low[i]
+        for j in range(noise.shape[1]):
+            value = noise[i, j]
+            if 50 <= j < 50 + key.shape[0]:
+                leakage_val = ((key[j - 50] ^ plains[i, j - 50]) / 256.0) - 0.5
+                value = 0.5 * value + 0.5 * leakage_val
+            # leakage
+            traces[i, offset + 10 + j] = np.int8(value * 10)
+
+
+_inject(traces, plains, key, offsets, high, mid, low, high_var_noise)
 
 # save these data as numpy data files
 # np.save("traces.npy", traces)
@@ -79,8 +87,7 @@ datafile.startRecord(
 datafile.registerEMFile("demo_em.dat", length=4000, dtype=np.int8)
 datafile.registerPlainFile("demo_plain.dat", length=16, dtype=np.uint8)
 
-for i in range(0, 10000):
-    datafile.em.addTrace(traces[i, :])
-    datafile.plain.addTrace(plains[i, :])
+datafile.em.addTracesBatch(traces)
+datafile.plain.addTracesBatch(plains)
 
 datafile.finishRecord()
@@ -0,0 +1,9 @@
+from pathlib import Path
+import numpy as np
+
+
+def files_equal(file_a: Path, file_b: Path) -> bool:
+    """Compares the contents of two files as memory mapped byte arrays"""
+    data_a = np.memmap(file_a, dtype=np.uint8, mode="r")
+    data_b = np.memmap(file_b, dtype=np.uint8, mode="r")
+    return data_a.shape == data_b.shape and np.array_equal(data_a, data_b)
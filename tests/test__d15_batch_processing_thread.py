@@ -1,4 +1,3 @@
-import filecmp
 import os
 from pathlib import Path
 import shutil
@@ -7,6 +6,7 @@ import pytest
 from collections import OrderedDict
 from align.align_trace_data import AlignTraceDataFactory
 from align.batch_processing import BatchProcessingThread
+from tests.helpers import files_equal
 
 TEST_PATH = Path("tests/resources/testdata/d15/")
 COMPARSION_PATH = TEST_PATH / "processed_for_comparsion"
@@ -82,13 +82,11 @@ def test_thread_finished_within_5000ms_and_files_matches(
 
     assert os.path.exists(batch_processing_thread.new_filepath)
 
-    _, mismatch, errors = filecmp.cmpfiles(
-        COMPARSION_PATH,
-        batch_processing_thread.new_filepath,
-        ["em_aligned.dat", "plain_aligned.dat"],
-    )
-    assert len(mismatch) == 0
-    assert len(errors) == 0
+    for filename in ["em_aligned.dat", "plain_aligned.dat"]:
+        assert files_equal(
+            COMPARSION_PATH / filename,
+            Path(batch_processing_thread.new_filepath) / filename,
+        )
 
     # remove temporary folder which was created while running test case
     if os.path.exists(batch_processing_thread.new_filepath):
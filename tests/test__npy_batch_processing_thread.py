@@ -1,4 +1,3 @@
-import filecmp
 import os
 from pathlib import Path
 import shutil
@@ -7,6 +6,7 @@ import pytest
 from collections import OrderedDict
 from align.align_trace_data import AlignTraceDataFactory
 from align.batch_processing import BatchProcessingThread
+from tests.helpers import files_equal
 
 ## Settings for the following tests
 TEST_PATH = Path("tests/resources/testdata/npy/")
@@ -86,15 +86,45 @@ def test_thread_finished_within_5000ms_and_files_matches(
 
     assert os.path.exists(batch_processing_thread.new_filepath)
 
-    match, mismatch, errors = filecmp.cmpfiles(
-        COMPARSION_PATH,
-        batch_processing_thread.new_filepath,
-        ["em_aligned.npy", "plain_aligned.npy"],
-    )
-
-    assert len(mismatch) == 0
-    assert len(errors) == 0
+    for filename in ["em_aligned.npy", "plain_aligned.npy"]:
+        assert files_equal(
+            COMPARSION_PATH / filename,
+            Path(batch_processing_thread.new_filepath) / filename,
+        )
 
     # remove temporary folder which was created while running test case
     if os.path.exists(batch_processing_thread.new_filepath):
         shutil.rmtree(batch_processing_thread.new_filepath)
+
+
+def test_workers_find_the_same_peaks():
+    """Test that the filters and triggers find the same peaks in worker processes
+    as in the BatchProcessingThread itself"""
+    filter_dict = OrderedDict(
+        [("abs_filter", (None, OrderedDict([("enabled", (True, OrderedDict()))])))]
+    )
+    results = []
+    for workers in (1, 2):
+        align_trace_data = AlignTraceDataFactory.open_trace_data(
+            {"em": EM_FILE, "plain": PLAIN_FILE}
+        )
+        bp_thread = BatchProcessingThread(
+            None,
+            align_trace_data,
+            filter_dict,
+            TRIGGER_DICT,
+            [-165, 191],
+            "em",
+            NUMBER_OF_TRACES,
+            workers,
+        )
+        bp_thread.run()
+        results.append((bp_thread.valid_traces_array, bp_thread.peak_array))
+
+        # remove temporary folder which was created while running test case
+        if os.path.exists(bp_thread.new_filepath):
+            shutil.rmtree(bp_thread.new_filepath)
+
+    assert results[0][0].any()
+    assert (results[0][0] == results[1][0]).all()
+    assert (results[0][1] == results[1][1]).all()
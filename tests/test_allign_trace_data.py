@@ -48,6 +48,42 @@ def test_add_trace():
         shutil.rmtree(tmp_path)
 
 
+## Test add_traces method, which adds the rows of an array like add_trace
+#  and ignores the rows exceeding the predefined number of traces
+def test_add_traces():
+    MAX_NUMBER_OF_TRACES = 3
+    tmp_path = test_data_path / "tmp"
+    npy_files = dict()
+    npy_files["em"] = test_data_path / "traces.npy"
+    trace_data = AlignTraceDataFactory.open_trace_data(npy_files)
+
+    new_trace_data = trace_data.prepare_new_tracedata(tmp_path)
+    new_trace_data.set_number_of_traces(MAX_NUMBER_OF_TRACES)
+    new_trace_data.register_data_file(
+        "em",
+        (tmp_path / "em.npy"),
+        length=5,
+        dtype=np.int16,
+    )
+    new_trace_data.add_trace("em", np.array([1, 2, 3, 4, 5], dtype=np.int16))
+    new_trace_data.add_traces(
+        "em",
+        np.vstack(
+            [
+                np.array([2, 3, 3, 4, 5], dtype=np.int16),
+                np.array([3, 2, 3, 4, 5], dtype=np.int16),
+                np.array([4, 2, 3, 4, 5], dtype=np.int16),
+            ]
+        ),
+    )
+    assert new_trace_data.get_number_of_traces() == MAX_NUMBER_OF_TRACES
+    assert new_trace_data.get_traces("em")[:, 0].tolist() == [1, 2, 3]
+
+    # remove temporary folder which was created while running test case
+    if os.path.exists(tmp_path):
+        shutil.rmtree(tmp_path)
+
+
 ## Ensure that a new TraceData object returns correct value (False) for has_power method
 def test_has_power_from_new_tracedata():
     tmp_path = test_data_path / "tmp"
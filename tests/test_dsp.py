@@ -0,0 +1,157 @@
+import numpy as np
+from align.tracelib.dsp import (
+    detectPeaks,
+    findGaps,
+    findLargestGap,
+    matchByCorrelation,
+    matchBySosd,
+    matchFallingEdge,
+    matchAboveRange,
+    matchBelowRange,
+    matchLowerWidth,
+    matchRangeU8,
+    matchRisingEdge,
+    matchUpperWidth,
+    nanMinMax,
+    shiftTrace,
+    shiftTraceInto,
+)
+
+
+def _random_trace(length: int = 5000) -> np.ndarray:
+    rng = np.random.default_rng(42)
+    return rng.normal(size=length)
+
+
+## Test that matchByCorrelation finds a pattern taken from the trace itself,
+#  also with a step size > 1 and (ignored) zero regions in the trace
+def test_matchByCorrelation_finds_pattern():
+    trace = _random_trace()
+    pattern = trace[1234 : 1234 + 200].copy()
+    trace[3000:3400] = 0
+    for step_size in (1, 2, 3):
+        offset, corr_value = matchByCorrelation(trace, pattern, 100, 4000, step_size)
+        assert offset == 1234
+        assert np.isclose(corr_value, 1.0)
+
+
+## Test that the FFT based and the jit compiled (short pattern) path
+#  return the same correlation values
+def test_matchByCorrelation_short_and_long_pattern_match():
+    trace = _random_trace()
+    for pattern_length in (32, 128):
+        pattern = trace[2000 : 2000 + pattern_length] + 0.5
+        offset, corr_value = matchByCorrelation(trace, pattern, 0, len(trace))
+        assert offset == 2000
+        assert np.isclose(corr_value, 1.0)
+
+
+## Test that matchBySosd finds a pattern taken from the trace itself
+#  and returns the same result for the FFT based and the jit compiled path
+def test_matchBySosd_finds_pattern():
+    trace = _random_trace()
+    for pattern_length in (32, 128):
+        pattern = trace[1234 : 1234 + pattern_length].copy()
+        for step_size in (1, 2):
+            offset, diff_value = matchBySosd(trace, pattern, 100, 4000, step_size)
+            assert offset == 1234
+            assert np.isclose(diff_value, 0.0)
+
+
+## Test that matchUpperWidth/matchLowerWidth find the first window of the given width
+#  which keeps above/below the threshold and return 0 if there is none
+def test_matchUpperWidth_and_matchLowerWidth():
+    trace = np.zeros(100)
+    trace[20:25] = 5
+    trace[40:60] = 5
+    assert matchUpperWidth(trace, 0, 10, 1.0) == 40
+    assert matchUpperWidth(trace, 0, 30, 1.0) == 0
+    assert matchLowerWidth(-trace, 0, 10, -1.0) == 40
+    assert matchLowerWidth(-trace, 0, 30, -1.0) == 0
+
+
+## Test that nanMinMax ignores NaN values and returns the same as nanmin/nanmax
+def test_nanMinMax():
+    trace = _random_trace()
+    trace[100:200] = np.nan
+    assert nanMinMax(trace) == (np.nanmin(trace), np.nanmax(trace))
+    assert nanMinMax(np.arange(-5, 9, dtype=np.int16)) == (-5, 8)
+
+
+## Test that findGaps returns the first and last index of every run below/above
+#  the threshold, including runs at the trace borders
+def test_findGaps_and_findLargestGap():
+    trace = np.array([0, 0, 5, 5, 0, 5, 0, 0, 0, 5, 0])
+    assert findGaps(trace, 1).tolist() == [[0, 1], [4, 4], [6, 8], [10, 10]]
+    assert findGaps(trace, 1, positive=False).tolist() == [[2, 3], [5, 5], [9, 9]]
+    assert findLargestGap(trace, 1).tolist() == [6, 8]
+    assert findGaps(trace, -1) is None
+    assert findLargestGap(trace, -1) is None
+
+
+## Test that detectPeaks only keeps the highest peak within the minimum peak distance
+#  and all equally high peaks if kpsh is set
+def test_detectPeaks_minimum_peak_distance():
+    trace = np.zeros(40)
+    trace[[5, 8, 20, 23, 35]] = [2, 3, 4, 4, 1]
+    assert detectPeaks(trace).tolist() == [5, 8, 20, 23, 35]
+    assert detectPeaks(trace, mpd=5).tolist() == [8, 23, 35]
+    assert detectPeaks(trace, mpd=5, kpsh=True).tolist() == [8, 20, 23, 35]
+
+
+## Test that shiftTrace/shiftTraceInto shift in both directions and fill the missing values
+def test_shiftTrace():
+    trace = np.arange(1, 6)
+    assert shiftTrace(trace, 2).tolist() == [0, 0, 1, 2, 3]
+    assert shiftTrace(trace, -2, fill_value=9).tolist() == [3, 4, 5, 9, 9]
+    assert shiftTrace(trace, 0) is trace
+    out = np.empty_like(trace)
+    assert shiftTraceInto(out, trace, 0) is out
+    assert out.tolist() == trace.tolist()
+    assert shiftTraceInto(out, trace, -7).tolist() == [0, 0, 0, 0, 0]
+
+
+## Test that matchRisingEdge/matchFallingEdge return the first sample from offset on
+#  over/under the threshold and -1 if there is none
+def test_matchRisingEdge_and_matchFallingEdge():
+    trace = np.array([0, 1, 5, 6, 1, 0, 5], dtype=np.int8)
+    assert matchRisingEdge(trace, 0, 2.5) == 2
+    assert matchRisingEdge(trace, 4, 2.5) == 6
+    assert matchRisingEdge(trace, 0, 10) == -1
+    assert matchRisingEdge(trace, 2, 2.5) == 2
+    assert matchFallingEdge(trace, 0, 2.5) == 0
+    assert matchFallingEdge(trace, 2, 2.5) == 4
+    assert matchFallingEdge(trace.astype(np.float32), 6, 2.5) == -1
+
+
+## Test that matchRisingEdge/matchFallingEdge return the same index as the first
+#  True of the comparison mask behind the offset
+def test_matchRisingEdge_and_matchFallingEdge_match_argmax():
+    trace = _random_trace(2000).astype(np.float32)
+    for offset in (0, 1, 500, 1999):
+        for threshold in (-3.0, 0.0, 2.5, 10.0):
+            rising = trace[offset:] > threshold
+            falling = trace[offset:] < threshold
+            for match, mask in ((matchRisingEdge, rising), (matchFallingEdge, falling)):
+                index = mask.argmax()
+                expected = index + offset if mask[index] else -1
+                assert match(trace, offset, threshold) == expected
+
+
+## Test that matchRangeU8 returns the same ranges as matchAboveRange/matchBelowRange
+#  for unaligned uint8 traces and thresholds at and beyond the uint8 limits
+def test_matchRangeU8_matches_sample_wise_scan():
+    rng = np.random.default_rng(3)
+    buffer = np.zeros(1010, dtype=np.uint8)
+    for shift in range(8):
+        trace = buffer[shift : shift + 1000]
+        trace[:] = np.repeat(rng.integers(0, 256, 100), 10)
+        for threshold in (-1.0, 0.0, 100.5, 128.0, 200.0, 255.0, 300.0):
+            for hysteresis, min_range in ((0.0, 1), (2.5, 15)):
+                upper = threshold + hysteresis
+                lower = threshold - hysteresis
+                for inverse in (False, True):
+                    match = matchBelowRange if inverse else matchAboveRange
+                    assert matchRangeU8(
+                        trace, shift, upper, lower, min_range, inverse
+                    ) == match(trace, shift, upper, lower, min_range)
@@ -0,0 +1,211 @@
+import hashlib
+import shutil
+from pathlib import Path
+import numpy as np
+import pytest
+import align.tracelib.helperFunctions as helper
+from align.tracelib.traces import TraceData
+
+
+D15_PATH = Path("tests/resources/testdata/d15/")
+NR_TRACES = 600
+TRACE_LENGTH = 5000
+
+
+def _random_traces() -> np.ndarray:
+    rng = np.random.default_rng(42)
+    return rng.integers(-1000, 1000, (NR_TRACES, TRACE_LENGTH), dtype=np.int16)
+
+
+def _start_record(meta_file, save_method):
+    trace_data = TraceData()
+    trace_data.startRecord(
+        str(meta_file),
+        traceCount=NR_TRACES,
+        algorithm="Unknown",
+        needPlain=False,
+        needCipher=False,
+        needKey=False,
+    )
+    trace_data.registerEMFile(
+        "em.dat", length=TRACE_LENGTH, dtype=np.int16, saveMethod=save_method
+    )
+    return trace_data
+
+
+def _record(meta_file, save_method, traces):
+    trace_data = _start_record(meta_file, save_method)
+    # single traces and a batch larger than the write buffer
+    for trace in traces[:100]:
+        trace_data.em.addTrace(trace)
+    trace_data.em.addTracesBatch(traces[100:])
+    trace_data.finishRecord()
+    return TraceData(str(meta_file))
+
+
+## Test that ASYNCWRITE writes the same file and sha256 as DIRECTWRITE
+def test_asyncwrite_matches_directwrite(tmp_path):
+    traces = _random_traces()
+    direct = _record(tmp_path / "direct" / "traces.meta", "DIRECTWRITE", traces)
+    threaded = _record(tmp_path / "async" / "traces.meta", "ASYNCWRITE", traces)
+
+    direct_bytes = (tmp_path / "direct" / "em.dat").read_bytes()
+    assert (tmp_path / "async" / "em.dat").read_bytes() == direct_bytes
+    assert np.array_equal(threaded.em.data, traces)
+    sha256 = hashlib.sha256(direct_bytes).hexdigest()
+    assert direct.config.get("EM", "sha256") == sha256
+    assert threaded.config.get("EM", "sha256") == sha256
+
+
+class _FailingFile:
+    def __init__(self, file):
+        self._file = file
+
+    def write(self, data):
+        raise ValueError("write failed")
+
+    def close(self):
+        self._file.close()
+
+
+## Test that an exception of the ASYNCWRITE writer thread is raised
+#  in the recording thread instead of blocking it
+def test_asyncwrite_raises_write_error(tmp_path):
+    traces = _random_traces()
+    trace_data = _start_record(tmp_path / "traces.meta", "ASYNCWRITE")
+    trace_data.em.data = _FailingFile(trace_data.em.data)
+    with pytest.raises(ValueError, match="write failed"):
+        for trace in traces:
+            trace_data.em.addTrace(trace)
+        trace_data.em.finishRecord()
+
+
+## Test that traces written out of order with addTraceAt (MEMMAP) end up in their
+#  rows and the sha256 in the meta file is the one of the complete file
+def test_addTraceAt_out_of_order(tmp_path):
+    traces = _random_traces()
+    trace_data = _start_record(tmp_path / "traces.meta", "MEMMAP")
+    order = np.random.default_rng(1).permutation(NR_TRACES)
+    for index in order:
+        trace_data.em.addTraceAt(int(index), traces[index])
+    trace_data.finishRecord()
+
+    data_bytes = (tmp_path / "em.dat").read_bytes()
+    assert data_bytes == traces.tobytes()
+    opened = TraceData(str(tmp_path / "traces.meta"))
+    assert np.array_equal(opened.em.data, traces)
+    assert opened.config.get("EM", "sha256") == hashlib.sha256(data_bytes).hexdigest()
+
+
+## Test that iterTraces yields the traces of the given range, independent of the
+#  number of traces read ahead
+@pytest.mark.parametrize("start, stop", [(0, None), (7, 300), (599, 600), (5, 5)])
+@pytest.mark.parametrize("read_ahead", [0, 1, 4, 1000])
+def test_iterTraces(tmp_path, start, stop, read_ahead):
+    traces = _random_traces()
+    trace_data = _record(tmp_path / "traces.meta", "DIRECTWRITE", traces)
+    iterated = list(trace_data.em.iterTraces(start, stop, readAhead=read_ahead))
+    expected = traces[start:stop]
+    assert len(iterated) == len(expected)
+    for trace, expected_trace in zip(iterated, expected):
+        assert np.array_equal(trace, expected_trace)
+
+
+## Test that fastHash only reads and writes the hash cache next to the data file
+#  if it is asked to (useCache=True)
+def test_fastHash_cache_is_opt_in(tmp_path):
+    data_file = tmp_path / "demo_em.dat"
+    shutil.copy(D15_PATH / "demo_em.dat", data_file)
+    cache_file = tmp_path / ("demo_em.dat" + helper.HASHCACHE_SUFFIX)
+
+    digest = helper.fastHash(str(data_file))
+    assert helper.fastHashMany([str(data_file)]) == {str(data_file): digest}
+    assert helper.checkFastHash(str(data_file), digest)
+    assert not cache_file.exists()
+
+    assert helper.fastHash(str(data_file), useCache=True) == digest
+    assert cache_file.exists()
+    assert helper.fastHash(str(data_file), useCache=True) == digest
+
+
+## Test that opening a trace set (and loading and checking its data files)
+#  leaves the directory of the trace set unchanged
+def test_open_does_not_write_into_trace_set(tmp_path):
+    shutil.copytree(D15_PATH, tmp_path, dirs_exist_ok=True)
+
+    def snapshot():
+        return {
+            path: (path.stat().st_size, path.stat().st_mtime_ns)
+            for path in tmp_path.rglob("*")
+        }
+
+    before = snapshot()
+    trace_data = TraceData(str(tmp_path / "traces.meta"))
+    assert trace_data.em.data.shape[0] == trace_data.getNrTraces()
+    assert trace_data.plain.data.shape[0] == trace_data.getNrTraces()
+    assert snapshot() == before
+
+
+## Test that the fast hash in the meta file is the sha256 fingerprint,
+#  independent of an installed blake3
+def test_meta_fasthash_is_sha256(tmp_path):
+    trace_data = _record(tmp_path / "traces.meta", "DIRECTWRITE", _random_traces())
+    fast_hash = trace_data.config.get("EM", "fasthash")
+    assert not fast_hash.startswith(helper.BLAKE3_PREFIX)
+    assert len(fast_hash) == 64
+    assert fast_hash == helper.fastHash(str(tmp_path / "em.dat"))
+
+
+## Test that addTraceAt can't be mixed with addTrace in one MEMMAP record and
+#  that rows written again are counted once
+def test_addTraceAt_not_mixed_with_addTrace(tmp_path):
+    traces = _random_traces()
+    trace_data = _start_record(tmp_path / "indexed" / "traces.meta", "MEMMAP")
+    trace_data.em.addTraceAt(1, traces[1])
+    trace_data.em.addTraceAt(1, traces[1])
+    trace_data.em.addTrace(traces[0])
+    trace_data.em.addTracesBatch(traces[:2])
+    assert trace_data.em._recordsWritten == 1
+    trace_data.finishRecord()
+    data = np.fromfile(tmp_path / "indexed" / "em.dat", dtype=np.int16)
+    assert not data.reshape(NR_TRACES, TRACE_LENGTH)[0].any()
+
+    trace_data = _start_record(tmp_path / "sequential" / "traces.meta", "MEMMAP")
+    trace_data.em.addTrace(traces[0])
+    trace_data.em.addTraceAt(5, traces[5])
+    assert trace_data.em._recordsWritten == 1
+    trace_data.finishRecord()
+    data = np.fromfile(tmp_path / "sequential" / "em.dat", dtype=np.int16)
+    assert not data.reshape(NR_TRACES, TRACE_LENGTH)[5].any()
+
+
+## Test that hasEM, hasPlain, ... follow the registered files and can be assigned
+def test_has_attributes(tmp_path):
+    trace_data = _start_record(tmp_path / "traces.meta", "DIRECTWRITE")
+    assert trace_data.hasEM
+    assert not trace_data.hasPlain
+    assert not trace_data.hasAux
+
+    trace_data.hasPlain = True
+    trace_data.hasEM = False
+    assert trace_data.hasPlain
+    assert not trace_data.hasEM
+
+    trace_data.unregisterEMFile()
+    trace_data.registerEMFile("em.dat", length=TRACE_LENGTH, dtype=np.int16)
+    assert trace_data.hasEM
+
+
+## Test that opening a trace set reports missing and truncated data files
+def test_open_checks_data_files(tmp_path):
+    shutil.copytree(D15_PATH, tmp_path, dirs_exist_ok=True)
+    meta_file = str(tmp_path / "traces.meta")
+    data_file = tmp_path / "demo_em.dat"
+
+    data_file.write_bytes(data_file.read_bytes()[:-1])
+    with pytest.raises(ValueError, match="truncated"):
+        TraceData(meta_file)
+
+    data_file.unlink()
+    with pytest.raises(FileNotFoundError):
+        TraceData(meta_file)
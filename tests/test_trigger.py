@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+from align.trigger.edge_trigger import FallingEdgeTrigger, RisingEdgeTrigger
+from align.trigger.find_peaks_trigger import (
+    FirstPeakFilter,
+    LastPeakFilter,
+    ThresholdTrigger,
+)
+from align.trigger.holdoff import HoldoffTrigger
+from align.trigger.trigger import TriggerLoader
+
+
+def _threshold_parameter(threshold, hysteresis, min_range, inverse=False):
+    return dict(
+        threshold=[threshold],
+        hysteresis=[hysteresis],
+        min_range=[min_range],
+        inverse=[inverse],
+    )
+
+
+## Test that ThresholdTrigger skips ranges shorter than min_range
+#  and returns the start and end of the first range long enough
+def test_ThresholdTrigger_min_range():
+    trace = np.zeros(100)
+    trace[10:15] = 5
+    trace[30:60] = 5
+    trigger = ThresholdTrigger()
+    xmarks = trigger.process_data(trace, 0, _threshold_parameter(1.0, 0.5, 10))
+    assert xmarks["xmarks"] == [30, 60]
+    xmarks = trigger.process_data(trace, 0, _threshold_parameter(1.0, 0.5, 3))
+    assert xmarks["xmarks"] == [10, 15]
+    xmarks = trigger.process_data(trace, 20, _threshold_parameter(1.0, 0.5, 3))
+    assert xmarks["xmarks"] == [30, 60]
+
+
+## Test that ThresholdTrigger searches ranges below the threshold if inversed
+#  and returns [None, None] if a range does not end within the trace
+def test_ThresholdTrigger_inverse_and_not_found():
+    trace = np.full(100, 5.0)
+    trace[40:50] = 0
+    trigger = ThresholdTrigger()
+    xmarks = trigger.process_data(trace, 0, _threshold_parameter(1.0, 0.5, 5, True))
+    assert xmarks["xmarks"] == [40, 50]
+    xmarks = trigger.process_data(trace, 0, _threshold_parameter(1.0, 0.5, 50))
+    assert xmarks["xmarks"] == [None, None]
+    trace[90:] = 0
+    xmarks = trigger.process_data(trace, 60, _threshold_parameter(1.0, 0.5, 5, True))
+    assert xmarks["xmarks"] == [None, None]
+
+
+## Test that TriggerLoader finds the triggers by name and returns None for unknown names
+def test_TriggerLoader_get_trigger_by_name():
+    loader = TriggerLoader()
+    assert "threshold_trigger" in loader.get_trigger_names()
+    assert isinstance(loader.get_trigger_by_name("threshold_trigger"), ThresholdTrigger)
+    assert loader.get_trigger_by_name("unknown_trigger") is None
+    assert TriggerLoader().get_trigger_names() == loader.get_trigger_names()
+
+
+## Test that FirstPeakFilter/LastPeakFilter return the index of the peak in the trace
+#  and only search behind the offset
+def test_FirstPeakFilter_and_LastPeakFilter_offset():
+    trace = np.zeros(200)
+    trace[[20, 100, 150]] = [3, 4, 2]
+    parameter = dict(threshold=[1.0])
+    assert FirstPeakFilter().process_data(trace, 0, parameter)["xmarks"] == [20]
+    assert FirstPeakFilter().process_data(trace, 50, parameter)["xmarks"] == [100]
+    assert LastPeakFilter().process_data(trace, 0, parameter)["xmarks"] == [150]
+    assert LastPeakFilter().process_data(trace, 160, parameter)["xmarks"] == []
+    # the index is an int (not the float of the peak list), it is the next offset
+    assert type(LastPeakFilter().process_data(trace, 0, parameter)["xmarks"][0]) is int
+
+
+## Test that process_data returns the same result for the parameter dictionary
+#  and the parameters parsed once by parse_params
+def test_Trigger_parse_params():
+    trace = np.zeros(100)
+    trace[30:60] = 5
+    parameter = _threshold_parameter(1.0, 0.5, 10)
+    params = ThresholdTrigger.parse_params(parameter)
+    assert params.min_range == 10 and not params.inverse
+    assert ThresholdTrigger.parse_params(params) is params
+    trigger = ThresholdTrigger()
+    assert trigger.process_data(trace, 0, params) == trigger.process_data(
+        trace, 0, parameter
+    )
+    with pytest.raises(KeyError):
+        ThresholdTrigger.parse_params(dict(threshold=[1.0]))
+
+
+## Test that process_batch returns the same results as process_data for each row,
+#  for the vectorized edge triggers and the default implementation
+def test_Trigger_process_batch():
+    rng = np.random.default_rng(7)
+    traces = rng.normal(size=(20, 300))
+    offsets = rng.integers(0, 300, 20)
+    for trigger, parameter in (
+        (RisingEdgeTrigger(), dict(threshold=[2.0])),
+        (FallingEdgeTrigger(), dict(threshold=[-2.0])),
+        (FirstPeakFilter(), dict(threshold=[2.0])),
+        (HoldoffTrigger(), dict(holdoff=[100])),
+    ):
+        expected = [
+            trigger.process_data(trace, int(offset), parameter)
+            for trace, offset in zip(traces, offsets)
+        ]
+        assert trigger.process_batch(traces, offsets, parameter) == expected
+
+
+## Test that the edge triggers return an edge at index 0 and an empty list if there is none
+def test_edge_trigger_index_zero():
+    trace = np.array([5.0, 0.0, 0.0, 5.0])
+    parameter = dict(threshold=[2.5])
+    assert RisingEdgeTrigger().process_data(trace, 0, parameter)["xmarks"] == [0]
+    assert FallingEdgeTrigger().process_data(trace, 0, parameter)["xmarks"] == [1]
+    assert FallingEdgeTrigger().process_data(trace, 3, parameter)["xmarks"] == []